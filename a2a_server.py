@@ -1,24 +1,131 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager, AsyncExitStack
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import requests
+import httpx
 import os
+import uuid
+from utils.limiter import ConcurrencyLimiter, Saturated
+from utils.streaming import ReleasingStreamingResponse
 
 MCP_URL = os.getenv("MCP_URL", "http://localhost:8001/tools/plan_trip")
+MCP_STREAM_URL = os.getenv("MCP_STREAM_URL", MCP_URL.rstrip("/") + "/stream")
+MCP_TIMEOUT = float(os.getenv("MCP_TIMEOUT", "60"))
+# Retries of a timed-out or failed (5xx other than 503) plan; they reuse the
+# request ID, so MCP resumes the plan instead of starting it again
+A2A_RETRIES = int(os.getenv("A2A_RETRIES", "1"))
 
-app = FastAPI(title="A2A Server")
+limiter = ConcurrencyLimiter(
+    max_concurrency=int(os.getenv("A2A_MAX_CONCURRENCY", "64")),
+    max_waiting=int(os.getenv("A2A_MAX_WAITING", "64")),
+    queue_timeout=float(os.getenv("A2A_QUEUE_TIMEOUT", "5")),
+    retry_after=int(os.getenv("A2A_RETRY_AFTER", "2")),
+)
+
+# One pooled async client for the A2A -> MCP hop, shared by all requests
+_http: httpx.AsyncClient | None = None
+
+def _client() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=MCP_TIMEOUT,
+            limits=httpx.Limits(max_connections=limiter.max_concurrency, max_keepalive_connections=32),
+        )
+    return _http
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _http
+    _client()
+    yield
+    await _http.aclose()
+    _http = None
+
+app = FastAPI(title="A2A Server", lifespan=lifespan)
+
+@app.exception_handler(Saturated)
+async def saturated_handler(request: Request, exc: Saturated):
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error", "message": "A2A server is at capacity, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 class A2ARequest(BaseModel):
     action: str
     payload: dict
 
+def _request_id(request: Request) -> str:
+    return request.headers.get("x-request-id") or uuid.uuid4().hex
+
 @app.post("/a2a")
-def a2a(req: A2ARequest):
+async def a2a(req: A2ARequest, request: Request):
     if req.action != "plan_trip":
         return {"status": "error", "message": "Unknown action"}
-    r = requests.post(MCP_URL, json=req.payload, timeout=60)
+    headers = {"X-Request-ID": _request_id(request)}
+    async with limiter.slot():
+        for attempt in range(A2A_RETRIES + 1):
+            try:
+                r = await _client().post(MCP_URL, json=req.payload, headers=headers)
+            except httpx.TransportError:
+                if attempt == A2A_RETRIES:
+                    raise
+                continue
+            if r.status_code < 500 or r.status_code == 503:
+                break
+    _raise_for_backpressure(r)
     r.raise_for_status()
     return {"status": "ok", "data": r.json()}
 
+def _raise_for_backpressure(r: httpx.Response):
+    if r.status_code in (429, 503):
+        # Pass upstream back-pressure through instead of turning it into a 500
+        headers = {"Retry-After": r.headers["Retry-After"]} if "Retry-After" in r.headers else None
+        raise HTTPException(status_code=r.status_code, detail="MCP server is at capacity", headers=headers)
+
+@app.post("/a2a/stream")
+async def a2a_stream(req: A2ARequest, request: Request):
+    """Relay the MCP planner stream (NDJSON or SSE) chunk by chunk."""
+    if req.action != "plan_trip":
+        return {"status": "error", "message": "Unknown action"}
+    stack = AsyncExitStack()
+    await stack.enter_async_context(limiter.slot())
+    try:
+        upstream = await _client().send(
+            _client().build_request(
+                "POST", MCP_STREAM_URL, json=req.payload,
+                headers={
+                    "Accept": request.headers.get("accept", "application/x-ndjson"),
+                    "X-Request-ID": _request_id(request),
+                },
+                params=request.query_params,
+            ),
+            stream=True,
+        )
+        stack.push_async_callback(upstream.aclose)
+        if upstream.status_code >= 400:
+            await upstream.aread()
+            _raise_for_backpressure(upstream)
+            upstream.raise_for_status()
+    except BaseException:
+        await stack.aclose()
+        raise
+
+    async def body():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await stack.aclose()
+
+    return ReleasingStreamingResponse(
+        body(),
+        stack.aclose,
+        media_type=upstream.headers.get("content-type", "application/x-ndjson"),
+        headers={"Cache-Control": "no-cache"},
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=9000)
@@ -1,6 +1,5 @@
 import streamlit as st
-import json
-from app_core import get_planner
+from app_core import stream_plan
 
 st.set_page_config(page_title="AI Travel Planner", page_icon="✈️", layout="wide")
 
@@ -18,136 +17,158 @@ with col2:
 run_live = st.checkbox("Use Live Flights/Hotels (Amadeus)", value=False)
 run_rag = st.checkbox("Use RAG from blogs", value=False)
 
-if st.button("Generate Itinerary"):
-    with st.spinner("Planning with agents..."):
-        planner = get_planner(use_live=run_live, use_rag=run_rag)
-        state_in = {
-            "inputs": {
-                "destinations": destinations,
-                "dates": dates,
-                "budget": int(budget),
-                "interests": interests
-            }
-        }
-
-        # Ensure invoke returns a dict
-        result = planner.invoke(state_in)
-        if not isinstance(result, dict):
-            try:
-                result = json.loads(result)
-            except Exception:
-                st.error("Planner did not return valid itinerary data.")
-                st.stop()
-
-    st.success("Itinerary ready!")
-
-    # -------- Summary --------
-    st.subheader("Summary")
-    summary_data = result.get("summary", {})
+def _summary_text(summary_data) -> str:
     if isinstance(summary_data, dict):
-        summary_text = (
+        return (
             f"Cities: {', '.join(summary_data.get('cities', []))}\n"
             f"Budget: {summary_data.get('budget', 'N/A')}\n"
             f"Interests: {summary_data.get('interests', 'N/A')}"
         )
-        st.text(summary_text)
+    return str(summary_data)
+
+def _render_flights(box, flights_data):
+    # Flatten if nested list-of-lists
+    if flights_data and isinstance(flights_data[0], list):
+        flights_data = [f for sublist in flights_data for f in sublist]
+
+    if flights_data:
+        flight_texts = []
+        for flight in flights_data:
+            if not isinstance(flight, dict):
+                continue
+            price = f"{flight.get('price', 'N/A')} {flight.get('currency', '')}"
+            for itin in flight.get("itineraries", []) or []:
+                for seg in itin.get("segments", []):
+                    dep = seg.get("departure", {})
+                    arr = seg.get("arrival", {})
+                    dep_time = dep.get("at", "")
+                    arr_time = arr.get("at", "")
+                    dep_code = dep.get("iataCode", "")
+                    arr_code = arr.get("iataCode", "")
+                    carrier = seg.get("carrierCode", "")
+                    number = seg.get("number", "")
+                    duration = seg.get("duration", "")
+                    flight_texts.append(
+                        f"Flight {flight.get('id')}: {dep_code} ({dep_time}) → {arr_code} ({arr_time}) "
+                        f"| {carrier}{number} | Duration: {duration} | Price: {price}"
+                    )
+        box.text("\n".join(flight_texts))
     else:
-        st.text(str(summary_data))
+        box.info("No flights data available.")
+
+def _render_hotels(box, hotels):
+    if hotels and not (len(hotels) == 1 and "error" in hotels[0]):
+        hotel_texts = []
+        for hotel in hotels:
+            if "note" in hotel or "error" in hotel:
+                hotel_texts.append(f"ℹ️ {hotel.get('note') or hotel.get('error')}")
+                continue
+            # Use fallback if name is missing
+            name = hotel.get("name") or "(No Name Provided)"
+            rating = hotel.get("rating")
+            # Show rating only if valid
+            rating_str = f"⭐ {rating}/5" if isinstance(rating, (int, float, str)) and rating not in ("", None) else ""
+            city_str = f"({hotel['city']})" if hotel.get("city") else ""
+            offers = hotel.get("offers", [])
+
+            for offer in offers:
+                check_in = offer.get("checkInDate", "N/A")
+                check_out = offer.get("checkOutDate", "N/A")
+                price_info = offer.get("price", {})
+                total_price = price_info.get("total", "N/A")
+                currency = price_info.get("currency", "")
+                room_info = offer.get("room", {}).get("description", {}).get("text", "")
+                cancel_policy = (
+                    offer.get("policies", {})
+                         .get("cancellations", [{}])[0]
+                         .get("description", {})
+                         .get("text", "N/A")
+                )
+                hotel_texts.append(
+                    f"🏨 {name} {city_str} {rating_str}\n"
+                    f"📅 {check_in} → {check_out}\n"
+                    f"💰 {total_price} {currency}\n"
+                    f"🛏 {room_info}\n"
+                    f"❌ Cancellation: {cancel_policy}\n"
+                    + "-"*50
+                )
+
+        box.text("\n".join(hotel_texts))
+    else:
+        box.info("No hotels found.")
 
-    # -------- Flights / Hotels --------
-    cols = st.columns(2)
+def _render_rag(box, tips):
+    if tips:
+        with box.container():
+            st.subheader("RAG Tips")
+            st.write(tips)
+
+def _render_map(box, map_html):
+    if map_html:
+        with box.container():
+            st.subheader("Map")
+            st.components.v1.html(map_html, height=600, scrolling=True)
 
-    # Flights
+if st.button("Generate Itinerary"):
+    state_in = {
+        "destinations": destinations,
+        "dates": dates,
+        "budget": int(budget),
+        "interests": interests
+    }
+
+    # Placeholders are filled in as each planner node finishes
+    status_box = st.empty()
+    st.subheader("Summary")
+    summary_box = st.empty()
+    cols = st.columns(2)
     with cols[0]:
         st.subheader("Flights")
-        flights_data = result.get("flights", [])
-
-        # Flatten if nested list-of-lists
-        if flights_data and isinstance(flights_data[0], list):
-            flights_data = [f for sublist in flights_data for f in sublist]
-
-        if flights_data:
-            flight_texts = []
-            for flight in flights_data:
-                if not isinstance(flight, dict):
-                    continue
-                price = f"{flight.get('price', 'N/A')} {flight.get('currency', '')}"
-                for itin in flight.get("itineraries", []):
-                    for seg in itin.get("segments", []):
-                        dep = seg.get("departure", {})
-                        arr = seg.get("arrival", {})
-                        dep_time = dep.get("at", "")
-                        arr_time = arr.get("at", "")
-                        dep_code = dep.get("iataCode", "")
-                        arr_code = arr.get("iataCode", "")
-                        carrier = seg.get("carrierCode", "")
-                        number = seg.get("number", "")
-                        duration = seg.get("duration", "")
-                        flight_texts.append(
-                            f"Flight {flight.get('id')}: {dep_code} ({dep_time}) → {arr_code} ({arr_time}) "
-                            f"| {carrier}{number} | Duration: {duration} | Price: {price}"
-                        )
-            st.text("\n".join(flight_texts))
-        else:
-            st.info("No flights data available.")
-
-    # Hotels
+        flights_box = st.empty()
     with cols[1]:
         st.subheader("Hotels")
-        hotels = result.get("hotels", [])
-
-        if hotels and not (len(hotels) == 1 and "error" in hotels[0]):
-            hotel_texts = []
-            for hotel in hotels:
-                # Use fallback if name is missing
-                name = hotel.get("name") or "(No Name Provided)"
-                rating = hotel.get("rating")
-                # Show rating only if valid
-                rating_str = f"⭐ {rating}/5" if isinstance(rating, (int, float, str)) and rating not in ("", None) else ""
-                offers = hotel.get("offers", [])
-
-                for offer in offers:
-                    check_in = offer.get("checkInDate", "N/A")
-                    check_out = offer.get("checkOutDate", "N/A")
-                    price_info = offer.get("price", {})
-                    total_price = price_info.get("total", "N/A")
-                    currency = price_info.get("currency", "")
-                    room_info = offer.get("room", {}).get("description", {}).get("text", "")
-                    cancel_policy = (
-                        offer.get("policies", {})
-                             .get("cancellations", [{}])[0]
-                             .get("description", {})
-                             .get("text", "N/A")
-                    )
-                    hotel_texts.append(
-                        f"🏨 {name} {rating_str}\n"
-                        f"📅 {check_in} → {check_out}\n"
-                        f"💰 {total_price} {currency}\n"
-                        f"🛏 {room_info}\n"
-                        f"❌ Cancellation: {cancel_policy}\n"
-                        + "-"*50
-                    )
-
-            st.text("\n".join(hotel_texts))
-        else:
-            st.info("No hotels found.")
-
-    # -------- RAG Tips --------
-    if result.get("rag_tips"):
-        st.subheader("RAG Tips")
-        st.write(result["rag_tips"])
-
-    # -------- Final Itinerary --------
+        hotels_box = st.empty()
+    rag_box = st.empty()
     st.subheader("Final Itinerary (LLM composed)")
-    itinerary_text = result.get("itinerary_text", "No itinerary available.")
-    st.text(itinerary_text)
-
-    # -------- Map --------
-    if result.get("map_html"):
-        st.subheader("Map")
-        st.components.v1.html(result["map_html"], height=600, scrolling=True)
+    itinerary_box = st.empty()
+    map_box = st.empty()
+
+    result = {}
+    streamed = {"rag": "", "compose": ""}
+    try:
+        with st.spinner("Planning with agents..."):
+            for event in stream_plan(state_in, use_live=run_live, use_rag=run_rag):
+                if event["event"] == "token":
+                    streamed[event["node"]] += event["text"]
+                    if event["node"] == "compose":
+                        itinerary_box.text(streamed["compose"])
+                    else:
+                        _render_rag(rag_box, streamed["rag"])
+                    continue
+                if event["event"] != "update":
+                    continue
+                data = event["data"]
+                result.update(data)
+                if "summary" in data:
+                    summary_box.text(_summary_text(data["summary"]))
+                if "flights" in data:
+                    _render_flights(flights_box, data["flights"])
+                if "hotels" in data:
+                    _render_hotels(hotels_box, data["hotels"])
+                if "rag_tips" in data:
+                    _render_rag(rag_box, data["rag_tips"])
+                if "itinerary_text" in data:
+                    itinerary_box.text(data["itinerary_text"])
+                if "map_html" in data:
+                    _render_map(map_box, data["map_html"])
+    except Exception as e:
+        st.error(f"Planner did not return valid itinerary data: {e}")
+        st.stop()
+
+    status_box.success("Itinerary ready!")
 
     # -------- Download Button --------
+    itinerary_text = result.get("itinerary_text", "No itinerary available.")
     st.download_button(
         "Download Itinerary (.txt)",
         data=itinerary_text.encode("utf-8"),
@@ -1,15 +1,39 @@
+import asyncio
+import contextvars
+import inspect
+import json
 import os
-from typing import TypedDict, Dict, Any, List
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Annotated, TypedDict, Dict, Any, List, Iterable, Iterator, AsyncIterator, Optional, Sequence, Tuple
 from dotenv import load_dotenv
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, START, END
-from utils.llm import compose_itinerary_llm
-from integrations.amadeus_api import search_flights, search_hotels
-from rag.rag_travel_blogs import build_retriever_if_needed, rag_query
-from map_gen import generate_map_html
+from utils.llm import compose_itinerary_llm, stream_itinerary_llm
+from integrations.amadeus_api import live_search_available, search_flights, search_hotels
+from integrations.city_index import resolve_city
+from rag.rag_travel_blogs import build_retriever_if_needed, rag_query, rag_query_stream
+from map_gen import generate_map_geojson, generate_map_html
+from utils.checkpoints import make_checkpoint_store
+from utils.concurrency import Memo, fan_out
+from utils.model_registry import registry
+from utils.telemetry import TELEMETRY_ENABLED, collect, merge_timings, metrics, span
 from datetime import datetime, timedelta
 
 load_dotenv()
 
+# Live data fan-out: pool size, per-call and whole-stage deadlines (seconds)
+LIVE_MAX_WORKERS = int(os.getenv("LIVE_MAX_WORKERS", "8"))
+LIVE_CALL_TIMEOUT = float(os.getenv("LIVE_CALL_TIMEOUT", "15"))
+LIVE_TOTAL_TIMEOUT = float(os.getenv("LIVE_TOTAL_TIMEOUT", "25"))
+# Trips planned at once by `plan_batch` / `aplan_batch`
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+registry.register("checkpoints", make_checkpoint_store)
+
+# Nodes return only the keys they produce. Parallel branches write disjoint
+# keys, so LangGraph can merge their updates within one step.
 class TripState(TypedDict, total=False):
     inputs: Dict[str, Any]
     flights: List[dict]
@@ -17,7 +41,10 @@ class TripState(TypedDict, total=False):
     rag_tips: str
     itinerary_text: str
     map_html: str
+    map_geojson: Dict[str, Any]
     summary: Dict[str, Any]
+    # Per-request breakdown: node wall times, external calls, LLM tokens
+    timings: Annotated[Dict[str, Any], merge_timings]
 
 def _parse_inputs(state: TripState) -> TripState:
     i = state["inputs"]
@@ -37,70 +64,173 @@ def _parse_inputs(state: TripState) -> TripState:
         "budget": i.get("budget"),
         "interests": i.get("interests"),
     }
-    state["summary"] = summary
-    return state
+    return {"summary": summary}
+
+def _hotel_queries(state: TripState) -> List[Any]:
+    """One (city, city_code, check_in, check_out) per overnight stop, or a note dict.
+
+    Every city reached by a hop is a stop from that hop's date until the next
+    hop (two nights for the last city). Same-day connections are skipped.
+    """
+    hops = state["summary"]["hops"]
+    if not state["summary"]["cities"]:
+        return []
+    if not hops:
+        return [{"note": "Invalid or missing dates for hotel search"}]
+    queries = []
+    for idx, hop in enumerate(hops):
+        city = hop["to"]
+        try:
+            check_in = datetime.strptime(hop["date"], "%Y-%m-%d")
+        except (TypeError, ValueError):
+            queries.append({"note": "Invalid or missing dates for hotel search", "city": city})
+            continue
+        # Auto-generate check_out date if there is no (valid) next hop
+        check_out = check_in + timedelta(days=2)
+        if idx + 1 < len(hops):
+            try:
+                check_out = datetime.strptime(hops[idx + 1]["date"], "%Y-%m-%d")
+            except (TypeError, ValueError):
+                pass
+        if check_out <= check_in:
+            continue
+        resolved = resolve_city(city)
+        if resolved is None:
+            queries.append({"note": f"Unknown city '{city}', hotel search skipped", "city": city})
+            continue
+        queries.append((city, resolved.code, check_in.strftime("%Y-%m-%d"), check_out.strftime("%Y-%m-%d")))
+    return queries
+
+def _lookups(config: RunnableConfig) -> Optional[Memo]:
+    """The batch-wide lookup memo, when the planner runs as part of `plan_batch`."""
+    return (config or {}).get("configurable", {}).get("lookups")
+
+def _found(result) -> bool:
+    # Error payloads are not shared; the next trip asking retries the call
+    return not (result and isinstance(result[0], dict) and "error" in result[0])
+
+def _shared(lookups: Optional[Memo], kind: str, fn):
+    if lookups is None:
+        return fn
+    def call(*args):
+        return lookups.do((kind,) + tuple(args), lambda: fn(*args), keep=_found)
+    return call
 
 def _live_data_node(use_live: bool):
-    def node(state: TripState) -> TripState:
+    def node(state: TripState, config: Optional[RunnableConfig] = None) -> TripState:
         if not use_live:
-            state["flights"] = [{"note": "live search disabled"}]
-            state["hotels"] = [{"note": "live search disabled"}]
-            return state
+            return {
+                "flights": [{"note": "live search disabled"}],
+                "hotels": [{"note": "live search disabled"}],
+            }
+        if not live_search_available():
+            # Upstream is failing; answer from RAG/LLM alone instead of waiting on errors
+            note = {"note": "live search disabled", "reason": "Amadeus is unavailable"}
+            return {"flights": [dict(note)], "hotels": [dict(note)]}
 
-        flights, hotels = [], []
         hops = state["summary"].get("hops", [])
+        # Within a batch, identical flight and hotel searches across trips run once
+        lookups = _lookups(config)
+        flight_search = _shared(lookups, "flights", search_flights)
+        hotel_search = _shared(lookups, "hotels", search_hotels)
 
-        # Search flights for each hop
+        # One flight search per dated hop plus the hotel searches, all issued at once.
+        # Hops whose cities do not resolve to IATA codes get a note instead of a call.
+        calls, flight_slots = [], []
         for hop in hops:
-            origin = hop["from"][:3].upper() if len(hop["from"]) >= 3 else hop["from"].upper()
-            dest = hop["to"][:3].upper() if len(hop["to"]) >= 3 else hop["to"].upper()
+            origin, dest = resolve_city(hop["from"]), resolve_city(hop["to"])
             date = hop["date"]
-            fl = search_flights(origin, dest, date) if date else []
-            flights.append(fl)
-
-        # Search hotels in the last city
-        if state["summary"]["cities"]:
-            city_code = state["summary"]["cities"][-1][:3].upper()
-            check_in = state["summary"]["hops"][-1]["date"] if state["summary"]["hops"] else None
-
-            # Auto-generate check_out date if not provided
-            check_out = None
-            if check_in:
-                try:
-                    check_out = (
-                        datetime.strptime(check_in, "%Y-%m-%d") + timedelta(days=2)
-                    ).strftime("%Y-%m-%d")
-                except ValueError:
-                    check_out = None
-
-            # Only search if both dates are valid
-            if check_in and check_out:
-                hotels = search_hotels(city_code, check_in, check_out)
-                if not hotels or (len(hotels) == 1 and "error" in hotels[0]):
-                    hotels = [{"note": f"No hotels found for {city_code}"}]
+            if not date:
+                flight_slots.append([])
+            elif origin is None or dest is None:
+                unknown = hop["from"] if origin is None else hop["to"]
+                flight_slots.append([{"note": f"Unknown city '{unknown}', flight search skipped"}])
             else:
-                hotels = [{"note": "Invalid or missing dates for hotel search"}]
+                flight_slots.append(len(calls))
+                calls.append((flight_search, (origin.code, dest.code, date)))
+
+        # One hotel search per overnight stop
+        hotel_slots = {}
+        hotel_qs = _hotel_queries(state)
+        for q in hotel_qs:
+            if isinstance(q, tuple):
+                hotel_slots[len(calls)] = q[0]
+                calls.append((hotel_search, q[1:]))
+
+        def on_timeout(idx):
+            if idx in hotel_slots:
+                return [{"error": "Hotel search timed out"}]
+            return [{"error": "Flight search timed out"}]
 
-        state["flights"] = flights
-        state["hotels"] = hotels
-        return state
+        def on_error(idx, e):
+            return [{"error": str(e)}]
+
+        results = fan_out(
+            calls,
+            max_workers=LIVE_MAX_WORKERS,
+            call_timeout=LIVE_CALL_TIMEOUT,
+            total_timeout=LIVE_TOTAL_TIMEOUT,
+            on_timeout=on_timeout,
+            on_error=on_error,
+        )
+
+        flights = [results[slot] if isinstance(slot, int) else slot for slot in flight_slots]
+
+        # Flat list of hotels (and notes), each tagged with its city
+        hotels = []
+        slots = iter(hotel_slots)
+        for q in hotel_qs:
+            if not isinstance(q, tuple):
+                hotels.append(q)
+                continue
+            found = results[next(slots)]
+            if not found or (len(found) == 1 and "error" in found[0]):
+                note = {"note": f"No hotels found for {q[0]}", "city": q[0]}
+                if found:
+                    # Keep the failure, so it is not taken for a city without hotels
+                    note["error"] = found[0]["error"]
+                hotels.append(note)
+            else:
+                hotels.extend({**h, "city": q[0]} for h in found)
+
+        return {"flights": flights, "hotels": hotels}
 
     return node
 
+def _stream_tokens(config: RunnableConfig) -> bool:
+    """True when the caller asked for token streaming (see `stream_plan`)."""
+    return bool((config or {}).get("configurable", {}).get("stream_tokens"))
+
+def _emit_tokens(node: str, chunks: Iterable[str]) -> str:
+    # Forward each chunk to the graph's custom stream and return the full text
+    writer = get_stream_writer()
+    parts = []
+    for text in chunks:
+        parts.append(text)
+        writer({"node": node, "text": text})
+    return "".join(parts)
+
 def _rag_node(use_rag: bool):
-    def node(state: TripState) -> TripState:
+    def node(state: TripState, config: RunnableConfig) -> TripState:
         if not use_rag:
-            state["rag_tips"] = ""
-            return state
+            return {"rag_tips": ""}
         build_retriever_if_needed()
-        q = f"Pro tips for {', '.join(state['summary']['cities'])} for interests: {state['summary'].get('interests')}"
-        state["rag_tips"] = rag_query(q)
-        return state
+        cities = state["summary"]["cities"]
+        q = f"Pro tips for {', '.join(cities)} for interests: {state['summary'].get('interests')}"
+        # Only search blog chunks about the trip's cities
+        codes = [c.code for c in map(resolve_city, cities) if c is not None]
+        if _stream_tokens(config):
+            return {"rag_tips": _emit_tokens("rag", rag_query_stream(q, codes))}
+        lookups = _lookups(config)
+        if lookups is not None:
+            # Trips of a batch asking the same question share one RAG answer
+            return {"rag_tips": lookups.do(("rag", q, tuple(codes)), lambda: rag_query(q, codes), keep=bool)}
+        return {"rag_tips": rag_query(q, codes)}
 
     return node
 
-def _compose_node(state: TripState) -> TripState:
-    txt = compose_itinerary_llm(
+def _compose_node(state: TripState, config: RunnableConfig) -> TripState:
+    kwargs = dict(
         cities=state["summary"].get("cities", []),
         hops=state["summary"].get("hops", []),
         interests=state["summary"].get("interests", ""),
@@ -109,26 +239,244 @@ def _compose_node(state: TripState) -> TripState:
         hotels=state.get("hotels", []),
         rag_tips=state.get("rag_tips", ""),
     )
-    state["itinerary_text"] = txt
-    return state
+    if _stream_tokens(config):
+        return {"itinerary_text": _emit_tokens("compose", stream_itinerary_llm(**kwargs))}
+    txt = compose_itinerary_llm(**kwargs)
+    return {"itinerary_text": txt}
 
 def _map_node(state: TripState) -> TripState:
-    state["map_html"] = generate_map_html(state["summary"].get("cities", []))
-    return state
+    # inputs["map_format"]: "html" (default), "geojson" or "none" (see map_gen.MAP_FORMATS)
+    fmt = state["inputs"].get("map_format") or "html"
+    cities = state["summary"].get("cities", [])
+    if fmt == "none":
+        return {}
+    if fmt == "geojson":
+        return {"map_geojson": generate_map_geojson(cities)}
+    return {"map_html": generate_map_html(cities)}
 
-def get_planner(use_live: bool, use_rag: bool):
+def _instrument(name: str, fn):
+    """Wrap a node so its wall time and the calls it makes land in `timings`."""
+    if not TELEMETRY_ENABLED:
+        return fn
+    takes_config = "config" in inspect.signature(fn).parameters
+
+    def node(state: TripState, config: RunnableConfig) -> TripState:
+        with collect() as timings:
+            with span(name, kind="node"):
+                out = fn(state, config) if takes_config else fn(state)
+        return {**out, "timings": timings}
+
+    return node
+
+def _lookups_failed(update: TripState) -> bool:
+    """True when an update holds failed lookups, or lookups skipped while Amadeus is down."""
+    for key in ("flights", "hotels"):
+        for entry in update.get(key) or []:
+            rows = entry if isinstance(entry, list) else [entry]
+            if not _found(rows) or any(isinstance(r, dict) and r.get("reason") for r in rows):
+                return True
+    return False
+
+def _checkpointed(name: str, fn, use_live: bool, use_rag: bool):
+    """Wrap a node so a retried request skips it once it has finished (see utils.checkpoints).
+
+    Only runs with `request_id` in the config are checkpointed. A resumed
+    node returns its saved update without timings, so `timings` only
+    shows work done by this attempt. Updates with failed lookups, and
+    updates built on them (e.g. the itinerary), are not saved, so a retry
+    makes those calls again.
+    """
+    takes_config = "config" in inspect.signature(fn).parameters
+
+    def node(state: TripState, config: RunnableConfig) -> TripState:
+        request_id = (config or {}).get("configurable", {}).get("request_id")
+        store = registry.get("checkpoints") if request_id else None
+        if store is None:
+            return fn(state, config) if takes_config else fn(state)
+        run = store.run_key(state["inputs"], use_live, use_rag)
+        saved = store.load(request_id, run, name)
+        if saved is not None:
+            metrics.inc("travel_checkpoint_nodes_total", 1, "Planner nodes saved or resumed", node=name, result="resumed")
+            return saved
+        out = fn(state, config) if takes_config else fn(state)
+        if _lookups_failed(out) or _lookups_failed(state):
+            metrics.inc("travel_checkpoint_nodes_total", 1, "Planner nodes saved or resumed", node=name, result="skipped")
+            return out
+        store.save(request_id, run, name, {k: v for k, v in out.items() if k != "timings"})
+        metrics.inc("travel_checkpoint_nodes_total", 1, "Planner nodes saved or resumed", node=name, result="saved")
+        return out
+
+    return node
+
+_planners: Dict[tuple, Any] = {}
+_planners_lock = threading.Lock()
+
+def _build_planner(use_live: bool, use_rag: bool):
     graph = StateGraph(TripState)
-    graph.add_node("parse_inputs", _parse_inputs)
-    graph.add_node("live_data", _live_data_node(use_live))
-    graph.add_node("rag", _rag_node(use_rag))
-    graph.add_node("compose", _compose_node)
-    graph.add_node("map", _map_node)
+    for name, fn in (
+        ("parse_inputs", _parse_inputs),
+        ("live_data", _live_data_node(use_live)),
+        ("rag", _rag_node(use_rag)),
+        ("compose", _compose_node),
+        ("map", _map_node),
+    ):
+        node = _instrument(name, fn)
+        # Map rendering is memoized (see map_gen), so its HTML is not worth a checkpoint row
+        graph.add_node(name, node if name == "map" else _checkpointed(name, node, use_live, use_rag))
 
+    # live_data, rag and map only need the parsed summary, so they run in
+    # parallel; compose waits for both live_data and rag.
     graph.add_edge(START, "parse_inputs")
     graph.add_edge("parse_inputs", "live_data")
-    graph.add_edge("live_data", "rag")
-    graph.add_edge("rag", "compose")
-    graph.add_edge("compose", "map")
+    graph.add_edge("parse_inputs", "rag")
+    graph.add_edge("parse_inputs", "map")
+    graph.add_edge(["live_data", "rag"], "compose")
+    graph.add_edge("compose", END)
     graph.add_edge("map", END)
 
     return graph.compile()
+
+def get_planner(use_live: bool, use_rag: bool):
+    """Compiled planner for this flag combination, built once and shared across requests."""
+    key = (bool(use_live), bool(use_rag))
+    planner = _planners.get(key)
+    if planner is None:
+        with _planners_lock:
+            planner = _planners.get(key)
+            if planner is None:
+                planner = _planners[key] = _build_planner(*key)
+    return planner
+
+def warm_planners():
+    """Compile all four planner variants ahead of the first request."""
+    for use_live in (False, True):
+        for use_rag in (False, True):
+            get_planner(use_live, use_rag)
+
+def run_config(request_id: Optional[str] = None, **configurable) -> RunnableConfig:
+    # With a request ID, finished nodes are checkpointed and a retry resumes after them
+    if request_id:
+        configurable["request_id"] = request_id
+    return {"configurable": configurable}
+
+def plan(inputs: Dict[str, Any], use_live: bool, use_rag: bool, request_id: Optional[str] = None) -> Dict[str, Any]:
+    """Plan one trip and return the final state."""
+    return get_planner(use_live, use_rag).invoke({"inputs": inputs}, run_config(request_id))
+
+def _to_events(mode: str, chunk: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    if mode == "custom":
+        yield {"event": "token", "node": chunk["node"], "text": chunk["text"]}
+    else:
+        for node, data in chunk.items():
+            yield {"event": "update", "node": node, "data": data or {}}
+
+def stream_plan(inputs: Dict[str, Any], use_live: bool, use_rag: bool,
+                request_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Run the planner and yield events as they happen.
+
+    `update` events carry each node's partial state as soon as the node
+    finishes; `token` events carry generated text from the rag and compose
+    nodes; a final `done` event closes the stream.
+    """
+    planner = get_planner(use_live, use_rag)
+    config = run_config(request_id, stream_tokens=True)
+    for mode, chunk in planner.stream({"inputs": inputs}, config, stream_mode=["updates", "custom"]):
+        yield from _to_events(mode, chunk)
+    yield {"event": "done"}
+
+async def astream_plan(inputs: Dict[str, Any], use_live: bool, use_rag: bool,
+                       request_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Async variant of `stream_plan`."""
+    planner = get_planner(use_live, use_rag)
+    config = run_config(request_id, stream_tokens=True)
+    async for mode, chunk in planner.astream({"inputs": inputs}, config, stream_mode=["updates", "custom"]):
+        for event in _to_events(mode, chunk):
+            yield event
+    yield {"event": "done"}
+
+# Fields of a batch entry (see mcp_server.PlanPayload) that make up the planner inputs
+_INPUT_FIELDS = ("destinations", "dates", "budget", "interests", "map_format")
+
+def _batch_jobs(items: Sequence[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], bool, bool, List[int]]]:
+    """Distinct trips of a batch as (inputs, use_live, use_rag, indices of the entries asking for it)."""
+    jobs: Dict[str, tuple] = {}
+    for idx, item in enumerate(items):
+        inputs = {k: item.get(k) for k in _INPUT_FIELDS if item.get(k) is not None}
+        flags = (bool(item.get("use_live")), bool(item.get("use_rag")))
+        key = json.dumps([inputs, flags], sort_keys=True, default=str)
+        jobs.setdefault(key, (inputs, *flags, []))[3].append(idx)
+    return list(jobs.values())
+
+def _batch_events(indices: List[int], plan: Optional[Dict[str, Any]], error: Optional[Exception]):
+    for idx in indices:
+        if error is None:
+            yield {"event": "result", "index": idx, "plan": plan}
+        else:
+            yield {"event": "error", "index": idx, "message": str(error) or repr(error)}
+
+def _batch_done(counts: Dict[str, int], lookups: Memo) -> Dict[str, Any]:
+    return {"event": "done", **counts, "lookups": lookups.stats()}
+
+def plan_batch(items: Sequence[Dict[str, Any]], concurrency: int = BATCH_CONCURRENCY,
+               request_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Plan many trips at once and yield each result as soon as its trip finishes.
+
+    `items` are dicts with the `PlanPayload` fields. Identical entries are
+    planned once; identical flight, hotel and RAG lookups are shared across
+    the whole batch; at most `concurrency` trips run at a time, so their
+    embedding and Flan-T5 calls land in the same engine batches. Each entry
+    yields one `result` (with `plan`) or `error` (with `message`) event
+    tagged with its `index`, in completion order; a failing trip does not
+    affect the others. A final `done` event carries counts and lookup stats.
+    With `request_id`, every trip is checkpointed under it, so retrying the
+    batch resumes each unfinished trip.
+    """
+    lookups = Memo()
+    config = run_config(request_id, lookups=lookups)
+    counts = {"ok": 0, "errors": 0}
+    jobs = _batch_jobs(items)
+
+    def run(job):
+        inputs, use_live, use_rag, _ = job
+        return get_planner(use_live, use_rag).invoke({"inputs": inputs}, config)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs) or 1))) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, run, job): job for job in jobs}
+        for future in as_completed(futures):
+            indices = futures[future][3]
+            error = future.exception()
+            counts["errors" if error else "ok"] += len(indices)
+            yield from _batch_events(indices, None if error else future.result(), error)
+    yield _batch_done(counts, lookups)
+
+async def aplan_batch(items: Sequence[Dict[str, Any]], concurrency: int = BATCH_CONCURRENCY,
+                      request_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Async variant of `plan_batch`."""
+    lookups = Memo()
+    config = run_config(request_id, lookups=lookups)
+    counts = {"ok": 0, "errors": 0}
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(job):
+        inputs, use_live, use_rag, indices = job
+        async with sem:
+            try:
+                return indices, await get_planner(use_live, use_rag).ainvoke({"inputs": inputs}, config), None
+            except Exception as e:
+                return indices, None, e
+
+    tasks = [asyncio.ensure_future(run(job)) for job in _batch_jobs(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indices, plan, error = await next_done
+            counts["errors" if error else "ok"] += len(indices)
+            for event in _batch_events(indices, plan, error):
+                yield event
+    finally:
+        # The client went away mid-stream: stop planning the rest
+        for task in tasks:
+            task.cancel()
+    yield _batch_done(counts, lookups)
+
+# Entry points a worker process can run (see utils.worker_pool); iterators stream their events
+JOBS = {"plan": plan, "stream": stream_plan, "batch": plan_batch}
@@ -0,0 +1,106 @@
+"""Throughput of `plan_batch` versus the same trips planned one call at a time.
+
+Builds a campaign-style batch: trips drawn from a small set of routes,
+start dates and interests, so many trips share hops, hotel stays and RAG
+questions (and a few are exact repeats). Both modes run on the offline
+pipeline from `bench_pipeline` (replayed Amadeus responses, stub LLM,
+hashed embeddings) with the same number of trips in flight:
+
+- individual: one `planner.invoke` per trip from `concurrency` threads
+- batch: one `plan_batch` call
+
+and report wall time, trips per second, upstream Amadeus requests and
+Flan-T5 generations. The offer and answer caches are off in both modes,
+so the difference is what the batch shares by itself.
+
+    python -m benchmarks.bench_batch [--trips 48] [--concurrency 4]
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import app_core
+from benchmarks.bench_pipeline import CITIES, offline_pipeline
+from utils.model_registry import registry
+
+ROUTES = [CITIES[i:i + n] for i, n in ((0, 2), (1, 3), (3, 2), (5, 3), (8, 2), (10, 3))]
+INTERESTS = ["food, museums", "nightlife", "walking, architecture"]
+
+
+def campaign(n_trips: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    trips = []
+    for _ in range(n_trips):
+        route = rng.choice(ROUTES)
+        start = date(2025, 9, 10) + timedelta(days=7 * rng.randrange(2))
+        trips.append({
+            "destinations": " -> ".join(route),
+            "dates": ",".join(str(start + timedelta(days=2 * i)) for i in range(len(route) - 1)),
+            "budget": rng.choice([1000, 1500, 2000]),
+            "interests": rng.choice(INTERESTS),
+            "use_live": True,
+            "use_rag": True,
+            "map_format": "none",
+        })
+    return trips
+
+
+def _individual(trips, concurrency):
+    def one(item):
+        inputs = {k: item[k] for k in app_core._INPUT_FIELDS}
+        return app_core.get_planner(item["use_live"], item["use_rag"]).invoke({"inputs": inputs})
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sum(bool(out.get("itinerary_text")) for out in pool.map(one, trips))
+
+
+def _batch(trips, concurrency):
+    return sum(e["event"] == "result" for e in app_core.plan_batch(trips, concurrency=concurrency))
+
+
+def run(n_trips=48, concurrency=4, amadeus_latency=0.03, tokens_per_sec=2000.0) -> list:
+    trips = campaign(n_trips)
+    rows = []
+    for mode, fn in (("individual", _individual), ("batch", _batch)):
+        with offline_pipeline(amadeus_latency, tokens_per_sec) as transport:
+            engine = registry.get("generation_engine")
+            t0 = time.perf_counter()
+            ok = fn(trips, concurrency)
+            wall = time.perf_counter() - t0
+            rows.append({
+                "mode": mode,
+                "trips": n_trips,
+                "ok": ok,
+                "wall_s": round(wall, 3),
+                "trips_per_s": round(n_trips / wall, 2),
+                "amadeus_requests": sum(n for path, n in transport.calls.items() if "oauth2" not in path),
+                "generations": engine.stats()["requests"],
+            })
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Batch planning throughput versus individual calls.")
+    ap.add_argument("--trips", type=int, default=48)
+    ap.add_argument("--concurrency", type=int, default=4, help="trips in flight in both modes")
+    ap.add_argument("--amadeus-latency", type=float, default=0.03, help="seconds per replayed Amadeus call")
+    ap.add_argument("--tokens-per-sec", type=float, default=2000, help="stub LLM decode rate")
+    ap.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = run(args.trips, args.concurrency, args.amadeus_latency, args.tokens_per_sec)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'mode':<11} {'trips':>5} {'ok':>4} {'wall s':>8} {'trips/s':>8} {'amadeus':>8} {'flan-t5':>8}")
+    for r in rows:
+        print(f"{r['mode']:<11} {r['trips']:>5} {r['ok']:>4} {r['wall_s']:>8} {r['trips_per_s']:>8} "
+              f"{r['amadeus_requests']:>8} {r['generations']:>8}")
+    print(f"speedup: {rows[1]['trips_per_s'] / rows[0]['trips_per_s']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
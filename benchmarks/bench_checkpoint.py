@@ -0,0 +1,105 @@
+"""What a retry costs with and without planner checkpoints.
+
+Each attempt runs on the offline pipeline from `bench_pipeline` (replayed
+Amadeus responses, stub LLM, hashed embeddings) with the compose step
+failing on the first attempt, as a Bedrock timeout would. The client then
+retries, as `a2a_server.py` does:
+
+- full: the retry gets a new request ID, so every node runs again
+- resume: the retry reuses the request ID, so only compose and the nodes
+  that had not finished run again
+
+For each trip size it reports the retry's latency, its upstream Amadeus
+requests and its Flan-T5 generations (RAG answers), as medians over
+`--repeats` failed-then-retried requests. Checkpoints go to a temporary
+SQLite file.
+
+    python -m benchmarks.bench_checkpoint [--sizes 2 5 15] [--repeats 5]
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+
+import app_core
+from benchmarks.bench_pipeline import SIZES, offline_pipeline, trip
+from utils.checkpoints import CheckpointStore
+from utils.model_registry import registry
+
+
+def _amadeus_requests(transport) -> int:
+    return sum(n for path, n in transport.calls.items() if "oauth2" not in path)
+
+
+def _retry(inputs, transport, resume: bool) -> dict:
+    """Fail one attempt at compose, then retry it; returns the retry's cost."""
+    compose = app_core.compose_itinerary_llm
+    failed = []
+
+    def flaky(**kw):
+        if not failed:
+            failed.append(True)
+            raise TimeoutError("bedrock timed out")
+        return compose(**kw)
+
+    request_id = uuid.uuid4().hex
+    engine = registry.get("generation_engine")
+    with patch.object(app_core, "compose_itinerary_llm", flaky):
+        try:
+            app_core.plan(inputs, True, True, request_id=request_id)
+        except TimeoutError:
+            pass
+        calls, generations = _amadeus_requests(transport), engine.stats()["requests"]
+        t0 = time.perf_counter()
+        app_core.plan(inputs, True, True, request_id=request_id if resume else uuid.uuid4().hex)
+        wall = time.perf_counter() - t0
+    return {
+        "latency_s": wall,
+        "amadeus_requests": _amadeus_requests(transport) - calls,
+        # Compose itself is on Bedrock; these are the RAG answers
+        "generations": engine.stats()["requests"] - generations,
+    }
+
+
+def run(sizes=SIZES, repeats=5, amadeus_latency=0.03, tokens_per_sec=2000.0) -> list:
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, offline_pipeline(amadeus_latency, tokens_per_sec) as transport, \
+            patch.dict(registry._instances, {"checkpoints": CheckpointStore(f"{tmp}/checkpoints.sqlite3")}):
+        for n in sizes:
+            inputs = trip(n)["inputs"]
+            for mode in ("full", "resume"):
+                samples = [_retry(inputs, transport, mode == "resume") for _ in range(repeats)]
+                rows.append({
+                    "cities": n,
+                    "retry": mode,
+                    "latency_s": round(statistics.median(s["latency_s"] for s in samples), 4),
+                    "amadeus_requests": statistics.median(s["amadeus_requests"] for s in samples),
+                    "generations": statistics.median(s["generations"] for s in samples),
+                })
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Retry cost with and without planner checkpoints.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="trip sizes in cities")
+    ap.add_argument("--repeats", type=int, default=5, help="failed-then-retried requests per size and mode")
+    ap.add_argument("--amadeus-latency", type=float, default=0.03, help="seconds per replayed Amadeus call")
+    ap.add_argument("--tokens-per-sec", type=float, default=2000, help="stub LLM decode rate")
+    ap.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = run(args.sizes, args.repeats, args.amadeus_latency, args.tokens_per_sec)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'cities':>6} {'retry':<7} {'latency s':>10} {'amadeus':>8} {'flan-t5':>8}")
+    for r in rows:
+        print(f"{r['cities']:>6} {r['retry']:<7} {r['latency_s']:>10} {r['amadeus_requests']:>8} "
+              f"{r['generations']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Throughput (prompts/sec) of local generation with and without dynamic batching.
+
+By default this loads a real Flan-T5 checkpoint (`--model`, small by default
+to keep the run short). With `--simulate`, or when transformers/torch are not
+installed, a cost model of a CPU forward pass is used instead: a fixed cost
+per batch plus a smaller cost per prompt in the batch.
+
+    python -m benchmarks.bench_generation [--model google/flan-t5-small] [--max-new-tokens 64]
+    python -m benchmarks.bench_generation --simulate
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.batching import BatchGenerationEngine
+
+PROMPT = "Suggest three things to do in {city} for someone who likes food and history."
+CITIES = ["Paris", "Rome", "Lisbon", "Kyoto", "Berlin", "Madrid", "Vienna", "Prague"]
+
+
+def _simulated(batch_overhead=0.08, per_prompt=0.01):
+    def generate_batch(prompts, caps):
+        time.sleep(batch_overhead + per_prompt * len(prompts))
+        return [f"tips for: {p[:20]}" for p in prompts]
+    return generate_batch
+
+
+def _real(model_name, threads, int8):
+    os.environ["FLAN_T5_MODEL"] = model_name
+    os.environ["GEN_NUM_THREADS"] = str(threads)
+    os.environ["GEN_INT8"] = "true" if int8 else "false"
+    from rag import rag_travel_blogs
+    from utils.model_registry import registry
+    registry.get("flan_t5")
+    return rag_travel_blogs._generate_batch
+
+
+def _throughput(generate_batch, max_batch, concurrency, per_worker, max_new_tokens):
+    engine = BatchGenerationEngine(generate_batch, max_batch_size=max_batch, max_wait_ms=15)
+    total = concurrency * per_worker
+
+    def worker(w):
+        for i in range(per_worker):
+            engine.generate(PROMPT.format(city=CITIES[(w + i) % len(CITIES)]), max_new_tokens)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    stats = engine.stats()
+    engine.close()
+    return total / elapsed, stats["avg_batch"]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="google/flan-t5-small")
+    ap.add_argument("--simulate", action="store_true")
+    ap.add_argument("--max-new-tokens", type=int, default=64)
+    ap.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--int8", action="store_true")
+    ap.add_argument("--per-worker", type=int, default=4)
+    args = ap.parse_args()
+
+    generate_batch = None
+    if not args.simulate:
+        try:
+            generate_batch = _real(args.model, args.threads, args.int8)
+            print(f"model: {args.model} (int8={args.int8}, threads={args.threads})")
+        except ImportError as e:
+            print(f"transformers/torch unavailable ({e}); using the simulated cost model")
+    if generate_batch is None:
+        generate_batch = _simulated()
+        print("model: simulated (80 ms per batch + 10 ms per prompt)")
+
+    print(f"{'concurrency':>11} {'unbatched p/s':>14} {'batched p/s':>12} {'avg batch':>10} {'speedup':>8}")
+    for concurrency in (1, 4, 16):
+        single, _ = _throughput(generate_batch, 1, concurrency, args.per_worker, args.max_new_tokens)
+        batched, avg = _throughput(generate_batch, 8, concurrency, args.per_worker, args.max_new_tokens)
+        print(f"{concurrency:>11} {single:>14.2f} {batched:>12.2f} {avg:>10.2f} {batched / single:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
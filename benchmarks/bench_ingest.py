@@ -0,0 +1,148 @@
+"""Ingestion benchmark on a generated local corpus of HTML files.
+
+Compares the old all-at-once build (read everything, split everything, embed
+in one call) with the incremental pipeline in `rag.ingest`, then re-runs the
+pipeline on an unchanged corpus and after editing/deleting a few files.
+The untagged row is a first run without city tagging, to show what tagging
+adds. Embedding is simulated with a fixed per-chunk cost so the run is offline.
+
+    python -m benchmarks.bench_ingest [--files 3000] [--workers 8]
+"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag.ingest import Manifest, ingest
+from rag.rag_travel_blogs import _extract_text
+from utils.model_registry import registry
+
+EMBED_SECONDS_PER_CHUNK = 0.0002
+WORDS = ("museum market sunset harbor trattoria ferry alley gelato basilica tram rooftop "
+         "vineyard bakery piazza canal gallery festival bistro hostel train").split()
+
+
+class NoCities:
+    """City index that finds nothing, for the untagged row."""
+
+    def mentions(self, text):
+        return []
+
+
+class FakeStore:
+    """Counts embedded chunks; embedding costs a fixed time per chunk."""
+
+    def __init__(self):
+        self.ids = set()
+        self.embedded = 0
+
+    def _embed(self, texts):
+        time.sleep(EMBED_SECONDS_PER_CHUNK * len(texts))
+        return [hashlib.md5(t.encode()).digest() for t in texts]
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        self._embed(texts)
+        self.embedded += len(texts)
+        self.ids.update(ids)
+
+    def delete(self, ids=None):
+        self.ids.difference_update(ids)
+
+    @classmethod
+    def from_texts(cls, texts, metadatas=None):
+        store = cls()
+        store._embed(texts)
+        store.embedded = len(texts)
+        return store
+
+
+def _page(rng, n):
+    paras = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 160))) for _ in range(8)]
+    return f"<html><body><h1>Post {n}</h1>" + "".join(f"<p>{p}</p>" for p in paras) + "</body></html>"
+
+
+def _corpus(root, n):
+    rng = random.Random(7)
+    paths = []
+    for i in range(n):
+        path = os.path.join(root, f"post_{i:05d}.html")
+        with open(path, "w") as f:
+            f.write(_page(rng, i))
+        paths.append(path)
+    return paths
+
+
+def _measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, peak / 1e6
+
+
+def _naive(paths):
+    texts = []
+    for p in paths:
+        with open(p) as f:
+            texts.append((p, _extract_text(f.read())))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    docs, metas = [], []
+    for src, t in texts:
+        for chunk in splitter.split_text(t):
+            docs.append(chunk)
+            metas.append({"source": src})
+    return FakeStore.from_texts(docs, metadatas=metas)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", type=int, default=3000)
+    ap.add_argument("--workers", type=int, default=8)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, "corpus"))
+        paths = _corpus(os.path.join(root, "corpus"), args.files)
+        manifest = Manifest(os.path.join(root, "manifest.sqlite3"))
+        store = FakeStore()
+        run = lambda srcs, **kw: ingest(srcs, store=store, manifest=manifest, workers=args.workers, **kw)
+
+        naive, t, mb = _measure(lambda: _naive(paths))
+        print(f"{'run':<28} {'seconds':>8} {'peak MB':>8} {'embedded':>9} {'removed':>8}")
+        print(f"{'all-at-once build':<28} {t:>8.2f} {mb:>8.1f} {naive.embedded:>9} {'-':>8}")
+
+        untagged = Manifest(os.path.join(root, "untagged.sqlite3"))
+        with patch.dict(registry._instances, {"city_index": NoCities()}):
+            stats, t, mb = _measure(lambda: ingest(paths, store=FakeStore(), manifest=untagged, workers=args.workers))
+        print(f"{'incremental, untagged':<28} {t:>8.2f} {mb:>8.1f} {stats['chunks_added']:>9} {stats['chunks_removed']:>8}")
+
+        before = store.embedded
+        stats, t, mb = _measure(lambda: run(paths))
+        print(f"{'incremental, first run':<28} {t:>8.2f} {mb:>8.1f} {store.embedded - before:>9} {stats['chunks_removed']:>8}")
+
+        before = store.embedded
+        stats, t, mb = _measure(lambda: run(paths))
+        print(f"{'incremental, unchanged':<28} {t:>8.2f} {mb:>8.1f} {store.embedded - before:>9} {stats['chunks_removed']:>8}")
+
+        rng = random.Random(11)
+        for p in rng.sample(paths, len(paths) // 20):
+            with open(p, "a") as f:
+                f.write(f"<p>{' '.join(rng.choice(WORDS) for _ in range(120))}</p>")
+            st = os.stat(p)
+            os.utime(p, (st.st_atime, st.st_mtime + 5))
+        kept = paths[len(paths) // 50:]
+        before = store.embedded
+        stats, t, mb = _measure(lambda: run(kept, prune=True))
+        print(f"{'incremental, 5% edit 2% del':<28} {t:>8.2f} {mb:>8.1f} {store.embedded - before:>9} {stats['chunks_removed']:>8}")
+
+
+if __name__ == "__main__":
+    main()
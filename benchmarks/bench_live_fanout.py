@@ -0,0 +1,62 @@
+"""Wall time of the live-data stage: sequential vs concurrent fan-out.
+
+Runs `_live_data_node(True)` against a fake Amadeus client that injects a
+different latency per hop, so the concurrent run should track the slowest
+call rather than the sum of all calls.
+
+    python -m benchmarks.bench_live_fanout
+"""
+import time
+from unittest.mock import patch
+
+import app_core
+from integrations import amadeus_api
+from benchmarks.fake_amadeus import FakeAmadeus
+
+CITIES = ["Paris", "Rome", "Berlin", "Madrid", "Lisbon"]
+DATES = ["2025-09-10", "2025-09-12", "2025-09-14", "2025-09-16"]
+
+
+def _latency(name, params):
+    # Each hop gets a distinct delay; each stop's hotel lookup is two calls of 0.15s
+    if name == "flight_offers":
+        return {"PAR": 0.2, "ROM": 0.35, "BER": 0.25, "MAD": 0.3}[params["originLocationCode"]]
+    return 0.15
+
+
+def _run(max_workers):
+    state = {
+        "inputs": {
+            "destinations": " -> ".join(CITIES),
+            "dates": ",".join(DATES),
+            "budget": 2000,
+            "interests": "food",
+        }
+    }
+    state.update(app_core._parse_inputs(state))
+    fake = FakeAmadeus(latency=_latency)
+    amadeus_api.clear_caches()
+    with patch.object(amadeus_api, "_client", lambda: fake), \
+         patch.object(app_core, "LIVE_MAX_WORKERS", max_workers), \
+         patch.object(amadeus_api, "RATE_LIMIT", 0), \
+         patch.dict(amadeus_api._buckets, clear=True):
+        t0 = time.perf_counter()
+        out = app_core._live_data_node(True)(state)
+        elapsed = time.perf_counter() - t0
+    assert len(out["flights"]) == len(CITIES) - 1
+    return elapsed
+
+
+def main():
+    total = 0.2 + 0.35 + 0.25 + 0.3 + 4 * 2 * 0.15
+    slowest = max(0.35, 2 * 0.15)
+    seq = _run(1)
+    conc = _run(8)
+    print(f"sum of call latencies : {total:.3f}s")
+    print(f"slowest single task   : {slowest:.3f}s")
+    print(f"sequential (1 worker) : {seq:.3f}s")
+    print(f"concurrent (8 workers): {conc:.3f}s  ({seq / conc:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
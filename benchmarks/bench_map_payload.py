@@ -0,0 +1,74 @@
+"""Response payload size and serialization time for each map output mode.
+
+Runs the offline pipeline (see `bench_pipeline`) once per trip size and
+`map_format`, then reports the JSON size of the plan response, the time to
+serialize it, and the cost of the map node with a cold and a warm render
+cache. `html` is the previous behaviour; `geojson` and `none` are the
+lightweight modes.
+
+    python -m benchmarks.bench_map_payload
+"""
+import argparse
+import json
+import time
+
+import app_core
+import map_gen
+from benchmarks.bench_pipeline import offline_pipeline, trip
+from map_gen import MAP_FORMATS
+
+
+def _ms(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / repeat
+
+
+def run(sizes=(2, 5, 15), repeat: int = 50) -> list:
+    rows = []
+    planner = app_core.get_planner(use_live=True, use_rag=True)
+    with offline_pipeline():
+        for n in sizes:
+            state = trip(n)
+            cities = [c.strip() for c in state["inputs"]["destinations"].split("->")]
+            for fmt in MAP_FORMATS:
+                out = planner.invoke({"inputs": {**state["inputs"], "map_format": fmt}})
+                out.pop("timings", None)  # varies per run; not part of the comparison
+                body = json.dumps(out, default=str)
+                map_state = {"inputs": {"map_format": fmt}, "summary": {"cities": cities}}
+
+                def cold():
+                    map_gen._render_html.cache_clear()
+                    app_core._map_node(map_state)
+
+                rows.append({
+                    "cities": n,
+                    "map_format": fmt,
+                    "payload_kb": round(len(body.encode()) / 1024, 1),
+                    "serialize_ms": round(_ms(lambda: json.dumps(out, default=str), repeat), 3),
+                    "map_cold_ms": round(_ms(cold, max(repeat // 5, 1)), 3),
+                    "map_warm_ms": round(_ms(lambda: app_core._map_node(map_state), repeat), 3),
+                })
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Plan response size per map output mode.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[2, 5, 15])
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = run(args.sizes, args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'cities':>6} {'format':>8} {'payload KB':>11} {'serialize ms':>13} {'map cold ms':>12} {'map warm ms':>12}")
+    for r in rows:
+        print(f"{r['cities']:>6} {r['map_format']:>8} {r['payload_kb']:>11} {r['serialize_ms']:>13} "
+              f"{r['map_cold_ms']:>12} {r['map_warm_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
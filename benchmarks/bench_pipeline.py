@@ -0,0 +1,228 @@
+"""Offline end-to-end benchmark and regression gate for the planning pipeline.
+
+Runs `get_planner(use_live=True, use_rag=True).invoke` with everything
+external replaced by local stand-ins: the real Amadeus SDK talking to a
+replay transport serving recorded JSON (with configurable latency), a stub
+LLM with configurable tokens/sec for both Bedrock and Flan-T5, hashed
+embeddings and a small fixture vector store. For 2, 5 and 15 city trips it
+records latency percentiles, throughput and peak RSS, compares them with a
+saved baseline and exits non-zero when a metric regresses past the
+threshold.
+
+    python -m benchmarks.bench_pipeline                   # compare with the baseline
+    python -m benchmarks.bench_pipeline --save-baseline   # record a new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import app_core
+from benchmarks.replay_amadeus import ReplayTransport
+from benchmarks.stubs import HashEmbeddings, StubLLM, WordTokenizer, fixture_store
+from integrations import amadeus_api
+from utils import llm as llm_module
+from utils.batching import BatchGenerationEngine
+from utils.model_registry import current_rss_bytes, registry
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "pipeline.json")
+CITIES = ["Paris", "Rome", "London", "Delhi", "Tokyo", "Berlin", "Madrid", "Lisbon",
+          "Vienna", "Prague", "Athens", "Dublin", "Amsterdam", "Barcelona", "Budapest"]
+SIZES = (2, 5, 15)
+# metric -> True when higher is worse
+GATED = {"p50_ms": True, "p95_ms": True, "throughput_rps": False, "peak_rss_mb": True}
+
+
+def trip(n_cities: int) -> dict:
+    start = date(2025, 9, 10)
+    return {"inputs": {
+        "destinations": " -> ".join(CITIES[:n_cities]),
+        "dates": ",".join(str(start + timedelta(days=2 * i)) for i in range(n_cities - 1)),
+        "budget": 500 * n_cities,
+        "interests": "food, museums, walking",
+    }}
+
+
+def _pct(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class _PeakRss:
+    """Samples RSS on a background thread while the block runs."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+@contextmanager
+def offline_pipeline(amadeus_latency=0.03, tokens_per_sec=2000.0, prefill_tokens_per_sec=20000.0,
+                     completion_tokens=200, busy_llm=False):
+    """Install the local stand-ins for the duration of the block; yields the replay transport.
+
+    `busy_llm` makes the stub LLM burn CPU instead of sleeping (see `StubLLM`).
+    """
+    transport = ReplayTransport(latency=amadeus_latency)
+    llm = StubLLM(tokens_per_sec, prefill_tokens_per_sec, completion_tokens, busy=busy_llm)
+    embeddings = HashEmbeddings()
+    engine = BatchGenerationEngine(llm.generate_batch, max_batch_size=8, max_wait_ms=15)
+    embed_engine = BatchGenerationEngine(lambda texts, _caps: embeddings.embed_documents(texts),
+                                         max_batch_size=32, max_wait_ms=2)
+    shared = {
+        "minilm": embeddings,
+        "chroma": fixture_store(embeddings),
+        "flan_t5_tokenizer": WordTokenizer(),
+        "generation_engine": engine,
+        "embedding_engine": embed_engine,
+        # Measure the work, not the answer caches
+        "itinerary_cache": None,
+        "rag_answer_cache": None,
+    }
+    amadeus_api.reset_client()
+    amadeus_api.clear_caches()
+    try:
+        with patch.dict(os.environ, {"AMAD_CLIENT_ID": "bench", "AMAD_CLIENT_SECRET": "bench"}), \
+             patch.object(amadeus_api, "_PooledHTTP", lambda: transport), \
+             patch.object(amadeus_api, "CACHE_ENABLED", False), \
+             patch.object(amadeus_api, "RATE_LIMIT", 0), \
+             patch.dict(amadeus_api._buckets, clear=True), \
+             patch.object(llm_module, "USE_BEDROCK", True), \
+             patch.object(llm_module, "_bedrock", lambda: llm), \
+             patch.object(app_core, "build_retriever_if_needed", lambda: None), \
+             patch.dict(registry._instances, shared):
+            yield transport
+    finally:
+        engine.close()
+        embed_engine.close()
+        amadeus_api.reset_client()
+
+
+def run_scenario(n_cities: int, requests: int = 20, concurrency: int = 4) -> dict:
+    """Latency percentiles (sequential), throughput (`concurrency` clients) and peak RSS."""
+    planner = app_core.get_planner(use_live=True, use_rag=True)
+    state = trip(n_cities)
+    planner.invoke(dict(state))  # warm-up
+
+    def one():
+        t0 = time.perf_counter()
+        out = planner.invoke(dict(state))
+        assert out.get("itinerary_text"), "pipeline produced no itinerary"
+        return (time.perf_counter() - t0) * 1000
+
+    rss_start = current_rss_bytes()
+    with _PeakRss() as rss:
+        latencies = [one() for _ in range(requests)]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: one(), range(requests)))
+        wall = time.perf_counter() - t0
+
+    return {
+        "cities": n_cities,
+        "requests": requests,
+        "p50_ms": round(_pct(latencies, 50), 2),
+        "p95_ms": round(_pct(latencies, 95), 2),
+        "p99_ms": round(_pct(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "throughput_rps": round(requests / wall, 2),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "rss_growth_mb": round(max(rss.peak - rss_start, 0) / 2 ** 20, 1),
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Regressions of gated metrics beyond `threshold` (a fraction), as messages."""
+    problems = []
+    for size, base in baseline.get("scenarios", {}).items():
+        now = current["scenarios"].get(size)
+        if now is None:
+            continue
+        for metric, higher_is_worse in GATED.items():
+            if metric not in base or not base[metric]:
+                continue
+            change = (now[metric] - base[metric]) / base[metric]
+            if (change if higher_is_worse else -change) > threshold:
+                problems.append(
+                    f"{size} cities: {metric} {base[metric]} -> {now[metric]} ({change:+.0%}, limit {threshold:.0%})"
+                )
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline pipeline benchmark with regression gate.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="trip sizes in cities")
+    ap.add_argument("--requests", type=int, default=20, help="requests per phase and size")
+    ap.add_argument("--concurrency", type=int, default=4, help="clients in the throughput phase")
+    ap.add_argument("--amadeus-latency", type=float, default=0.03, help="seconds per replayed Amadeus call")
+    ap.add_argument("--tokens-per-sec", type=float, default=2000, help="stub LLM decode rate")
+    ap.add_argument("--baseline", default=BASELINE, help="baseline JSON to compare with / save to")
+    ap.add_argument("--save-baseline", action="store_true", help="write results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed regression, as a fraction")
+    ap.add_argument("--output", help="also write results to this JSON file")
+    args = ap.parse_args(argv)
+
+    results = {
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency,
+            "amadeus_latency": args.amadeus_latency, "tokens_per_sec": args.tokens_per_sec,
+        },
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "scenarios": {},
+    }
+    with offline_pipeline(args.amadeus_latency, args.tokens_per_sec):
+        for size in args.sizes:
+            r = run_scenario(size, args.requests, args.concurrency)
+            results["scenarios"][str(size)] = r
+            print(f"{size:>2} cities: p50 {r['p50_ms']:8.1f} ms  p95 {r['p95_ms']:8.1f} ms  "
+                  f"p99 {r['p99_ms']:8.1f} ms  {r['throughput_rps']:6.2f} req/s  peak RSS {r['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print("warning: baseline was recorded with different settings", baseline.get("config"))
+    problems = compare(results, baseline, args.threshold)
+    for p in problems:
+        print("REGRESSION:", p)
+    if not problems:
+        print(f"no regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
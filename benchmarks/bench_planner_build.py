@@ -0,0 +1,44 @@
+"""Per-request planner overhead: rebuilding the graph vs the cached compiled graph.
+
+All external calls (LLM, map rendering) are stubbed so the numbers reflect
+graph construction and LangGraph dispatch only.
+
+    python -m benchmarks.bench_planner_build
+"""
+import statistics
+import time
+from unittest.mock import patch
+
+import app_core
+
+N = 200
+STATE = {"inputs": {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 2000, "interests": "food"}}
+
+
+def _time(fn, n=N):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), statistics.mean(samples)
+
+
+def main():
+    with patch.object(app_core, "compose_itinerary_llm", lambda **kw: "plan"), \
+         patch.object(app_core, "generate_map_html", lambda cities: ""):
+        build_med, _ = _time(lambda: app_core._build_planner(False, False))
+        app_core.get_planner(False, False)
+        cached_med, _ = _time(lambda: app_core.get_planner(False, False), n=N * 10)
+        before_med, _ = _time(lambda: app_core._build_planner(False, False).invoke(dict(STATE)))
+        after_med, _ = _time(lambda: app_core.get_planner(False, False).invoke(dict(STATE)))
+
+    print(f"graph construction      : {build_med:.3f} ms/request (median)")
+    print(f"cached lookup           : {cached_med * 1000:.2f} us/request (median)")
+    print(f"request, rebuild graph  : {before_med:.3f} ms (median)")
+    print(f"request, cached graph   : {after_med:.3f} ms (median)")
+    print(f"saved per request       : {before_med - after_med:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
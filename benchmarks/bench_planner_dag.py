@@ -0,0 +1,69 @@
+"""End-to-end latency of the planner DAG vs the old strictly sequential chain.
+
+Node work is replaced by sleeps (live data, RAG, compose, map), so the DAG
+should finish in about max(live, rag) + compose while the chain pays the sum.
+
+    python -m benchmarks.bench_planner_dag
+"""
+import time
+from unittest.mock import patch
+
+from langgraph.graph import StateGraph, START, END
+
+import app_core
+from app_core import TripState
+
+LIVE, RAG, COMPOSE, MAP = 0.4, 0.3, 0.2, 0.15
+STATE = {"inputs": {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 2000, "interests": "food"}}
+
+
+def _sleepy(seconds, value):
+    def fn(*args, **kwargs):
+        time.sleep(seconds)
+        return value
+    return fn
+
+
+def _chain_planner():
+    # The pre-DAG wiring: parse_inputs -> live_data -> rag -> compose -> map
+    graph = StateGraph(TripState)
+    graph.add_node("parse_inputs", app_core._parse_inputs)
+    graph.add_node("live_data", app_core._live_data_node(True))
+    graph.add_node("rag", app_core._rag_node(True))
+    graph.add_node("compose", app_core._compose_node)
+    graph.add_node("map", app_core._map_node)
+    graph.add_edge(START, "parse_inputs")
+    graph.add_edge("parse_inputs", "live_data")
+    graph.add_edge("live_data", "rag")
+    graph.add_edge("rag", "compose")
+    graph.add_edge("compose", "map")
+    graph.add_edge("map", END)
+    return graph.compile()
+
+
+def _time(planner):
+    t0 = time.perf_counter()
+    out = planner.invoke(dict(STATE))
+    elapsed = time.perf_counter() - t0
+    assert out["itinerary_text"] == "plan" and out["rag_tips"] == "tips"
+    return elapsed
+
+
+def main():
+    with patch.object(app_core, "search_flights", _sleepy(LIVE, [{"id": "1"}])), \
+         patch.object(app_core, "search_hotels", _sleepy(LIVE, [{"name": "H"}])), \
+         patch.object(app_core, "build_retriever_if_needed", lambda: None), \
+         patch.object(app_core, "rag_query", _sleepy(RAG, "tips")), \
+         patch.object(app_core, "compose_itinerary_llm", _sleepy(COMPOSE, "plan")), \
+         patch.object(app_core, "generate_map_html", _sleepy(MAP, "<div/>")):
+        chain = _time(_chain_planner())
+        dag = _time(app_core._build_planner(True, True))
+
+    print(f"stage delays: live={LIVE}s rag={RAG}s compose={COMPOSE}s map={MAP}s")
+    print(f"sequential chain : {chain:.3f}s (sum = {LIVE + RAG + COMPOSE + MAP:.2f}s)")
+    print(f"parallel DAG     : {dag:.3f}s (max(live, rag) + compose = {max(LIVE, RAG) + COMPOSE:.2f}s)")
+    print(f"speedup          : {chain / dag:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
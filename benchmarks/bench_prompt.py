@@ -0,0 +1,84 @@
+"""Itinerary prompt size before and after compact serialization.
+
+Fetches flights and hotels for 2, 5 and 15 city trips through the live-data
+node against the recorded Amadeus responses (see `bench_pipeline`), takes
+RAG tips from the fixture blog chunks, and builds both the previous prompt
+(raw Python reprs of the offers) and the current one. Sizes use the same
+`estimate_tokens` counter for both.
+
+    python -m benchmarks.bench_prompt
+"""
+import argparse
+import json
+
+import app_core
+from benchmarks.bench_pipeline import offline_pipeline, trip
+from benchmarks.stubs import BLOG_CHUNKS
+from utils.llm import _build_prompt
+from utils.prompt import estimate_tokens, trip_sections
+
+
+def legacy_prompt(cities, hops, interests, budget, flights, hotels, rag_tips) -> str:
+    """The itinerary prompt as it was built before `utils.prompt` (PROMPT_VERSION 1)."""
+    return f"""
+You are a travel planner. Build a concise day-by-day itinerary.
+
+Cities: {cities}
+Hops: {hops}
+Budget (USD): {budget}
+Interests: {interests}
+
+Flight offers (may be empty): {flights}
+Hotel offers (may be empty): {hotels}
+
+Incorporate these crowd tips (if any):
+{rag_tips}
+
+Return a readable plan with days, activities, brief reasons, and where useful, tie to flights/hotels.
+"""
+
+
+def run(sizes=(2, 5, 15)) -> list:
+    with open(BLOG_CHUNKS) as f:
+        tips = "\n\n".join(c["text"] for c in json.load(f)[:8])
+    rows = []
+    with offline_pipeline(amadeus_latency=0.0):
+        for n in sizes:
+            state = trip(n)
+            state.update(app_core._parse_inputs(state))
+            live = app_core._live_data_node(True)(state)
+            s = state["summary"]
+            args = (s["cities"], s["hops"], s["interests"], s["budget"], live["flights"], live["hotels"], tips)
+            sections = trip_sections(s["hops"], live["flights"], live["hotels"], tips)
+            rows.append({
+                "cities": n,
+                "before_flights": estimate_tokens(str(live["flights"])),
+                "after_flights": estimate_tokens(sections["flights"]),
+                "before_hotels": estimate_tokens(str(live["hotels"])),
+                "after_hotels": estimate_tokens(sections["hotels"]),
+                "before_total": estimate_tokens(legacy_prompt(*args)),
+                "after_total": estimate_tokens(_build_prompt(*args)),
+            })
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Itinerary prompt tokens before/after compact serialization.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[2, 5, 15])
+    ap.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = run(args.sizes)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'cities':>6} {'flights':>17} {'hotels':>17} {'total':>17} {'saved':>6}")
+    for r in rows:
+        saved = 1 - r["after_total"] / r["before_total"]
+        print(f"{r['cities']:>6} {r['before_flights']:>7} -> {r['after_flights']:<6} "
+              f"{r['before_hotels']:>7} -> {r['after_hotels']:<6} "
+              f"{r['before_total']:>7} -> {r['after_total']:<6} {saved:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Recall@k versus latency for the retrieval modes on a synthetic corpus.
+
+Builds N synthetic chunk embeddings (default 100k, 384 dimensions like
+MiniLM) clustered around per-city topics, roughly a third of them tagged
+with one or two cities. The ground truth for each query is an exact
+top-k scan. The benchmark then measures:
+
+- exact scan, one query per call and batched
+- exact scan with the city pre-filter (recall against the filtered truth)
+- Chroma HNSW over a grid of `M` and `ef_search` (when chromadb is installed)
+
+    python -m benchmarks.bench_retrieval [--chunks 100000] [--queries 200] [--k 10]
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.stubs import _NumpyCollection
+from rag.retrieval import RetrievalService, city_flags
+
+CITIES = [f"C{i:02d}" for i in range(50)]
+
+
+def corpus(n: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(CITIES), dim)).astype(np.float32)
+    topic = rng.integers(0, len(CITIES), n)
+    vecs = centers[topic] + 1.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    metas = []
+    for i in range(n):
+        r = rng.random()
+        codes = [] if r < 0.65 else [CITIES[topic[i]]] if r < 0.9 else [CITIES[topic[i]], CITIES[rng.integers(len(CITIES))]]
+        metas.append(city_flags(codes))
+    return vecs, metas, centers
+
+
+def queries(centers, n: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(centers), n)
+    q = centers[picks] + 1.5 * rng.standard_normal((n, centers.shape[1])).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return q, [CITIES[p] for p in picks]
+
+
+def _recall(found, truth) -> float:
+    return statistics.mean(len(set(f) & set(t)) / len(t) for f, t in zip(found, truth) if t)
+
+
+def _ids(results):
+    # Chunk text is its row number in the synthetic corpus
+    return [[text for text, _ in r] for r in results]
+
+
+def _measure(name, search, qs, truth, batch: int = 1) -> dict:
+    latencies, found = [], []
+    for start in range(0, len(qs), batch):
+        t0 = time.perf_counter()
+        found += _ids(search(qs[start:start + batch]))
+        latencies.append((time.perf_counter() - t0) * 1000 / len(qs[start:start + batch]))
+    latencies.sort()
+    return {"config": name, "recall": round(_recall(found, truth), 4),
+            "p50_ms": round(latencies[len(latencies) // 2], 3),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3)}
+
+
+def _chroma_rows(vecs, metas, docs, qs, truth, k, grid_m, grid_ef):
+    try:
+        import chromadb
+    except ImportError:
+        print("chromadb is not installed; skipping the HNSW grid")
+        return []
+    rows = []
+    client = chromadb.EphemeralClient()
+    for m in grid_m:
+        name = f"bench_hnsw_m{m}"
+        collection = client.get_or_create_collection(
+            name, metadata={"hnsw:space": "ip", "hnsw:M": m, "hnsw:construction_ef": 200})
+        t0 = time.perf_counter()
+        for start in range(0, len(docs), 5000):
+            end = start + 5000
+            collection.add(ids=docs[start:end], documents=docs[start:end],
+                           embeddings=vecs[start:end].tolist(), metadatas=[mm or {"_": 0} for mm in metas[start:end]])
+        print(f"built HNSW M={m} over {len(docs)} chunks in {time.perf_counter() - t0:.1f}s")
+        for ef in grid_ef:
+            service = RetrievalService(collection, mode="hnsw", ef_search=ef)
+            rows.append(_measure(f"hnsw M={m} ef={ef}", lambda q: service.search(q, k), qs, truth))
+        client.delete_collection(name)
+    return rows
+
+
+def run(n_chunks=100_000, dim=384, n_queries=200, k=10, grid_m=(16, 32), grid_ef=(10, 32, 64, 128, 256)):
+    vecs, metas, centers = corpus(n_chunks, dim)
+    docs = [str(i) for i in range(n_chunks)]
+    qs, cities = queries(centers, n_queries)
+    service = RetrievalService(_NumpyCollection(docs, docs, vecs, metas), mode="exact")
+    truth = _ids(service.search(qs, k))
+
+    rows = [
+        _measure("exact", lambda q: service.search(q, k), qs, truth),
+        _measure("exact batch=32", lambda q: service.search(q, k), qs, truth, batch=32),
+    ]
+    # Pre-filtered: compared with the exact answer over the same filtered subset
+    filtered = RetrievalService(_NumpyCollection(docs, docs, vecs, metas), mode="exact")
+    filtered_truth = [_ids(filtered.search(qs[i:i + 1], k, [c]))[0] for i, c in enumerate(cities)]
+    i = iter(cities)
+    rows.append(_measure("exact + city filter", lambda q: filtered.search(q, k, [next(i)]), qs, filtered_truth))
+    rows += _chroma_rows(vecs, metas, docs, qs, truth, k, grid_m, grid_ef)
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Recall@k vs latency for exact, filtered and HNSW retrieval.")
+    ap.add_argument("--chunks", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = run(args.chunks, args.dim, args.queries, args.k)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'config':<22} {'recall@' + str(args.k):>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for r in rows:
+        print(f"{r['config']:<22} {r['recall']:>10} {r['p50_ms']:>9} {r['p95_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
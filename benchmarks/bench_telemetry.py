@@ -0,0 +1,61 @@
+"""Cost of the built-in instrumentation on a stubbed planner request.
+
+Compares the planner with telemetry off (TELEMETRY=false: nodes unwrapped,
+spans are bare yields), on (metrics + per-request timings) and on with span
+export to a trace file.
+
+    python -m benchmarks.bench_telemetry
+"""
+import os
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+import app_core
+from utils import telemetry
+
+N = 300
+STATE = {"inputs": {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 2000, "interests": "food"}}
+
+
+def _time(fn, n=N):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def _request_ms(enabled: bool, trace_file=None) -> float:
+    with patch.object(telemetry, "TELEMETRY_ENABLED", enabled), \
+         patch.object(app_core, "TELEMETRY_ENABLED", enabled), \
+         patch.object(telemetry, "TRACE_FILE", trace_file), \
+         patch.object(telemetry, "_trace_fh", None):
+        planner = app_core._build_planner(False, False)
+        planner.invoke(dict(STATE))
+        return _time(lambda: planner.invoke(dict(STATE)))
+
+
+def main():
+    with patch.object(app_core, "compose_itinerary_llm", lambda **kw: "plan"), \
+         patch.object(app_core, "generate_map_html", lambda cities: ""):
+        off = _request_ms(False)
+        on = _request_ms(True)
+        with tempfile.TemporaryDirectory() as tmp:
+            traced = _request_ms(True, os.path.join(tmp, "spans.jsonl"))
+
+    def one_span():
+        with telemetry.span("bench.call"):
+            pass
+    span_us = _time(one_span, n=N * 20) * 1000
+
+    print(f"request, telemetry off  : {off:.3f} ms (median)")
+    print(f"request, metrics only   : {on:.3f} ms (+{on - off:.3f} ms)")
+    print(f"request, spans to file  : {traced:.3f} ms (+{traced - off:.3f} ms)")
+    print(f"single span (metrics)   : {span_us:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
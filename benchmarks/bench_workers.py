@@ -0,0 +1,108 @@
+"""Throughput scaling of the forked worker pool across 1, 2, 4 and 8 processes.
+
+Runs 3-city trips on the offline pipeline from `bench_pipeline` with the
+stub LLM in busy mode, so Flan-T5 and Bedrock time is spent computing
+with the GIL held, as CPU inference would. A block of random "weights"
+(`--model-mb`) is loaded into the model registry before forking and
+stands in for the models the workers share.
+
+For each pool size it reports trips per second, the speedup over one
+worker, and memory: parent RSS, then RSS and private (unshared) memory
+per worker. With copy-on-write sharing, a worker's private memory stays
+far below the size of the weights. The first row plans the same trips on
+threads in one process for comparison.
+
+Scaling is bounded by the cores available; the machine's CPU count is
+printed with the results.
+
+    python -m benchmarks.bench_workers [--procs 1 2 4 8] [--trips 48] [--model-mb 256]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import numpy as np
+
+import app_core
+from benchmarks.bench_pipeline import offline_pipeline, trip
+from utils.model_registry import current_rss_bytes, registry
+from utils.worker_pool import WorkerPool
+
+MB = 2 ** 20
+
+
+def _threads(inputs, concurrency) -> float:
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: app_core.plan(i, True, True), inputs))
+    return time.perf_counter() - t0
+
+
+def _pool(inputs, processes) -> tuple:
+    pool = WorkerPool(app_core.JOBS, processes=processes, max_queue=len(inputs), job_timeout=300).start()
+    try:
+        # One job per worker first, so every worker has run the pipeline once
+        for f in [pool.submit("plan", inputs[0], True, True) for _ in range(processes)]:
+            f.result()
+        t0 = time.perf_counter()
+        for f in [pool.submit("plan", i, True, True) for i in inputs]:
+            f.result()
+        wall = time.perf_counter() - t0
+        return wall, pool.stats()
+    finally:
+        pool.close()
+
+
+def run(procs=(1, 2, 4, 8), n_trips=48, model_mb=256, amadeus_latency=0.03, tokens_per_sec=2000.0) -> list:
+    inputs = [trip(3)["inputs"] for _ in range(n_trips)]
+    rows = []
+    with offline_pipeline(amadeus_latency, tokens_per_sec, busy_llm=True), patch.dict(registry._instances):
+        registry._instances["bench_weights"] = np.random.default_rng(0).random(model_mb * MB // 8)
+        app_core.warm_planners()
+        parent_rss = current_rss_bytes()
+        wall = _threads(inputs, max(procs))
+        rows.append({"mode": f"threads x{max(procs)}", "processes": 1, "trips_per_s": round(n_trips / wall, 2),
+                     "parent_rss_mb": round(parent_rss / MB, 1)})
+        for n in procs:
+            wall, stats = _pool(inputs, n)
+            rows.append({
+                "mode": "workers",
+                "processes": n,
+                "trips_per_s": round(n_trips / wall, 2),
+                "parent_rss_mb": round(parent_rss / MB, 1),
+                "worker_rss_mb": round(stats["worker_rss_bytes"] / n / MB, 1),
+                "worker_private_mb": round(stats["worker_private_bytes"] / n / MB, 1),
+            })
+    base = next(r["trips_per_s"] for r in rows if r["mode"] == "workers")
+    for r in rows:
+        r["speedup"] = round(r["trips_per_s"] / base, 2)
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Worker pool throughput scaling and memory sharing.")
+    ap.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--trips", type=int, default=48)
+    ap.add_argument("--model-mb", type=int, default=256, help="size of the shared stand-in weights")
+    ap.add_argument("--amadeus-latency", type=float, default=0.03, help="seconds per replayed Amadeus call")
+    ap.add_argument("--tokens-per-sec", type=float, default=2000, help="stub LLM decode rate")
+    ap.add_argument("--json", action="store_true", help="print rows as JSON")
+    args = ap.parse_args(argv)
+
+    rows = run(args.procs, args.trips, args.model_mb, args.amadeus_latency, args.tokens_per_sec)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"cpus: {os.cpu_count()}")
+    print(f"{'mode':<11} {'procs':>5} {'trips/s':>8} {'speedup':>8} {'parent MB':>10} "
+          f"{'RSS/worker':>11} {'private/worker':>15}")
+    for r in rows:
+        print(f"{r['mode']:<11} {r['processes']:>5} {r['trips_per_s']:>8} {r['speedup']:>8} "
+              f"{r['parent_rss_mb']:>10} {r.get('worker_rss_mb', '-'):>11} {r.get('worker_private_mb', '-'):>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Latency-injecting stand-in for `amadeus.Client`, used by the offline benchmarks."""
+import threading
+import time
+from types import SimpleNamespace
+
+
+class _Endpoint:
+    def __init__(self, owner, name, make_data):
+        self._owner = owner
+        self._name = name
+        self._make_data = make_data
+
+    def get(self, **params):
+        self._owner._record(self._name, params)
+        time.sleep(self._owner.latency_for(self._name, params))
+        return SimpleNamespace(data=self._make_data(params))
+
+
+def _flight_offers(params):
+    origin, dest = params["originLocationCode"], params["destinationLocationCode"]
+    return [
+        {
+            "id": str(n),
+            "price": {"total": f"{120 + 15 * n:.2f}", "currency": "EUR"},
+            "itineraries": [{
+                "duration": "PT2H",
+                "segments": [{
+                    "departure": {"iataCode": origin, "at": f"{params['departureDate']}T0{8 + n}:00:00"},
+                    "arrival": {"iataCode": dest, "at": f"{params['departureDate']}T1{n}:00:00"},
+                    "carrierCode": "XX",
+                    "number": str(100 + n),
+                    "duration": "PT2H",
+                }],
+            }],
+        }
+        for n in range(1, params.get("max", 3) + 1)
+    ]
+
+
+def _hotel_list(params, count=10):
+    return [{"hotelId": f"{params['cityCode']}H{n:03d}"} for n in range(1, count + 1)]
+
+
+def _hotel_offers(params):
+    return [
+        {
+            "hotel": {"hotelId": hid, "name": f"Hotel {hid}", "rating": "4"},
+            "offers": [{
+                "checkInDate": params["checkInDate"],
+                "checkOutDate": params["checkOutDate"],
+                "price": {"total": "180.00", "currency": "EUR"},
+            }],
+        }
+        for hid in str(params["hotelIds"]).split(",")
+    ]
+
+
+class FakeAmadeus:
+    """Mimics the subset of the Amadeus SDK used by `integrations.amadeus_api`.
+
+    `latency` is a fixed delay in seconds, or a callable
+    `(endpoint_name, params) -> seconds` for per-call latency.
+    `hotels_per_city` sets the size of each city's hotel list.
+    """
+
+    def __init__(self, latency=0.0, hotels_per_city=10):
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+        self.shopping = SimpleNamespace(
+            flight_offers_search=_Endpoint(self, "flight_offers", _flight_offers),
+            hotel_offers_search=_Endpoint(self, "hotel_offers", _hotel_offers),
+        )
+        self.reference_data = SimpleNamespace(
+            locations=SimpleNamespace(
+                hotels=SimpleNamespace(by_city=_Endpoint(
+                    self, "hotel_list", lambda params: _hotel_list(params, hotels_per_city)))
+            )
+        )
+
+    def latency_for(self, name, params):
+        return self.latency(name, params) if callable(self.latency) else self.latency
+
+    def _record(self, name, params):
+        with self._lock:
+            self.calls.append((name, dict(params)))
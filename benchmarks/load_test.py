@@ -0,0 +1,85 @@
+"""Local load test of the A2A -> MCP -> planner path with all external services stubbed.
+
+Both FastAPI apps run in-process over httpx's ASGI transport; the planner's
+Amadeus, LLM and map calls are replaced by fixed sleeps. For each
+concurrency level it reports latency percentiles, throughput, and how many
+requests were shed with 503 + Retry-After.
+
+    python -m benchmarks.load_test [--requests-per-client 5]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from unittest.mock import patch
+
+import httpx
+
+import a2a_server
+import app_core
+import mcp_server
+
+PAYLOAD = {
+    "action": "plan_trip",
+    "payload": {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 2000,
+                "interests": "food", "use_live": True},
+}
+
+
+def _sleepy(seconds, value):
+    def fn(*args, **kwargs):
+        time.sleep(seconds)
+        return value
+    return fn
+
+
+def _pct(samples, p):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def _run_level(concurrency, per_client):
+    latencies, status = [], {}
+
+    async def client(http):
+        for _ in range(per_client):
+            t0 = time.perf_counter()
+            r = await http.post("http://a2a/a2a", json=PAYLOAD)
+            status[r.status_code] = status.get(r.status_code, 0) + 1
+            if r.status_code == 200:
+                latencies.append((time.perf_counter() - t0) * 1000)
+            elif "Retry-After" in r.headers:
+                await asyncio.sleep(0.01)
+
+    a2a_server._http = httpx.AsyncClient(transport=httpx.ASGITransport(app=mcp_server.app), timeout=60)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=a2a_server.app), timeout=60) as http:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        wall = time.perf_counter() - t0
+    await a2a_server._http.aclose()
+    a2a_server._http = None
+    return latencies, status, wall
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests-per-client", type=int, default=5)
+    args = ap.parse_args()
+
+    with patch.object(app_core, "search_flights", _sleepy(0.05, [{"id": "1"}])), \
+         patch.object(app_core, "search_hotels", _sleepy(0.05, [{"name": "H"}])), \
+         patch.object(app_core, "compose_itinerary_llm", _sleepy(0.1, "plan")), \
+         patch.object(app_core, "generate_map_html", _sleepy(0.01, "")):
+        app_core.warm_planners()
+        print(f"{'clients':>7} {'ok':>6} {'503':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+        for concurrency in (10, 50, 200):
+            lat, status, wall = asyncio.run(_run_level(concurrency, args.requests_per_client))
+            ok = status.get(200, 0)
+            print(f"{concurrency:>7} {ok:>6} {status.get(503, 0):>6} {_pct(lat, 50):>8.1f} "
+                  f"{_pct(lat, 95):>8.1f} {_pct(lat, 99):>8.1f} {ok / wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
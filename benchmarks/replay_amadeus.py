@@ -0,0 +1,53 @@
+"""Fake Amadeus server that replays recorded JSON responses.
+
+Unlike `FakeAmadeus`, which replaces the SDK client, this plugs in below it
+as the SDK's `http=` transport, so request building, OAuth and response
+parsing in the real `amadeus.Client` are exercised too.
+"""
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+RECORDINGS = os.path.join(os.path.dirname(__file__), "fixtures", "amadeus_recordings.json")
+
+
+class _Response:
+    def __init__(self, status: int, body: bytes):
+        self.status = status
+        self.code = status
+        self._body = body
+
+    def info(self):
+        return {"Content-Type": "application/vnd.amadeus+json"}
+
+    def read(self):
+        return self._body
+
+
+class ReplayTransport:
+    """`urlopen`-compatible callable serving recorded bodies by request path.
+
+    `latency` is a fixed delay in seconds, or a dict of path -> seconds
+    (missing paths get no delay). Unknown paths answer 404.
+    """
+
+    def __init__(self, path: str = RECORDINGS, latency=0.0):
+        with open(path) as f:
+            self._bodies = {p: json.dumps(body).encode() for p, body in json.load(f).items()}
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, http_request):
+        path = urlparse(http_request.full_url).path
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+        delay = self.latency.get(path, 0.0) if isinstance(self.latency, dict) else self.latency
+        if delay:
+            time.sleep(delay)
+        body = self._bodies.get(path)
+        if body is None:
+            return _Response(404, json.dumps({"errors": [{"status": 404, "title": "NOT FOUND"}]}).encode())
+        return _Response(200, body)
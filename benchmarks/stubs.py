@@ -0,0 +1,167 @@
+"""Local stand-ins for the models behind the planner, used by the offline benchmarks.
+
+`StubLLM` plays both Bedrock (`invoke` / `stream`) and Flan-T5 (as the
+batching engine's `generate_batch`), sleeping for a configurable prefill
+and decode rate. `HashEmbeddings`, `WordTokenizer` and `fixture_store`
+replace MiniLM, the Flan-T5 tokenizer and the Chroma store.
+"""
+import hashlib
+import json
+import os
+import time
+from types import SimpleNamespace
+from typing import List, Tuple
+
+BLOG_CHUNKS = os.path.join(os.path.dirname(__file__), "fixtures", "blog_chunks.json")
+DIM = 64
+
+
+class WordTokenizer:
+    """Whitespace tokenizer with the `encode`/`decode` subset the RAG path uses."""
+
+    pad_token_id = None
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> List[str]:
+        return text.split()
+
+    def decode(self, ids, skip_special_tokens: bool = True) -> str:
+        return " ".join(ids)
+
+
+class StubLLM:
+    """Deterministic LLM whose latency is set by tokens per second.
+
+    With `busy`, that time is spent spinning in Python (holding the GIL,
+    like CPU inference) instead of sleeping.
+    """
+
+    def __init__(self, tokens_per_sec: float = 2000, prefill_tokens_per_sec: float = 20000,
+                 completion_tokens: int = 200, busy: bool = False):
+        self.tokens_per_sec = tokens_per_sec
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.completion_tokens = completion_tokens
+        self.busy = busy
+
+    def _wait(self, seconds: float):
+        if not self.busy:
+            time.sleep(seconds)
+            return
+        # Thread CPU time, so a contended GIL stretches the wall time as real compute would
+        deadline = time.thread_time() + seconds
+        while time.thread_time() < deadline:
+            pass
+
+    def _text(self, prompt: str, n: int) -> str:
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return " ".join(f"tok{seed}{i}" for i in range(n))
+
+    def _delay(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return prompt_tokens / self.prefill_tokens_per_sec + completion_tokens / self.tokens_per_sec
+
+    def invoke(self, prompt: str):
+        prompt_tokens = len(prompt.split())
+        self._wait(self._delay(prompt_tokens, self.completion_tokens))
+        return SimpleNamespace(
+            content=self._text(prompt, self.completion_tokens),
+            usage_metadata={"input_tokens": prompt_tokens, "output_tokens": self.completion_tokens},
+        )
+
+    def stream(self, prompt: str):
+        self._wait(len(prompt.split()) / self.prefill_tokens_per_sec)
+        for word in self._text(prompt, self.completion_tokens).split():
+            self._wait(1 / self.tokens_per_sec)
+            yield SimpleNamespace(content=word + " ", usage_metadata=None)
+
+    def generate_batch(self, prompts: List[str], caps: List[int]) -> List[Tuple[str, int, int]]:
+        # One padded forward pass: prefill the longest prompt, decode the longest output
+        n = [min(cap, self.completion_tokens) for cap in caps]
+        self._wait(self._delay(max(len(p.split()) for p in prompts), max(n)))
+        return [(self._text(p, k), len(p.split()), k) for p, k in zip(prompts, n)]
+
+
+class HashEmbeddings:
+    """Hashed bag-of-words vectors; similar texts get similar vectors."""
+
+    def embed_query(self, text: str) -> List[float]:
+        vec = [0.0] * DIM
+        for word in text.lower().split():
+            h = int.from_bytes(hashlib.md5(word.strip(".,;:!?").encode()).digest()[:4], "little")
+            vec[h % DIM] += 1.0 if h & 1 << 31 else -1.0
+        norm = sum(v * v for v in vec) ** 0.5 or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(t) for t in texts]
+
+
+class _NumpyCollection:
+    """In-memory stand-in for a Chroma collection (`count`/`get`/`query`/`modify`) when chromadb is absent.
+
+    `where` supports the flag filters the retriever builds: `{key: value}`
+    and `{"$or": [...]}` of those.
+    """
+
+    metadata = {"hnsw:space": "ip"}
+
+    def __init__(self, ids, documents, embeddings, metadatas):
+        import numpy as np
+        self.ids, self.documents, self.metadatas = ids, documents, metadatas
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    def modify(self, metadata=None):
+        # HNSW settings mean nothing here; keep them like Chroma would
+        self.metadata = {**type(self).metadata, **(metadata or {})}
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, include=("documents", "metadatas")):
+        return {"ids": list(self.ids), "documents": list(self.documents),
+                "embeddings": self.embeddings, "metadatas": list(self.metadatas)}
+
+    def _where(self, where):
+        import numpy as np
+        if not where:
+            return np.ones(len(self.ids), dtype=bool)
+        clauses = where.get("$or", [where])
+        return np.array([any(all(m.get(k) == v for k, v in c.items()) for c in clauses) for m in self.metadatas],
+                        dtype=bool)
+
+    def query(self, query_embeddings, n_results=10, include=("documents",), where=None):
+        import numpy as np
+        out = {k: [] for k in ("ids", "documents", "embeddings", "metadatas", "distances")}
+        mask = self._where(where)
+        for q in np.asarray(query_embeddings, dtype=np.float32):
+            sims = np.where(mask, self.embeddings @ q, -np.inf)
+            order = [i for i in np.argsort(-sims)[:n_results] if mask[i]]
+            out["ids"].append([self.ids[i] for i in order])
+            out["documents"].append([self.documents[i] for i in order])
+            out["embeddings"].append(self.embeddings[order])
+            out["metadatas"].append([self.metadatas[i] for i in order])
+            out["distances"].append([float(1 - sims[i]) for i in order])
+        return out
+
+
+def fixture_store(embeddings: HashEmbeddings = None, path: str = BLOG_CHUNKS):
+    """Vector store over the fixture blog chunks, in chromadb when it is installed."""
+    embeddings = embeddings or HashEmbeddings()
+    with open(path) as f:
+        chunks = json.load(f)
+    ids = [hashlib.sha256(c["text"].encode("utf-8")).hexdigest() for c in chunks]
+    docs = [c["text"] for c in chunks]
+    from integrations.city_index import registry
+    from rag.retrieval import city_flags
+    index = registry.get("city_index")
+    metas = [
+        {"source": c["source"], "chunk_hash": i, **city_flags(city.code for city in index.find_in_text(c["text"]))}
+        for c, i in zip(chunks, ids)
+    ]
+    vecs = embeddings.embed_documents(docs)
+    try:
+        import chromadb
+        collection = chromadb.EphemeralClient().get_or_create_collection(
+            "bench_fixture", metadata={"hnsw:space": "ip"})
+        collection.upsert(ids=ids, documents=docs, embeddings=vecs, metadatas=metas)
+    except ImportError:
+        collection = _NumpyCollection(ids, docs, vecs, metas)
+    return SimpleNamespace(_collection=collection)
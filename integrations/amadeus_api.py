@@ -1,23 +1,418 @@
 import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.error import URLError
+import requests
+from requests.adapters import HTTPAdapter
 from amadeus import Client, ResponseError
+from amadeus.client.access_token import AccessToken
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import TTLCache, FRESH, STALE
+from utils.concurrency import SingleFlight, fan_out
+from utils.limiter import CircuitBreaker, TokenBucket, backoff_delay
+from utils.telemetry import cache_samples, metrics, span
+
+# Size of the keep-alive connection pool shared by all Amadeus calls
+HTTP_POOL_SIZE = int(os.getenv("AMAD_HTTP_POOL_SIZE", "16"))
+
+# Offer caches: fresh for *_CACHE_TTL seconds, then served stale for up to
+# AMAD_CACHE_STALE_SECONDS while a background refresh runs. Error results
+# are only kept for AMAD_ERROR_CACHE_TTL seconds.
+CACHE_ENABLED = os.getenv("AMAD_CACHE", "true").lower() in {"1", "true", "yes"}
+FLIGHT_CACHE_TTL = float(os.getenv("FLIGHT_CACHE_TTL", "300"))
+HOTEL_CACHE_TTL = float(os.getenv("HOTEL_CACHE_TTL", "900"))
+STALE_SECONDS = float(os.getenv("AMAD_CACHE_STALE_SECONDS", "600"))
+ERROR_CACHE_TTL = float(os.getenv("AMAD_ERROR_CACHE_TTL", "15"))
+CACHE_MAX_BYTES = int(os.getenv("AMAD_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_DB = os.getenv("AMAD_CACHE_DB") or None
+# Hotel lists per city barely change: keep them a day, then refresh in the background
+HOTEL_LIST_TTL = float(os.getenv("HOTEL_LIST_TTL", str(24 * 3600)))
+
+# Hotel offers are fetched for HOTEL_OFFER_CHUNK IDs per request, up to
+# HOTEL_OFFER_WORKERS requests at once and HOTEL_OFFER_MAX_CHUNKS per search
+HOTEL_OFFER_CHUNK = int(os.getenv("HOTEL_OFFER_CHUNK", "20"))
+HOTEL_OFFER_WORKERS = int(os.getenv("HOTEL_OFFER_WORKERS", "4"))
+HOTEL_OFFER_MAX_CHUNKS = int(os.getenv("HOTEL_OFFER_MAX_CHUNKS", "8"))
+HOTEL_OFFER_TIMEOUT = float(os.getenv("HOTEL_OFFER_TIMEOUT", "10"))
+
+# Client-side pacing per endpoint (requests/second and burst). AMAD_RATE_LIMITS
+# overrides single endpoints, e.g. "flight_offers=5,hotel_offers=2"; a call
+# that would wait longer than AMAD_RATE_MAX_WAIT seconds for a token fails.
+RATE_LIMIT = float(os.getenv("AMAD_RATE_LIMIT", "10"))
+RATE_BURST = int(os.getenv("AMAD_RATE_BURST", "10"))
+RATE_LIMITS = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.getenv("AMAD_RATE_LIMITS", "").split(","))
+    if name.strip() and rate
+}
+RATE_MAX_WAIT = float(os.getenv("AMAD_RATE_MAX_WAIT", "10"))
+
+# 429s, 5xx and network errors are retried with jittered exponential backoff
+# (honoring Retry-After); a Retry-After beyond AMAD_BACKOFF_MAX is not waited out
+MAX_RETRIES = int(os.getenv("AMAD_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("AMAD_BACKOFF_BASE", "0.2"))
+BACKOFF_MAX = float(os.getenv("AMAD_BACKOFF_MAX", "5"))
+
+# After AMAD_BREAKER_FAILURES consecutive upstream failures live search is
+# switched off for AMAD_BREAKER_RESET seconds, then probed again
+BREAKER_FAILURES = int(os.getenv("AMAD_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("AMAD_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_flight_cache = TTLCache("flights", FLIGHT_CACHE_TTL, STALE_SECONDS, max_entries=4096,
+                         max_bytes=CACHE_MAX_BYTES, sqlite_path=CACHE_DB)
+_hotel_cache = TTLCache("hotels", HOTEL_CACHE_TTL, STALE_SECONDS, max_entries=4096,
+                        max_bytes=CACHE_MAX_BYTES, sqlite_path=CACHE_DB)
+_hotel_list_cache = TTLCache("hotel_lists", HOTEL_LIST_TTL, HOTEL_LIST_TTL, max_entries=1024,
+                             max_bytes=CACHE_MAX_BYTES, sqlite_path=CACHE_DB)
+_refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="amadeus-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+_inflight = SingleFlight()
+
+_client_lock = threading.Lock()
+_shared_client = None
+_stats = {"clients_created": 0, "token_refreshes": 0, "http_requests": 0, "retries": 0}
+_stats_lock = threading.Lock()
+
+def _bump(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+class _PooledResponse:
+    """Adapts a `requests.Response` to the urlopen-style object the SDK parses."""
+
+    def __init__(self, resp: requests.Response):
+        self.status = resp.status_code
+        self.code = resp.status_code
+        self._resp = resp
+
+    def info(self):
+        # CaseInsensitiveDict, so the SDK's Content-Type lookup still works
+        return self._resp.headers
+
+    def read(self):
+        return self._resp.content
+
+class _PooledHTTP:
+    """`urlopen`-compatible transport backed by a keep-alive `requests.Session`."""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+
+    def __call__(self, http_request):
+        _bump("http_requests")
+        try:
+            resp = self.session.request(
+                http_request.get_method(),
+                http_request.full_url,
+                data=http_request.data,
+                headers=dict(http_request.header_items()),
+                timeout=30,
+            )
+        except requests.RequestException as e:
+            # The SDK turns a URLError into a NetworkError (no status), which `_request` retries
+            raise URLError(e)
+        return _PooledResponse(resp)
+
+    def connection_stats(self):
+        opened = requests_made = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                requests_made += pool.num_requests
+        return {"connections_opened": opened, "connections_reused": max(requests_made - opened, 0)}
+
+class _SharedAccessToken(AccessToken):
+    """Access token cached until expiry and refreshed by a single caller at a time."""
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._lock = threading.Lock()
+
+    def _needs_refresh(self):
+        return self.access_token is None or int(time.time()) + self.TOKEN_BUFFER >= self.expires_at
+
+    def _bearer_token(self):
+        if self._needs_refresh():
+            with self._lock:
+                # Whoever waited on the lock reuses the token the first caller fetched
+                if self._needs_refresh():
+                    res = self.client._unauthenticated_request(
+                        "POST",
+                        "/v1/security/oauth2/token",
+                        {
+                            "grant_type": "client_credentials",
+                            "client_id": self.client.client_id,
+                            "client_secret": self.client.client_secret,
+                        },
+                    )
+                    data = res.result or {}
+                    self.expires_at = int(time.time()) + data.get("expires_in", 0)
+                    self.access_token = data.get("access_token")
+                    _bump("token_refreshes")
+        return "Bearer {0}".format(self.access_token)
 
 def _client():
-    cid = os.getenv("AMAD_CLIENT_ID")
-    csec = os.getenv("AMAD_CLIENT_SECRET")
-    if not cid or not csec:
-        raise EnvironmentError("Set AMAD_CLIENT_ID and AMAD_CLIENT_SECRET in .env")
-    return Client(client_id=cid, client_secret=csec)
+    """Process-wide Amadeus client; token and HTTP connections are reused across calls."""
+    global _shared_client
+    if _shared_client is not None:
+        return _shared_client
+    with _client_lock:
+        if _shared_client is None:
+            cid = os.getenv("AMAD_CLIENT_ID")
+            csec = os.getenv("AMAD_CLIENT_SECRET")
+            if not cid or not csec:
+                raise EnvironmentError("Set AMAD_CLIENT_ID and AMAD_CLIENT_SECRET in .env")
+            c = Client(client_id=cid, client_secret=csec, http=_PooledHTTP())
+            # The SDK memoizes its token on this attribute; install the thread-safe one
+            c.access_token = _SharedAccessToken(c)
+            _shared_client = c
+            _bump("clients_created")
+    return _shared_client
+
+def reset_client():
+    """Drop the shared client (e.g. after rotating credentials)."""
+    global _shared_client
+    with _client_lock:
+        _shared_client = None
+
+def _after_fork():
+    # A forked worker (see utils.worker_pool) must not share the parent's sockets,
+    # token or refresh threads, nor inherit a lock held by another thread
+    global _shared_client, _client_lock, _refresh_pool, _refreshing_lock
+    _shared_client = None
+    _client_lock = threading.Lock()
+    _refreshing_lock = threading.Lock()
+    _refresh_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="amadeus-refresh")
+    _refreshing.clear()
+
+os.register_at_fork(after_in_child=_after_fork)
+
+class Unavailable(Exception):
+    """Raised instead of calling Amadeus when the circuit is open or pacing would wait too long."""
+
+def _bucket(endpoint: str) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(endpoint)
+        if bucket is None:
+            bucket = _buckets[endpoint] = TokenBucket(RATE_LIMITS.get(endpoint, RATE_LIMIT), RATE_BURST)
+        return bucket
+
+def _retry_after(e: ResponseError):
+    """Seconds from the Retry-After header of a failed response, if any."""
+    http = getattr(getattr(e, "response", None), "http_response", None)
+    headers = http.info() if hasattr(http, "info") else getattr(http, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+def _status(e: ResponseError):
+    return getattr(getattr(e, "response", None), "status_code", None)
+
+def _request(endpoint: str, call):
+    """Run `call(client)` under the endpoint's rate limit, retries and the circuit breaker.
+
+    The breaker permit is taken once for the call and all its retries, so a
+    half-open probe that is retried stays the one probe. Only upstream
+    failures count against the breaker; missing credentials or a bad call
+    on our side never open it.
+    """
+    try:
+        client = _client()
+    except EnvironmentError as e:
+        raise Unavailable(str(e)) from e
+    # Fail fast without queueing for a token while the circuit is open
+    if not breaker.allow():
+        raise Unavailable("Amadeus is unavailable, live search disabled")
+    for attempt in range(MAX_RETRIES + 1):
+        if not _bucket(endpoint).acquire(timeout=RATE_MAX_WAIT):
+            # Nothing went upstream on this attempt; let the next call probe instead
+            breaker.release()
+            raise Unavailable(f"Amadeus rate limit for {endpoint} exceeded")
+        try:
+            result = call(client)
+        except ResponseError as e:
+            status = _status(e)
+            # Network errors have no status; other 4xx are our request's fault, not upstream's
+            if status is not None and status not in RETRYABLE_STATUS:
+                breaker.record_success()
+                raise
+            retry_after = _retry_after(e)
+            if attempt == MAX_RETRIES or (retry_after or 0) > BACKOFF_MAX:
+                breaker.record_failure()
+                raise
+            _bump("retries")
+            metrics.inc("travel_amadeus_retries_total", help="Amadeus calls retried after a 429/5xx/network error",
+                        endpoint=endpoint, status=str(status or "network"))
+            time.sleep(backoff_delay(attempt, BACKOFF_BASE, BACKOFF_MAX, retry_after))
+        except OSError:
+            # A network error the SDK did not wrap
+            breaker.record_failure()
+            raise
+        except Exception:
+            # Our own error (bad arguments, a bug): upstream was not at fault
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+def live_search_available() -> bool:
+    """False while the circuit breaker is open (half-open lets the probe through)."""
+    return breaker.state != CircuitBreaker.OPEN
+
+def client_stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    for endpoint, bucket in buckets.items():
+        for key, value in bucket.stats().items():
+            out[f"rate_{key}_{endpoint}"] = value
+    http = getattr(_shared_client, "http", None)
+    if isinstance(http, _PooledHTTP):
+        out.update(http.connection_stats())
+    return out
+
+def _is_error(result) -> bool:
+    return bool(result) and isinstance(result[0], dict) and "error" in result[0]
+
+def _store(cache: TTLCache, key: str, result):
+    if _is_error(result):
+        cache.set(key, result, ttl=ERROR_CACHE_TTL, stale_ttl=0)
+    else:
+        cache.set(key, result)
+
+def _refresh(cache: TTLCache, key: str, fetch):
+    try:
+        result = fetch()
+        # Keep serving the stale copy rather than replacing it with an error
+        if not _is_error(result):
+            _store(cache, key, result)
+    except Exception:
+        pass
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard((cache.name, key))
+
+def _cached(cache: TTLCache, key: str, fetch):
+    """Serve from cache, refreshing stale entries in the background.
+
+    Concurrent misses for the same key share one upstream call.
+    """
+    if not CACHE_ENABLED:
+        return _inflight.do((cache.name, key), fetch)
+    value, state = cache.get(key)
+    if state == FRESH:
+        return value
+    if state == STALE:
+        with _refreshing_lock:
+            start = (cache.name, key) not in _refreshing
+            _refreshing.add((cache.name, key))
+        if start:
+            _refresh_pool.submit(_refresh, cache, key, fetch)
+        return value
+    def fetch_and_store():
+        result = fetch()
+        _store(cache, key, result)
+        return result
+    return _inflight.do((cache.name, key), fetch_and_store)
+
+def cache_stats() -> dict:
+    return {"flights": _flight_cache.stats(), "hotels": _hotel_cache.stats(),
+            "hotel_lists": _hotel_list_cache.stats()}
+
+def clear_caches():
+    _flight_cache.clear()
+    _hotel_cache.clear()
+    _hotel_list_cache.clear()
+
+def _metric_samples():
+    for name, stats in cache_stats().items():
+        yield from cache_samples(name, stats, hits=("hits", "stale_hits"))
+    for key, value in client_stats().items():
+        if isinstance(value, (int, float)):
+            yield (f"travel_amadeus_{key}_total", "counter", "Amadeus client and connection pool stats", {}, value)
+    b = breaker.stats()
+    yield ("travel_amadeus_circuit_open", "gauge", "1 while live search is switched off by the circuit breaker",
+           {}, int(b["state"] == CircuitBreaker.OPEN))
+    yield ("travel_amadeus_circuit_opens_total", "counter", "Times the circuit breaker opened", {}, b["opens"])
+    yield ("travel_amadeus_circuit_rejected_total", "counter", "Calls failed fast by the open circuit", {}, b["rejected"])
+
+metrics.add_collector("amadeus", _metric_samples)
+
+def _traced(name: str, fetch):
+    """Time an Amadeus round trip; error results count as failed calls."""
+    def run():
+        with span(name) as attrs:
+            result = fetch()
+            if _is_error(result):
+                attrs["error"] = result[0]["error"]
+            return result
+    return run
 
 def search_flights(origin: str, destination: str, depart_date: str, adults: int = 1, max_offers: int = 3):
+    origin, destination = origin.strip().upper(), destination.strip().upper()
+    depart_date = depart_date.strip()
+    key = f"{origin}|{destination}|{depart_date}|{int(adults)}|{int(max_offers)}"
+    return _cached(_flight_cache, key, _traced(
+        "amadeus.flight_offers",
+        lambda: _fetch_flights(origin, destination, depart_date, int(adults), int(max_offers))))
+
+def _ratings(ratings: str | None) -> str | None:
+    # "5, 4" and "4,5" are the same filter, and the same cache entry
+    return ",".join(sorted(r.strip() for r in ratings.split(",") if r.strip())) if ratings else None
+
+def hotel_list(city_code: str, radius_km: int = 5, ratings: str | None = None):
+    """Hotels (id, name, distance) around a city, from the long-lived per-city cache."""
+    city_code = city_code.strip().upper()
+    ratings = _ratings(ratings)
+    key = f"{city_code}|{int(radius_km)}|{ratings}"
+    return _cached(_hotel_list_cache, key, _traced(
+        "amadeus.hotel_list",
+        lambda: _fetch_hotel_list(city_code, int(radius_km), ratings)))
+
+def search_hotels(city_code: str, check_in: str, check_out: str | None, radius_km: int = 5, size: int = 8,
+                  ratings: str | None = None):
+    if not check_in:
+        return []
+    city_code, check_in = city_code.strip().upper(), check_in.strip()
+    check_out = check_out.strip() if check_out else check_out
+    ratings = _ratings(ratings)
+    key = f"{city_code}|{check_in}|{check_out}|{int(radius_km)}|{int(size)}|{ratings}"
+    return _cached(_hotel_cache, key, _traced(
+        "amadeus.hotel_offers",
+        lambda: _fetch_hotels(city_code, check_in, check_out, int(radius_km), int(size), ratings)))
+
+def _fetch_flights(origin: str, destination: str, depart_date: str, adults: int = 1, max_offers: int = 3):
     try:
-        a = _client()
-        res = a.shopping.flight_offers_search.get(
+        res = _request("flight_offers", lambda c: c.shopping.flight_offers_search.get(
             originLocationCode=origin,
             destinationLocationCode=destination,
             departureDate=depart_date,
             adults=adults,
             max=max_offers
-        )
+        ))
         out = []
         for o in res.data[:max_offers]:
             out.append({
@@ -27,33 +422,77 @@ def search_flights(origin: str, destination: str, depart_date: str, adults: int
                 "itineraries": o.get("itineraries")
             })
         return out
-    except ResponseError as e:
+    except (ResponseError, Unavailable) as e:
         return [{"error": str(e)}]
 
-def search_hotels(city_code: str, check_in: str, check_out: str | None, radius_km: int = 5, size: int = 8):
-    if not check_in:
-        return []
+def _fetch_hotel_list(city_code: str, radius_km: int, ratings: str | None):
     try:
-        a = _client()
-        hotels = a.reference_data.locations.hotels.by_city.get(cityCode="PAR")
-        hotel_ids = [hotel["hotelId"] for hotel in hotels.data]
-
-    # Take the first few hotel IDs
-        ids_str = ",".join(hotel_ids[:3])
-       
-        res = a.shopping.hotel_offers_search.get(
-         hotelIds="PARH001",
-         adults=1,
-         checkInDate=check_in,
-         checkOutDate=check_out
-        )
-        out = []
-        for h in res.data[:size]:
-            out.append({
-                "name": h.get("hotel", {}).get("name"),
-                "rating": h.get("hotel", {}).get("rating"),
-                "offers": h.get("offers", []),
-            })
-        return out
-    except ResponseError as e:
+        params = {"cityCode": city_code, "radius": radius_km, "radiusUnit": "KM"}
+        if ratings:
+            params["ratings"] = ratings
+        res = _request("hotel_list", lambda c: c.reference_data.locations.hotels.by_city.get(**params))
+        return [
+            {"hotelId": h["hotelId"], "name": h.get("name"), "distance": (h.get("distance") or {}).get("value")}
+            for h in res.data
+        ]
+    except (ResponseError, Unavailable) as e:
         return [{"error": str(e)}]
+
+def _fetch_offer_batch(hotel_ids, check_in: str, check_out: str | None):
+    """Offers for one chunk of hotel IDs in a single request."""
+    with span("amadeus.hotel_offer_batch", hotels=len(hotel_ids)) as attrs:
+        try:
+            res = _request("hotel_offers", lambda c: c.shopping.hotel_offers_search.get(
+                hotelIds=",".join(hotel_ids),
+                adults=1,
+                checkInDate=check_in,
+                checkOutDate=check_out,
+                bestRateOnly="true",
+            ))
+        except (ResponseError, Unavailable) as e:
+            # Amadeus answers an error when no hotel in the chunk has rooms
+            attrs["error"] = str(e)
+            return [{"error": str(e)}]
+    return [
+        {
+            "name": h.get("hotel", {}).get("name"),
+            "rating": h.get("hotel", {}).get("rating"),
+            "offers": h.get("offers", []),
+        }
+        for h in res.data
+    ]
+
+def _fetch_hotels(city_code: str, check_in: str, check_out: str | None, radius_km: int = 5, size: int = 8,
+                  ratings: str | None = None):
+    listed = hotel_list(city_code, radius_km, ratings)
+    if _is_error(listed):
+        return listed
+    hotel_ids = [h["hotelId"] for h in listed]
+    if not hotel_ids:
+        return []
+
+    # Batch offer queries of HOTEL_OFFER_CHUNK IDs, a wave of HOTEL_OFFER_WORKERS
+    # chunks at a time, until `size` hotels have offers (at most HOTEL_OFFER_MAX_CHUNKS)
+    chunks = [hotel_ids[i:i + HOTEL_OFFER_CHUNK] for i in range(0, len(hotel_ids), HOTEL_OFFER_CHUNK)]
+    chunks = chunks[:HOTEL_OFFER_MAX_CHUNKS]
+    out, errors = [], []
+    for start in range(0, len(chunks), HOTEL_OFFER_WORKERS):
+        wave = chunks[start:start + HOTEL_OFFER_WORKERS]
+        results = fan_out(
+            [(_fetch_offer_batch, (chunk, check_in, check_out)) for chunk in wave],
+            max_workers=len(wave),
+            call_timeout=HOTEL_OFFER_TIMEOUT,
+            total_timeout=HOTEL_OFFER_TIMEOUT,
+            on_timeout=lambda i: [{"error": "Hotel offer search timed out"}],
+            on_error=lambda i, e: [{"error": str(e)}],
+        )
+        for result in results:
+            if _is_error(result):
+                errors.append(result)
+            else:
+                out.extend(result)
+        if len(out) >= size:
+            break
+    if not out and errors:
+        return errors[0]
+    return out[:size]
@@ -0,0 +1,365 @@
+"""Compact, memory-mapped city/airport index for resolving trip destinations.
+
+The index is built offline from `data/cities.csv` (optionally merged with an
+OurAirports `airports.csv` export) into a small binary file: fixed-size
+city records, an open-addressing hash table of normalized names, aliases,
+city codes and airport codes, and a string table. Lookups hash the key and
+probe the mmapped table directly, so nothing is parsed up front and the
+pages are shared between worker processes.
+
+    python -m integrations.city_index build [--csv data/cities.csv] [--ourairports airports.csv]
+    python -m integrations.city_index lookup "Munchen"
+"""
+import argparse
+import csv
+import difflib
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from utils.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+CSV_PATH = os.path.join(DATA_DIR, "cities.csv")
+INDEX_PATH = os.getenv("CITY_INDEX_PATH", os.path.join(DATA_DIR, "cities.idx"))
+FUZZY_CUTOFF = float(os.getenv("CITY_FUZZY_CUTOFF", "0.8"))
+
+MAGIC = b"CIDX"
+VERSION = 1
+_HEADER = struct.Struct("<4sHIIIII")  # magic, version, records, slots, records/slots/strings offsets
+_RECORD = struct.Struct("<3s2sffIHIH")  # code, country, lat, lon, name (off, len), airports (off, len)
+_SLOT = struct.Struct("<QIIH")  # key hash (0 = empty), record, key (off, len)
+
+
+class City(NamedTuple):
+    name: str
+    code: str  # IATA city (metro) code, e.g. PAR for CDG/ORY
+    country: str
+    lat: float
+    lon: float
+    airports: Tuple[str, ...]
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+_NEXT_WORD = re.compile(r"[^a-z0-9]+([a-z0-9]+)")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse whitespace."""
+    return " ".join(_WORD.findall(_fold(text)[0]))
+
+
+def _fold(text: str) -> Tuple[str, Optional[List[int]]]:
+    """`text` lowercased without accents, and where in `text` each character came from.
+
+    The offsets are None for ASCII text, where folding keeps every character in place.
+    """
+    if text.isascii():
+        return text.lower(), None
+    folded, offsets = [], []
+    for i, ch in enumerate(text):
+        for c in unicodedata.normalize("NFKD", ch):
+            if not unicodedata.combining(c):
+                c = c.lower()
+                folded.append(c)
+                offsets.extend([i] * len(c))
+    return "".join(folded), offsets
+
+
+def _alternation(words: Iterable[str]) -> str:
+    """Regex matching any of `words`, as a prefix trie so it is scanned in one pass."""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def pattern(node: Dict[str, dict]) -> str:
+        branches = [re.escape(ch) + pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return pattern(trie)
+
+
+def _hash(key: bytes) -> int:
+    # Stable 64-bit hash (unlike hash()); 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def _read_csv(path: str) -> List[dict]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            {
+                "code": r["code"].strip().upper(),
+                "name": r["name"].strip(),
+                "country": r["country"].strip().upper(),
+                "lat": float(r["lat"]),
+                "lon": float(r["lon"]),
+                "airports": [a for a in r["airports"].split("|") if a],
+                "aliases": [a for a in (r.get("aliases") or "").split("|") if a],
+            }
+            for r in csv.DictReader(f)
+        ]
+
+
+def rows_from_ourairports(path: str) -> List[dict]:
+    """City rows from an OurAirports `airports.csv` (large/medium airports with scheduled service).
+
+    OurAirports has no metropolitan codes, so each city takes the IATA code
+    of its first listed airport; curated rows from `cities.csv` win on merge.
+    """
+    cities: Dict[Tuple[str, str], dict] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            if r.get("type") not in {"large_airport", "medium_airport"} or r.get("scheduled_service") != "yes":
+                continue
+            iata, city = (r.get("iata_code") or "").strip().upper(), (r.get("municipality") or "").strip()
+            if len(iata) != 3 or not city:
+                continue
+            row = cities.setdefault((city, r["iso_country"]), {
+                "code": iata, "name": city, "country": r["iso_country"].upper(),
+                "lat": float(r["latitude_deg"]), "lon": float(r["longitude_deg"]),
+                "airports": [], "aliases": [],
+            })
+            row["airports"].append(iata)
+    return list(cities.values())
+
+
+def build_index(rows: Iterable[dict], out_path: str = INDEX_PATH) -> int:
+    """Write the binary index for `rows`; returns the number of cities.
+
+    The file is written under a unique temporary name and renamed into
+    place, so concurrent builders and running readers never see half of it.
+    """
+    data, n = _pack(rows)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, out_path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return n
+
+
+def _pack(rows: Iterable[dict]) -> Tuple[bytes, int]:
+    """The index file's bytes for `rows`, and the number of cities."""
+    records, strings, keys = [], bytearray(), {}
+
+    def put(text: str) -> Tuple[int, int]:
+        data = text.encode("utf-8")
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    seen_codes = set()
+    rows = [r for r in rows if not (r["code"] in seen_codes or seen_codes.add(r["code"]))]
+    for idx, r in enumerate(rows):
+        records.append((r["code"].encode(), r["country"].encode()[:2].ljust(2), r["lat"], r["lon"],
+                        *put(r["name"]), *put(",".join(r["airports"]))))
+    # Names and aliases claim keys before codes, so "Nice" never resolves to a code
+    for idx, r in enumerate(rows):
+        for key in [r["name"], *r["aliases"]]:
+            keys.setdefault(normalize(key), idx)
+    for idx, r in enumerate(rows):
+        for key in [r["code"], *r["airports"]]:
+            keys.setdefault(normalize(key), idx)
+
+    n_slots = 1
+    while n_slots < 2 * len(keys):
+        n_slots <<= 1
+    slots = [None] * n_slots
+    for key, idx in keys.items():
+        data = key.encode("utf-8")
+        h = _hash(data)
+        i = h & (n_slots - 1)
+        while slots[i] is not None:
+            i = (i + 1) & (n_slots - 1)
+        slots[i] = (h, idx, *put(key))
+
+    records_off = _HEADER.size
+    slots_off = records_off + _RECORD.size * len(records)
+    strings_off = slots_off + _SLOT.size * n_slots
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, len(records), n_slots, records_off, slots_off, strings_off))
+    for rec in records:
+        out += _RECORD.pack(*rec)
+    for slot in slots:
+        out += _SLOT.pack(*(slot or (0, 0, 0, 0)))
+    out += strings
+    return bytes(out), len(records)
+
+
+class CityIndex:
+    """Read-only view over a built index file, or over its bytes (`data`)."""
+
+    def __init__(self, path: str = INDEX_PATH, data: Optional[bytes] = None):
+        if data is not None:
+            self._mm = data
+        else:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._n, self._slots, self._rec_off, self._slot_off, self._str_off = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a city index (version {VERSION})")
+        self._keys: Optional[List[str]] = None
+        self._names: Optional[frozenset] = None
+        self._starts: Optional[re.Pattern] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _str(self, off: int, length: int) -> str:
+        start = self._str_off + off
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _record(self, idx: int) -> City:
+        code, country, lat, lon, n_off, n_len, a_off, a_len = \
+            _RECORD.unpack_from(self._mm, self._rec_off + idx * _RECORD.size)
+        airports = self._str(a_off, a_len)
+        return City(self._str(n_off, n_len), code.decode(), country.decode().strip(),
+                    round(lat, 4), round(lon, 4), tuple(airports.split(",")) if airports else ())
+
+    def lookup(self, text: str) -> Optional[City]:
+        """Exact match on a city name, alias, city code or airport code."""
+        key = normalize(text)
+        if not key:
+            return None
+        data = key.encode("utf-8")
+        h = _hash(data)
+        mask = self._slots - 1
+        i = h & mask
+        while True:
+            slot_h, idx, k_off, k_len = _SLOT.unpack_from(self._mm, self._slot_off + i * _SLOT.size)
+            if slot_h == 0:
+                return None
+            if slot_h == h and self._mm[self._str_off + k_off:self._str_off + k_off + k_len] == data:
+                return self._record(idx)
+            i = (i + 1) & mask
+
+    def keys(self) -> List[str]:
+        """All indexed keys (decoded once, for fuzzy matching)."""
+        if self._keys is None:
+            with self._lock:
+                if self._keys is None:
+                    keys = []
+                    for i in range(self._slots):
+                        slot_h, _, k_off, k_len = _SLOT.unpack_from(self._mm, self._slot_off + i * _SLOT.size)
+                        if slot_h:
+                            keys.append(self._str(k_off, k_len))
+                    self._keys = keys
+        return self._keys
+
+    def mentions(self, text: str, max_words: int = 3) -> List[Tuple[int, int, City]]:
+        """(start, end, city) for each city name or alias in `text`, as offsets into `text`."""
+        if self._names is None:
+            # Codes are left out: three-letter words match far too much prose
+            names = frozenset(k for k in self.keys() if len(k) > 3)
+            # Only a word that starts some name can start a match
+            starts = _alternation({k.split()[0] for k in names}) or "(?!)"
+            self._starts = re.compile(rf"(?<![a-z0-9]){starts}(?![a-z0-9])")
+            self._names = names
+        folded, offsets = _fold(text)
+        found = []
+        for m in self._starts.finditer(folded):
+            phrase, end = m.group(), m.end()
+            for _ in range(max_words):
+                if phrase in self._names:
+                    city = self.lookup(phrase)
+                    if city is not None:
+                        span = (m.start(), end) if offsets is None else (offsets[m.start()], offsets[end - 1] + 1)
+                        found.append((*span, city))
+                nxt = _NEXT_WORD.match(folded, end)
+                if nxt is None:
+                    break
+                phrase, end = f"{phrase} {nxt.group(1)}", nxt.end()
+        return found
+
+    def find_in_text(self, text: str, max_words: int = 3) -> List[City]:
+        """Cities whose name or alias appears in `text`, in order of first mention."""
+        found: Dict[str, City] = {}
+        for _, _, city in self.mentions(text, max_words):
+            found.setdefault(city.code, city)
+        return list(found.values())
+
+    def resolve(self, text: str, cutoff: float = FUZZY_CUTOFF) -> Optional[City]:
+        """Exact lookup, then the part before a comma ("Paris, France"), then closest fuzzy match."""
+        city = self.lookup(text)
+        if city is None and "," in text:
+            city = self.lookup(text.split(",", 1)[0])
+        if city is None:
+            key = normalize(text.split(",", 1)[0])
+            # Codes are too short to fuzzy-match safely; only names and aliases qualify
+            names = [k for k in self.keys() if len(k) > 3]
+            match = difflib.get_close_matches(key, names, n=1, cutoff=cutoff) if len(key) > 3 else []
+            city = self.lookup(match[0]) if match else None
+        return city
+
+
+def _load_index() -> CityIndex:
+    stale = not os.path.exists(INDEX_PATH) or (
+        os.path.exists(CSV_PATH) and os.path.getmtime(CSV_PATH) > os.path.getmtime(INDEX_PATH)
+    )
+    if stale:
+        rows = _read_csv(CSV_PATH)
+        try:
+            build_index(rows, INDEX_PATH)
+        except OSError as e:
+            # E.g. a read-only install: serve the CSV from memory rather than a stale file
+            logger.warning("Cannot write %s (%s); using an in-memory city index", INDEX_PATH, e)
+            return CityIndex(data=_pack(rows)[0])
+    return CityIndex(INDEX_PATH)
+
+
+registry.register("city_index", _load_index)
+
+
+@lru_cache(maxsize=4096)
+def resolve_city(name: str) -> Optional[City]:
+    """City for a free-text destination, or None if it cannot be resolved."""
+    return registry.get("city_index").resolve(name)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Build or query the city/airport index.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="rebuild the binary index")
+    b.add_argument("--csv", default=CSV_PATH, help="curated cities CSV")
+    b.add_argument("--ourairports", help="OurAirports airports.csv to merge in")
+    b.add_argument("--out", default=INDEX_PATH)
+    q = sub.add_parser("lookup", help="resolve names")
+    q.add_argument("names", nargs="+")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        rows = _read_csv(args.csv)
+        if args.ourairports:
+            rows += rows_from_ourairports(args.ourairports)
+        n = build_index(rows, args.out)
+        print(f"{n} cities -> {args.out} ({os.path.getsize(args.out)} bytes)")
+    else:
+        for name in args.names:
+            print(f"{name!r}: {resolve_city(name)}")
+
+
+if __name__ == "__main__":
+    main()
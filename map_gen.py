@@ -1,18 +1,67 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
 import folium
+from integrations.city_index import resolve_city
+from utils.telemetry import cache_samples, metrics, span
+
+# Rendered maps kept per (ordered cities, coordinates); each is about 6-17 KB of HTML
+MAP_CACHE_SIZE = int(os.getenv("MAP_CACHE_SIZE", "256"))
+DEFAULT_CENTER = (20.0, 0.0)
+
+# How the planner returns the map: folium HTML, GeoJSON for clients that
+# render it themselves, or nothing at all
+MAP_FORMATS = ("html", "geojson", "none")
+
+Point = Tuple[str, float, float]
+
+def city_points(cities: List[str]) -> Tuple[Point, ...]:
+    """(name, lat, lon) for each city in trip order; unresolved cities are left out."""
+    points = []
+    for c in cities:
+        city = resolve_city(c)
+        if city is not None:
+            points.append((c, city.lat, city.lon))
+    return tuple(points)
 
-CITY_COORDS = {
-    "Paris": [48.8566, 2.3522],
-    "Rome": [41.9028, 12.4964],
-    "London": [51.5074, -0.1278],
-    "Delhi": [28.6139, 77.2090],
-    "Tokyo": [35.6762, 139.6503]
-}
+@lru_cache(maxsize=MAP_CACHE_SIZE)
+def _render_html(points: Tuple[Point, ...]) -> str:
+    with span("folium.render", markers=len(points)):
+        center = points[0][1:] if points else DEFAULT_CENTER
+        m = folium.Map(location=list(center), zoom_start=4)
+        for name, lat, lon in points:
+            folium.Marker([lat, lon], popup=name).add_to(m)
+        if len(points) > 1:
+            folium.PolyLine([[lat, lon] for _, lat, lon in points], weight=2).add_to(m)
+        return m._repr_html_()
 
 def generate_map_html(cities: list[str]) -> str:
     if not cities:
         return ""
-    center = CITY_COORDS.get(cities[0], [20.0, 0.0])
-    m = folium.Map(location=center, zoom_start=4)
-    for c in cities:
-        folium.Marker(CITY_COORDS.get(c, center), popup=c).add_to(m)
-    return m._repr_html_()
+    return _render_html(city_points(cities))
+
+def generate_map_geojson(cities: list[str]) -> Dict[str, Any]:
+    """Compact GeoJSON FeatureCollection: one Point per city and the route as a LineString."""
+    if not cities:
+        return {}
+    points = city_points(cities)
+    # GeoJSON positions are [lon, lat]
+    features = [
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+         "properties": {"name": name, "stop": idx}}
+        for idx, (name, lat, lon) in enumerate(points)
+    ]
+    if len(points) > 1:
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[lon, lat] for _, lat, lon in points]},
+            "properties": {"name": "route"},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+def map_cache_stats() -> dict:
+    info = _render_html.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
+
+metrics.add_collector("map", lambda: cache_samples("maps", map_cache_stats()))
@@ -1,8 +1,104 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from app_core import get_planner
+import json
+import os
+import time
+from contextlib import asynccontextmanager, AsyncExitStack
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Any, List, Literal, Optional
+from pydantic import BaseModel, ValidationError
+from app_core import BATCH_CONCURRENCY, JOBS, aplan_batch, get_planner, run_config, warm_planners, astream_plan
+from utils.limiter import ConcurrencyLimiter, Saturated
+from utils.model_registry import registry
+from utils.streaming import ReleasingStreamingResponse
+from utils.telemetry import metrics
+from utils.worker_pool import JobTimeout, WorkerPool
 
-app = FastAPI(title="Travel MCP Tool Server")
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in {"1", "true", "yes"}
+WARM_PLANNERS = os.getenv("WARM_PLANNERS", "true").lower() in {"1", "true", "yes"}
+# Largest batch accepted by /tools/plan_batch
+BATCH_MAX_ITEMS = int(os.getenv("MCP_BATCH_MAX_ITEMS", "5000"))
+# Forked planning workers; 0 plans inside this process
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "0"))
+# Models loaded once before forking, shared copy-on-write by the workers
+WORKER_PRELOAD = [n.strip() for n in os.getenv("WORKER_PRELOAD", "flan_t5,minilm").split(",") if n.strip()]
+
+# Plans in flight at once, plans allowed to wait for a slot, and the hint sent back when full
+limiter = ConcurrencyLimiter(
+    max_concurrency=int(os.getenv("MCP_MAX_CONCURRENCY", "16")),
+    max_waiting=int(os.getenv("MCP_MAX_WAITING", "32")),
+    queue_timeout=float(os.getenv("MCP_QUEUE_TIMEOUT", "5")),
+    retry_after=int(os.getenv("MCP_RETRY_AFTER", "2")),
+)
+
+def _metric_samples():
+    for key, value in limiter.stats().items():
+        kind = "counter" if key == "rejected" else "gauge"
+        name = "travel_plans_rejected_total" if key == "rejected" else f"travel_plans_{key}"
+        yield (name, kind, "Plan admission control", {}, value)
+    yield ("travel_process_resident_bytes", "gauge", "Resident set size", {}, registry.stats()["rss_bytes"])
+    for name, s in registry.stats()["loaded"].items():
+        yield ("travel_model_load_seconds", "gauge", "Time to load a shared model", {"model": name}, s["load_seconds"])
+
+# Set by the lifespan when MCP_WORKERS > 0
+pool: Optional[WorkerPool] = None
+
+def _preload_worker_models():
+    from rag.rag_travel_blogs import preload_models
+    preload_models(WORKER_PRELOAD)
+
+def _pool_samples():
+    if pool is None:
+        return
+    for key, value in pool.stats().items():
+        if key in {"workers", "busy", "queued"}:
+            yield (f"travel_worker_pool_{key}", "gauge", "Planning worker pool", {}, value)
+        elif key.endswith("_bytes"):
+            yield (f"travel_worker_pool_{key}", "gauge", "Memory of the planning workers", {}, value)
+        else:
+            yield ("travel_worker_pool_jobs_total", "counter", "Worker pool jobs by outcome", {"outcome": key}, value)
+
+metrics.add_collector("mcp", _metric_samples)
+metrics.add_collector("worker_pool", _pool_samples)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global pool
+    if WARM_PLANNERS:
+        warm_planners()
+    if PRELOAD_MODELS:
+        from rag.rag_travel_blogs import preload_models
+        preload_models()
+    if MCP_WORKERS:
+        pool = WorkerPool(
+            JOBS,
+            processes=MCP_WORKERS,
+            max_queue=int(os.getenv("WORKER_QUEUE", "64")),
+            job_timeout=float(os.getenv("WORKER_JOB_TIMEOUT", "120")),
+            max_jobs=int(os.getenv("WORKER_MAX_JOBS", "500")),
+            max_private_bytes=int(float(os.getenv("WORKER_MAX_RSS_MB", "0")) * 2 ** 20),
+            preload=_preload_worker_models if WORKER_PRELOAD else None,
+            retry_after=limiter.retry_after,
+        ).start()
+    try:
+        yield
+    finally:
+        if pool is not None:
+            pool.close()
+            pool = None
+
+app = FastAPI(title="Travel MCP Tool Server", lifespan=lifespan)
+
+@app.exception_handler(Saturated)
+async def saturated_handler(request: Request, exc: Saturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Planner is at capacity, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(JobTimeout)
+async def job_timeout_handler(request: Request, exc: JobTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 class PlanPayload(BaseModel):
     destinations: str
@@ -11,20 +107,192 @@ class PlanPayload(BaseModel):
     interests: str
     use_live: bool = False
     use_rag: bool = False
+    # "geojson" returns coordinates for client-side rendering; "none" omits the map
+    map_format: Literal["html", "geojson", "none"] = "html"
+
+def _request_id(request: Request) -> Optional[str]:
+    # A retry that sends the same X-Request-ID resumes after the planner nodes that already finished
+    return request.headers.get("x-request-id") or None
 
 @app.post("/tools/plan_trip")
-def plan_trip(p: PlanPayload):
-    planner = get_planner(use_live=p.use_live, use_rag=p.use_rag)
-    out = planner.invoke({
-        "inputs": {
-            "destinations": p.destinations,
-            "dates": p.dates,
-            "budget": p.budget,
-            "interests": p.interests
-        }
-    })
+async def plan_trip(p: PlanPayload, request: Request):
+    request_id = _request_id(request)
+    async with limiter.slot():
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            inputs = {
+                "destinations": p.destinations,
+                "dates": p.dates,
+                "budget": p.budget,
+                "interests": p.interests,
+                "map_format": p.map_format,
+            }
+            if pool is not None:
+                out = await pool.arun("plan", inputs, p.use_live, p.use_rag, request_id)
+            else:
+                planner = get_planner(use_live=p.use_live, use_rag=p.use_rag)
+                out = await planner.ainvoke({"inputs": inputs}, run_config(request_id))
+            status = "ok"
+        finally:
+            metrics.observe("travel_plan_seconds", time.perf_counter() - t0, "End-to-end plan latency", endpoint="plan_trip")
+            metrics.inc("travel_plans_total", 1, "Plans served", endpoint="plan_trip", status=status)
     return out
 
+def _encode_event(event: dict, sse: bool) -> bytes:
+    line = json.dumps(event, default=str)
+    if sse:
+        return f"event: {event['event']}\ndata: {line}\n\n".encode()
+    return (line + "\n").encode()
+
+async def _queued(stack: AsyncExitStack, kind: str, *args):
+    """Queue a streaming pool job whose events a response will send.
+
+    A full pool queue raises `Saturated` here, before the response starts,
+    after releasing what `stack` holds. Closing `stack` cancels the job.
+    """
+    try:
+        events = pool.astream(kind, *args)
+    except BaseException:
+        await stack.aclose()
+        raise
+    stack.push_async_callback(events.aclose)
+    return events
+
+@app.post("/tools/plan_trip/stream")
+async def plan_trip_stream(p: PlanPayload, request: Request, format: str = "ndjson"):
+    """Stream node updates and itinerary tokens as NDJSON (or SSE with `?format=sse`)."""
+    sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+    request_id = _request_id(request)
+    inputs = {
+        "destinations": p.destinations,
+        "dates": p.dates,
+        "budget": p.budget,
+        "interests": p.interests,
+        "map_format": p.map_format,
+    }
+    # Take the slot (and queue the pool job) before responding so saturation still surfaces as a 503
+    stack = AsyncExitStack()
+    await stack.enter_async_context(limiter.slot())
+    if pool is not None:
+        events = await _queued(stack, "stream", inputs, p.use_live, p.use_rag, request_id)
+    else:
+        events = astream_plan(inputs, use_live=p.use_live, use_rag=p.use_rag, request_id=request_id)
+
+    async def body():
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            async for event in events:
+                yield _encode_event(event, sse)
+            status = "ok"
+        except Exception as e:
+            yield _encode_event({"event": "error", "message": str(e)}, sse)
+        finally:
+            await stack.aclose()
+            metrics.observe("travel_plan_seconds", time.perf_counter() - t0, "End-to-end plan latency", endpoint="stream")
+            metrics.inc("travel_plans_total", 1, "Plans served", endpoint="stream", status=status)
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return ReleasingStreamingResponse(body(), stack.aclose, media_type=media_type,
+                                      headers={"Cache-Control": "no-cache"})
+
+def _batch_entries(body: bytes, content_type: str) -> List[Any]:
+    """Batch entries from a JSON list, `{"items": [...]}` or JSON lines (one payload per line).
+
+    A JSON line that does not parse becomes a ValueError in its place, so
+    only that entry fails.
+    """
+    if "ndjson" in content_type or "jsonl" in content_type:
+        entries = []
+        for line in body.decode().splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError as e:
+                entries.append(ValueError(f"invalid JSON line: {e}"))
+        return entries
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON or JSON lines")
+    if isinstance(data, dict):
+        data = data.get("items")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Expected a list of trip payloads")
+    return data
+
+@app.post("/tools/plan_batch")
+async def plan_batch(request: Request, concurrency: Optional[int] = None):
+    """Plan many trips in one call and stream one NDJSON line per trip as it finishes.
+
+    The body is a JSON list of `PlanPayload`s (or `{"items": [...]}`), or a
+    JSONL file sent as `application/x-ndjson`. Each line of the response is
+    a `result` or `error` event tagged with the entry's `index`; a final
+    `done` event carries counts and how many lookups were shared. Retrying
+    with the same `X-Request-ID` resumes every trip that did not finish.
+    """
+    request_id = _request_id(request)
+    entries = _batch_entries(await request.body(), request.headers.get("content-type", ""))
+    if len(entries) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} trips per batch")
+    # Invalid entries are reported in the stream; the rest are still planned
+    items, positions, invalid = [], [], []
+    for idx, entry in enumerate(entries):
+        try:
+            if isinstance(entry, Exception):
+                raise entry
+            items.append(PlanPayload.model_validate(entry).model_dump())
+            positions.append(idx)
+        except (ValueError, ValidationError) as e:
+            invalid.append({"event": "error", "index": idx, "message": str(e)})
+    # The batch holds one slot per trip it runs at once, at most `limiter.max_concurrency`
+    workers = max(1, min(concurrency or BATCH_CONCURRENCY, limiter.max_concurrency))
+    stack = AsyncExitStack()
+    await stack.enter_async_context(limiter.slot(workers))
+    if pool is not None:
+        # One worker runs the whole batch so its lookups stay shared
+        events = await _queued(stack, "batch", items, workers, request_id)
+    else:
+        events = aplan_batch(items, concurrency=workers, request_id=request_id)
+
+    async def body():
+        t0 = time.perf_counter()
+        try:
+            for event in invalid:
+                metrics.inc("travel_plans_total", 1, "Plans served", endpoint="batch", status="error")
+                yield _encode_event(event, sse=False)
+            async for event in events:
+                if event["event"] == "done":
+                    event["errors"] += len(invalid)
+                else:
+                    event["index"] = positions[event["index"]]
+                    status = "ok" if event["event"] == "result" else "error"
+                    metrics.inc("travel_plans_total", 1, "Plans served", endpoint="batch", status=status)
+                yield _encode_event(event, sse=False)
+        except Exception as e:
+            yield _encode_event({"event": "error", "message": str(e)}, sse=False)
+        finally:
+            await stack.aclose()
+            metrics.observe("travel_batch_seconds", time.perf_counter() - t0, "End-to-end batch latency")
+
+    return ReleasingStreamingResponse(body(), stack.aclose, media_type="application/x-ndjson",
+                                      headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition of node, call, token and cache metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/models")
+def models():
+    return registry.stats()
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "limiter": limiter.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
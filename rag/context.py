@@ -0,0 +1,117 @@
+"""Token-budgeted context assembly for the RAG prompt.
+
+Over-fetched candidates are de-duplicated, re-ranked with maximal marginal
+relevance (MMR) over the embeddings the vector store already holds, and
+packed into an exact token budget measured with the generator's tokenizer.
+"""
+import hashlib
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+Candidate = Tuple[str, Sequence[float]]  # (text, embedding)
+
+
+def _normalize(vectors):
+    import numpy as np
+    arr = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+def dedup(candidates: List[Candidate], threshold: float) -> List[Candidate]:
+    """Drop exact repeats and chunks whose cosine similarity to a kept one is >= threshold."""
+    if not candidates:
+        return []
+    import numpy as np
+    vecs = _normalize([c[1] for c in candidates])
+    kept, kept_vecs, seen = [], [], set()
+    for cand, vec in zip(candidates, vecs):
+        digest = hashlib.sha256(cand[0].strip().encode("utf-8")).digest()
+        if digest in seen:
+            continue
+        if kept_vecs and float(np.max(np.stack(kept_vecs) @ vec)) >= threshold:
+            continue
+        seen.add(digest)
+        kept.append(cand)
+        kept_vecs.append(vec)
+    return kept
+
+
+def mmr(query_vec: Sequence[float], candidates: List[Candidate], k: int, lambda_mult: float = 0.5) -> List[Candidate]:
+    """Order up to `k` candidates by maximal marginal relevance to the query."""
+    if not candidates:
+        return []
+    import numpy as np
+    q = _normalize([query_vec])[0]
+    vecs = _normalize([c[1] for c in candidates])
+    relevance = vecs @ q
+    selected: List[int] = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = np.max(vecs[remaining] @ vecs[selected].T, axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in selected]
+
+
+def pack(
+    texts: List[str],
+    count_tokens: Callable[[str], int],
+    truncate: Callable[[str, int], str],
+    budget: int,
+    separator: str = "\n\n",
+    min_tail_tokens: int = 32,
+) -> Tuple[str, Dict[str, int]]:
+    """Greedily pack ranked texts into `budget` tokens.
+
+    A chunk that does not fit whole is truncated if at least
+    `min_tail_tokens` remain, otherwise it is skipped (a later, shorter
+    chunk may still fit).
+    """
+    parts, used, dropped = [], 0, 0
+    sep_tokens = count_tokens(separator) if separator.strip() else 0
+    for text in texts:
+        cost = count_tokens(text) + (sep_tokens if parts else 0)
+        if used + cost <= budget:
+            parts.append(text)
+            used += cost
+            continue
+        room = budget - used - (sep_tokens if parts else 0)
+        if room >= min_tail_tokens:
+            head = truncate(text, room)
+            head_cost = count_tokens(head) + (sep_tokens if parts else 0)
+            if head and used + head_cost <= budget:
+                parts.append(head)
+                used += head_cost
+                dropped += max(cost - head_cost, 0)
+                continue
+        dropped += cost
+    return separator.join(parts), {"tokens_used": used, "tokens_dropped": dropped, "chunks_packed": len(parts)}
+
+
+def build_context(
+    query_vec: Sequence[float],
+    candidates: List[Candidate],
+    count_tokens: Callable[[str], int],
+    truncate: Callable[[str, int], str],
+    budget: int,
+    k: int = 8,
+    lambda_mult: float = 0.5,
+    dedup_threshold: float = 0.95,
+) -> Tuple[str, Dict[str, Any]]:
+    """Dedup, MMR re-rank and pack candidates; returns the context and a report."""
+    unique = dedup(candidates, dedup_threshold)
+    ranked = mmr(query_vec, unique, k, lambda_mult)
+    context, report = pack([c[0] for c in ranked], count_tokens, truncate, max(budget, 0))
+    report.update(
+        candidates=len(candidates),
+        duplicates_removed=len(candidates) - len(unique),
+        chunks_ranked=len(ranked),
+        budget=budget,
+    )
+    return context, report
@@ -0,0 +1,319 @@
+"""Incremental, parallel ingestion of travel blog pages into the Chroma store.
+
+Each source (URL or local HTML file) is tracked in a manifest with its ETag,
+Last-Modified and content hash. Unchanged sources are skipped (conditional
+GET / mtime check, then hash comparison), changed sources are re-chunked and
+only chunks whose hash is not already stored get embedded, and chunks that
+disappeared are deleted. Fetching, splitting and city tagging run on a
+bounded thread pool and new chunks are embedded in fixed-size batches, so
+memory stays flat regardless of corpus size.
+
+    python -m rag.ingest [URL_OR_PATH ...] [--urls-file FILE] [--workers 8] [--batch-size 64] [--prune]
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+
+from integrations.city_index import resolve_city  # noqa: F401  (registers "city_index")
+from rag.rag_travel_blogs import CHROMA_DIR, DEFAULT_URLS, _extract_text
+from rag.retrieval import city_flags
+from utils.model_registry import registry
+
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST", CHROMA_DIR.rstrip("/\\") + "_manifest.sqlite3")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """SQLite record of what has been ingested, per source and per chunk."""
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, ingested_at REAL);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " url TEXT, chunk_id TEXT, PRIMARY KEY (url, chunk_id));"
+            "CREATE INDEX IF NOT EXISTS chunks_by_id ON chunks (chunk_id);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);"
+        )
+
+    def source(self, url: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash FROM sources WHERE url=?", (url,)
+        ).fetchone()
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2]} if row else None
+
+    def urls(self) -> List[str]:
+        return [r[0] for r in self.conn.execute("SELECT url FROM sources")]
+
+    def chunk_ids(self, url: str) -> set:
+        return {r[0] for r in self.conn.execute("SELECT chunk_id FROM chunks WHERE url=?", (url,))}
+
+    def is_stored(self, chunk_id: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM chunks WHERE chunk_id=? LIMIT 1", (chunk_id,)).fetchone() is not None
+
+    def orphans(self, chunk_ids: Iterable[str]) -> List[str]:
+        """Chunk IDs no longer referenced by any source."""
+        return [c for c in chunk_ids if not self.is_stored(c)]
+
+    def put(self, url: str, etag, last_modified, content_hash: str, chunk_ids: Optional[set] = None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, time.time()),
+        )
+        if chunk_ids is not None:
+            self.conn.execute("DELETE FROM chunks WHERE url=?", (url,))
+            self.conn.executemany("INSERT INTO chunks VALUES (?, ?)", [(url, c) for c in chunk_ids])
+
+    def remove(self, url: str):
+        self.conn.execute("DELETE FROM sources WHERE url=?", (url,))
+        self.conn.execute("DELETE FROM chunks WHERE url=?", (url,))
+
+    def bump_version(self):
+        """Mark the store as changed, so retrievers reload what they hold (see `store_version`)."""
+        self.conn.execute(
+            "INSERT INTO meta VALUES ('version', 1) ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+
+def store_version(path: str = MANIFEST_PATH) -> int:
+    """How many ingest writes the store has seen; 0 before the first one.
+
+    Readable from any process, e.g. a server whose store another process ingests into.
+    """
+    if not os.path.exists(path):
+        return 0
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+    return row[0] if row else 0
+
+
+def _fetch(url: str, known: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fetch one source, skipping the download when it has not changed."""
+    known = known or {}
+    out = {"url": url, "status": "ok", "text": "", "etag": None, "last_modified": None}
+    try:
+        path = url[len("file://"):] if url.startswith("file://") else url
+        if os.path.isfile(path):
+            last_modified = formatdate(os.stat(path).st_mtime, usegmt=True)
+            out["last_modified"] = last_modified
+            if last_modified == known.get("last_modified"):
+                out["status"] = "not_modified"
+                return out
+            with open(path, encoding="utf-8", errors="replace") as f:
+                out["text"] = _extract_text(f.read())
+            return out
+
+        headers = {"User-Agent": "travel-planner/1.0"}
+        if known.get("etag"):
+            headers["If-None-Match"] = known["etag"]
+        if known.get("last_modified"):
+            headers["If-Modified-Since"] = known["last_modified"]
+        r = requests.get(url, timeout=12, headers=headers)
+        if r.status_code == 304:
+            out["status"] = "not_modified"
+            return out
+        r.raise_for_status()
+        out["etag"] = r.headers.get("ETag")
+        out["last_modified"] = r.headers.get("Last-Modified")
+        out["text"] = _extract_text(r.text)
+        return out
+    except Exception as e:
+        out["status"] = "error"
+        out["error"] = str(e)
+        return out
+
+
+def _chunk(text: str, splitter) -> List[Tuple[str, Tuple[str, ...]]]:
+    """Split a page into chunks, each with the codes of the cities it mentions.
+
+    The page is scanned for cities once; a chunk gets the mentions that lie
+    wholly inside it, which is what scanning the chunk itself would find.
+    """
+    index = registry.get("city_index")
+    mentions = index.mentions(text)
+    out, pos = [], 0
+    for chunk in splitter.split_text(text):
+        start = text.find(chunk, pos)
+        if start < 0:
+            cities = index.find_in_text(chunk)
+        else:
+            end = start + len(chunk)
+            cities = [c for a, b, c in mentions if start <= a and b <= end]
+            pos = start + 1
+        out.append((chunk, tuple(dict.fromkeys(c.code for c in cities))))
+    return out
+
+
+def _fetch_and_chunk(url: str, known: Optional[Dict[str, Any]], splitter) -> Dict[str, Any]:
+    res = _fetch(url, known)
+    if res["status"] == "ok":
+        res["content_hash"] = _sha256(res["text"])
+        if not known or known["content_hash"] != res["content_hash"]:
+            res["chunks"] = _chunk(res["text"], splitter)
+    return res
+
+
+def _fetch_all(sources: List[str], manifest: Manifest, workers: int, splitter) -> Iterator[Dict[str, Any]]:
+    """Fetch, split and tag concurrently, keeping at most ~2x `workers` pages in memory at once."""
+    known = {u: manifest.source(u) for u in sources}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = []
+        for url in sources:
+            window.append(pool.submit(_fetch_and_chunk, url, known[url], splitter))
+            if len(window) >= workers * 2:
+                yield window.pop(0).result()
+        for fut in window:
+            yield fut.result()
+
+
+def ingest(
+    sources: Optional[List[str]] = None,
+    store=None,
+    manifest: Optional[Manifest] = None,
+    workers: int = 8,
+    batch_size: int = 64,
+    prune: bool = False,
+) -> Dict[str, Any]:
+    """Bring the vector store in line with `sources`; returns counters for the run.
+
+    `store` must provide `add_texts(texts, metadatas=, ids=)` and
+    `delete(ids=)` (the shared langchain Chroma store by default).
+    With `prune`, sources in the manifest but not in `sources` are removed.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    t0 = time.perf_counter()
+    sources = list(dict.fromkeys(sources or DEFAULT_URLS))
+    store = store if store is not None else registry.get("chroma")
+    manifest = manifest or Manifest()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    stats = {
+        "sources": len(sources), "fetched": 0, "not_modified": 0, "unchanged": 0, "errors": 0,
+        "chunks_added": 0, "chunks_removed": 0, "embed_batches": 0, "sources_pruned": 0,
+    }
+
+    pending_ids, pending_texts, pending_metas = [], [], []
+    pending_sources = []  # manifest rows whose chunks are all queued
+    pending_stale = []  # chunk IDs sources no longer contain, checked after their rows land
+    queued = set()
+
+    def flush():
+        if pending_ids:
+            store.add_texts(list(pending_texts), metadatas=list(pending_metas), ids=list(pending_ids))
+            stats["chunks_added"] += len(pending_ids)
+            stats["embed_batches"] += 1
+            manifest.bump_version()
+            pending_ids.clear()
+            pending_texts.clear()
+            pending_metas.clear()
+        # Record sources only once their chunks are in the store
+        for row in pending_sources:
+            manifest.put(*row)
+        pending_sources.clear()
+        # Chunks still claimed by another source stay in the store
+        orphans = manifest.orphans(set().union(*pending_stale)) if pending_stale else []
+        pending_stale.clear()
+        if orphans:
+            store.delete(ids=orphans)
+            stats["chunks_removed"] += len(orphans)
+            manifest.bump_version()
+        manifest.commit()
+
+    for res in _fetch_all(sources, manifest, workers, splitter):
+        url = res["url"]
+        if res["status"] == "error":
+            stats["errors"] += 1
+            print(f"Failed to fetch {url}: {res['error']}")
+            continue
+        if res["status"] == "not_modified":
+            stats["not_modified"] += 1
+            continue
+        stats["fetched"] += 1
+        known = manifest.source(url)
+        content_hash = res["content_hash"]
+        if known and known["content_hash"] == content_hash:
+            # Same content behind a new ETag/mtime: just refresh the validators
+            stats["unchanged"] += 1
+            pending_sources.append((url, res["etag"], res["last_modified"], content_hash, None))
+            continue
+
+        old_ids = manifest.chunk_ids(url)
+        new_ids = set()
+        for chunk, codes in res["chunks"]:
+            cid = _sha256(chunk)
+            new_ids.add(cid)
+            if cid in queued or manifest.is_stored(cid):
+                continue
+            queued.add(cid)
+            pending_ids.append(cid)
+            pending_texts.append(chunk)
+            # City flags let queries pre-filter on the cities a chunk mentions
+            pending_metas.append({"source": url, "chunk_hash": cid, **city_flags(codes)})
+            if len(pending_ids) >= batch_size:
+                flush()
+
+        pending_sources.append((url, res["etag"], res["last_modified"], content_hash, new_ids))
+        if old_ids - new_ids:
+            pending_stale.append(old_ids - new_ids)
+
+    flush()
+
+    if prune:
+        for url in set(manifest.urls()) - set(sources):
+            ids = manifest.chunk_ids(url)
+            manifest.remove(url)
+            orphans = manifest.orphans(ids)
+            if orphans:
+                store.delete(ids=orphans)
+                stats["chunks_removed"] += len(orphans)
+                manifest.bump_version()
+            stats["sources_pruned"] += 1
+        manifest.commit()
+
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Incrementally ingest travel blog pages into Chroma.")
+    ap.add_argument("sources", nargs="*", help="URLs or local HTML files (default: built-in blog list)")
+    ap.add_argument("--urls-file", help="file with one URL or path per line")
+    ap.add_argument("--workers", type=int, default=8, help="concurrent fetches")
+    ap.add_argument("--batch-size", type=int, default=64, help="chunks per embedding batch")
+    ap.add_argument("--prune", action="store_true", help="remove sources not listed in this run")
+    args = ap.parse_args(argv)
+
+    sources = list(args.sources)
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            sources += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    stats = ingest(sources or None, workers=args.workers, batch_size=args.batch_size, prune=args.prune)
+    for k, v in stats.items():
+        print(f"{k:>15}: {v}")
+
+
+if __name__ == "__main__":
+    main()
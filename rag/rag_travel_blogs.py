@@ -1,11 +1,10 @@
+import logging
 import os
-import requests
-from bs4 import BeautifulSoup
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.prompts import PromptTemplate
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import threading
+from utils.batching import BatchGenerationEngine
+from utils.model_registry import registry
+from utils.result_cache import make_result_cache
+from utils.telemetry import cache_samples, metrics, record_tokens, span
 
 # Directory to store Chroma vector database
 CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db_travel")
@@ -16,79 +15,339 @@ DEFAULT_URLS = [
     "https://www.thebrokebackpacker.com/category/europe/"
 ]
 
-# Load Flan-T5 locally
-MODEL_NAME = "google/flan-t5-large"
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+# Local models; loaded on first use through the shared registry
+MODEL_NAME = os.getenv("FLAN_T5_MODEL", "google/flan-t5-large")
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
-def _scrape(url: str) -> str:
-    try:
-        r = requests.get(url, timeout=12, headers={"User-Agent": "travel-planner/1.0"})
-        r.raise_for_status()
-        soup = BeautifulSoup(r.text, "html.parser")
-        return "\n\n".join(p.get_text(" ", strip=True) for p in soup.find_all("p"))
-    except Exception as e:
-        print(f"Failed to scrape {url}: {e}")
-        return ""
+# Local generation: dynamic batching window, per-request token cap, CPU threads
+GEN_MAX_BATCH = int(os.getenv("GEN_MAX_BATCH", "8"))
+GEN_MAX_WAIT_MS = float(os.getenv("GEN_MAX_WAIT_MS", "15"))
+GEN_MAX_NEW_TOKENS = int(os.getenv("GEN_MAX_NEW_TOKENS", "1024"))
+GEN_NUM_THREADS = int(os.getenv("GEN_NUM_THREADS", "0"))  # 0 keeps torch's default
+# Longest pause between streamed pieces before the stream is abandoned
+GEN_STREAM_TIMEOUT = float(os.getenv("GEN_STREAM_TIMEOUT", "60"))
+GEN_INT8 = os.getenv("GEN_INT8", "false").lower() in {"1", "true", "yes"}
+
+# Retrieval: candidates over-fetched, chunks kept after MMR, and the encoder window
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", "24"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))
+RAG_DEDUP_SIMILARITY = float(os.getenv("RAG_DEDUP_SIMILARITY", "0.95"))
+RAG_MAX_INPUT_TOKENS = int(os.getenv("RAG_MAX_INPUT_TOKENS", "1024"))
+
+# Vector index: "exact" scans an in-memory matrix, "hnsw" uses Chroma's index,
+# "auto" scans exactly up to RAG_EXACT_MAX chunks. M and ef_construction only
+# apply when the collection is created; ef_search can change at any time.
+RAG_INDEX_MODE = os.getenv("RAG_INDEX_MODE", "auto")
+RAG_EXACT_MAX = int(os.getenv("RAG_EXACT_MAX", "20000"))
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "16"))
+RAG_HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "100"))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+# Query embeddings from concurrent requests share one MiniLM forward pass
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "2"))
+
+logger = logging.getLogger(__name__)
+
+def _load_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(MODEL_NAME)
+
+def _load_flan_t5():
+    import torch
+    from transformers import AutoModelForSeq2SeqLM
+    if GEN_NUM_THREADS:
+        torch.set_num_threads(GEN_NUM_THREADS)
+    tok = registry.get("flan_t5_tokenizer")
+    mdl = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+    mdl.eval()
+    if GEN_INT8:
+        # Dynamic int8 quantization of the Linear layers (CPU only)
+        mdl = torch.quantization.quantize_dynamic(mdl, {torch.nn.Linear}, dtype=torch.qint8)
+    return tok, mdl
+
+def _load_embeddings():
+    from langchain.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBED_MODEL_NAME)
+
+def _load_vectorstore():
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        persist_directory=CHROMA_DIR,
+        embedding_function=registry.get("minilm"),
+        collection_metadata={
+            "hnsw:M": RAG_HNSW_M,
+            "hnsw:construction_ef": RAG_HNSW_EF_CONSTRUCTION,
+            "hnsw:search_ef": RAG_HNSW_EF_SEARCH,
+        },
+    )
+
+def _load_retriever():
+    from rag.ingest import store_version
+    from rag.retrieval import RetrievalService
+    return RetrievalService(
+        registry.get("chroma")._collection,
+        mode=RAG_INDEX_MODE,
+        exact_max=RAG_EXACT_MAX,
+        ef_search=RAG_HNSW_EF_SEARCH,
+        # Bumped by every ingest write, also from `python -m rag.ingest` in another process
+        version=store_version,
+    )
+
+def _load_embedding_engine():
+    minilm = registry.get("minilm")
+    return BatchGenerationEngine(
+        lambda texts, _caps: minilm.embed_documents(texts),
+        max_batch_size=EMBED_MAX_BATCH,
+        max_wait_ms=EMBED_MAX_WAIT_MS,
+    )
+
+registry.register("flan_t5_tokenizer", _load_tokenizer)
+registry.register("flan_t5", _load_flan_t5)
+registry.register("minilm", _load_embeddings)
+registry.register("chroma", _load_vectorstore)
+registry.register("retriever", _load_retriever)
+registry.register("embedding_engine", _load_embedding_engine)
+
+# Bump when the RAG prompt changes so cached answers are not reused
+RAG_PROMPT_VERSION = "2"
+
+def embed_text(text: str):
+    """MiniLM sentence embedding, shared with the Chroma store."""
+    with span("minilm.embed"):
+        return registry.get("embedding_engine").generate(text)
+
+registry.register("rag_answer_cache", lambda: make_result_cache("rag_answers", embed=embed_text))
+
+def _rag_cache_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def _rag_cache_scope() -> str:
+    return f"{MODEL_NAME}|rag-v{RAG_PROMPT_VERSION}"
+
+def preload_models(names=None):
+    """Warm up the RAG models ahead of the first request; returns registry stats."""
+    return registry.preload(names or ["minilm", "chroma", "retriever", "embedding_engine", "flan_t5", "generation_engine"])
+
+def __getattr__(name):
+    # Backwards compatible access to the old module-level globals
+    if name == "tokenizer":
+        return registry.get("flan_t5")[0]
+    if name == "model":
+        return registry.get("flan_t5")[1]
+    raise AttributeError(name)
+
+def _extract_text(html: str) -> str:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    return "\n\n".join(p.get_text(" ", strip=True) for p in soup.find_all("p"))
 
 def build_retriever_if_needed(urls=None):
+    """Build the store on first use; later refreshes go through `python -m rag.ingest`."""
     persist = CHROMA_DIR
     if os.path.exists(persist) and any(os.scandir(persist)):
         return
 
-    urls = urls or DEFAULT_URLS
-    texts = []
-    for u in urls:
-        txt = _scrape(u)
-        if txt:
-            texts.append((u, txt))
-
-    if not texts:
+    from rag.ingest import ingest
+    stats = ingest(urls or DEFAULT_URLS)
+    if not stats["chunks_added"]:
         print("No texts retrieved for RAG.")
         return
+    print(f"Chroma vector store built with {stats['chunks_added']} chunks.")
+
+def _generate_batch(prompts, max_new_tokens):
+    """Pad and generate a batch of prompts together under inference mode.
+
+    Returns `(text, prompt_tokens, completion_tokens)` per prompt; the
+    tokens are recorded by each caller, whose request they belong to.
+    """
+    import torch
+    tokenizer, model = registry.get("flan_t5")
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=1024)
+    with torch.inference_mode():
+        outputs = model.generate(**inputs, max_new_tokens=max(max_new_tokens), do_sample=True, temperature=0.7)
+    # Each row starts with the decoder start token; trim to the caller's own cap
+    rows = [out[: cap + 1] for out, cap in zip(outputs, max_new_tokens)]
+    return [
+        (tokenizer.decode(row, skip_special_tokens=True), int(mask.sum()), int((row != tokenizer.pad_token_id).sum()))
+        for row, mask in zip(rows, inputs["attention_mask"])
+    ]
+
+registry.register("generation_engine", lambda: BatchGenerationEngine(
+    _generate_batch,
+    max_batch_size=GEN_MAX_BATCH,
+    max_wait_ms=GEN_MAX_WAIT_MS,
+    default_max_new_tokens=GEN_MAX_NEW_TOKENS,
+))
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    docs, metas = [], []
-    for src, t in texts:
-        for chunk in splitter.split_text(t):
-            docs.append(chunk)
-            metas.append({"source": src})
+def generate_itinerary(prompt: str, max_new_tokens=None) -> str:
+    # Concurrent callers share forward passes through the batching engine
+    with span("flan_t5.generate"):
+        text, prompt_tokens, completion_tokens = registry.get("generation_engine").generate(prompt, max_new_tokens)
+    # On the caller's thread, so the tokens land in this request's timings
+    record_tokens(MODEL_NAME, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return text
 
-    emb = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    Chroma.from_texts(docs, embedding=emb, metadatas=metas, persist_directory=persist)
-    print(f"Chroma vector store built with {len(docs)} chunks.")
+def stream_itinerary(prompt: str):
+    """Yield generated text piece by piece as Flan-T5 decodes it.
 
-def generate_itinerary(prompt: str) -> str:
+    An error in generation is raised here; a pause longer than
+    GEN_STREAM_TIMEOUT seconds raises TimeoutError. Decoding stops as soon
+    as the caller stops reading, e.g. when the client disconnects.
+    """
+    import queue
+    import torch
+    from threading import Thread
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+    tokenizer, model = registry.get("flan_t5")
     inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
-    outputs = model.generate(**inputs, max_length=1024, do_sample=True, temperature=0.7)
-    return tokenizer.decode(outputs[0], skip_special_tokens=True)
+    streamer = TextIteratorStreamer(tokenizer, skip_special_tokens=True, timeout=GEN_STREAM_TIMEOUT)
+    abandoned = threading.Event()
+    failed = []
+    generated = [0]
+
+    class _UntilAbandoned(StoppingCriteria):
+        # Checked after every decoding step
+        def __call__(self, input_ids, scores, **kwargs):
+            # Decoder IDs so far, after the start token (as `_generate_batch` counts them)
+            generated[0] = input_ids.shape[-1] - 1
+            return torch.full((input_ids.shape[0],), abandoned.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    def run():
+        try:
+            with torch.inference_mode():
+                model.generate(**inputs, max_new_tokens=GEN_MAX_NEW_TOKENS, do_sample=True, temperature=0.7,
+                               streamer=streamer, stopping_criteria=StoppingCriteriaList([_UntilAbandoned()]))
+        except Exception as e:
+            failed.append(e)
+            # Unblock the consumer, which would otherwise wait for text that never comes
+            streamer.text_queue.put(streamer.stop_signal)
+
+    worker = Thread(target=run, daemon=True)
+    worker.start()
+    timed_out = False
+    try:
+        for text in streamer:
+            if text:
+                yield text
+        if failed:
+            raise failed[0]
+    except queue.Empty:
+        timed_out = True
+        raise TimeoutError(f"Flan-T5 produced nothing for {GEN_STREAM_TIMEOUT}s")
+    finally:
+        # Also reached when the caller closes the generator early
+        abandoned.set()
+        if not timed_out:
+            # The worker notices within one decoding step
+            worker.join(GEN_STREAM_TIMEOUT)
+        # On the caller's thread, so the tokens land in this request's timings
+        record_tokens(MODEL_NAME, prompt_tokens=int(inputs["attention_mask"].sum()), completion_tokens=generated[0])
+
+RAG_TEMPLATE = (
+    "You are a professional travel planner.\n"
+    "User request: {query}\n\n"
+    "Here are some travel blog excerpts:\n{context}\n\n"
+    "Based on these, create a detailed travel itinerary including:\n"
+    "- Day-by-day breakdown\n"
+    "- Activities and attractions\n"
+    "- Food recommendations\n"
+    "- Local tips\n"
+    "- Estimated costs where possible\n"
+    "Make it structured and easy to read."
+)
 
-def rag_query(query: str) -> str:
-    # Load vector store
-    emb = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vect = Chroma(persist_directory=CHROMA_DIR, embedding_function=emb)
+_context_stats = {"queries": 0, "tokens_used": 0, "tokens_dropped": 0, "duplicates_removed": 0}
+_context_lock = threading.Lock()
 
-    # Retrieve relevant chunks
-    docs = vect.similarity_search(query, k=8)
-    context = "\n\n".join(d.page_content for d in docs)
+def context_stats() -> dict:
+    """Running totals of context tokens packed vs dropped across queries."""
+    with _context_lock:
+        return dict(_context_stats)
+
+def _retrieve_candidates(query_vec, fetch_k: int, cities=()):
+    """(text, embedding) pairs for the nearest chunks, restricted to `cities` (IATA codes) when given."""
+    return registry.get("retriever").search([query_vec], fetch_k, cities)[0]
+
+def _rag_prompt(query: str, cities=()) -> str:
+    from langchain_core.prompts import PromptTemplate
+    from rag.context import build_context
+    tokenizer = registry.get("flan_t5_tokenizer")
+
+    def count_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(text: str, n: int) -> str:
+        ids = tokenizer.encode(text, add_special_tokens=False)[:n]
+        return tokenizer.decode(ids, skip_special_tokens=True)
 
     # Prepare prompt
-    prompt = PromptTemplate(
-        template=(
-            "You are a professional travel planner.\n"
-            "User request: {query}\n\n"
-            "Here are some travel blog excerpts:\n{context}\n\n"
-            "Based on these, create a detailed travel itinerary including:\n"
-            "- Day-by-day breakdown\n"
-            "- Activities and attractions\n"
-            "- Food recommendations\n"
-            "- Local tips\n"
-            "- Estimated costs where possible\n"
-            "Make it structured and easy to read."
-        ),
-        input_variables=["query", "context"]
+    prompt = PromptTemplate(template=RAG_TEMPLATE, input_variables=["query", "context"])
+
+    # Whatever the template and query leave of the encoder window goes to context
+    # (+1 for the end-of-sequence token the tokenizer appends)
+    budget = RAG_MAX_INPUT_TOKENS - count_tokens(prompt.format(query=query, context="")) - 1
+
+    # Over-fetch, dedup, MMR re-rank and pack the excerpts into the budget
+    query_vec = embed_text(query)
+    context, report = build_context(
+        query_vec,
+        _retrieve_candidates(query_vec, RAG_FETCH_K, cities),
+        count_tokens,
+        truncate,
+        budget,
+        k=RAG_TOP_K,
+        lambda_mult=RAG_MMR_LAMBDA,
+        dedup_threshold=RAG_DEDUP_SIMILARITY,
     )
+    with _context_lock:
+        _context_stats["queries"] += 1
+        for key in ("tokens_used", "tokens_dropped", "duplicates_removed"):
+            _context_stats[key] += report[key]
+    logger.info("RAG context for %r: %s", query, report)
+
+    return prompt.format(query=query, context=context)
+
+def rag_query(query: str, cities=()) -> str:
+    with span("rag.query") as attrs:
+        cache = registry.get("rag_answer_cache")
+        key = _rag_cache_key(query)
+        if cache:
+            cached = cache.get(key, _rag_cache_scope())
+            if cached is not None:
+                attrs["cache"] = "hit"
+                return cached
+        itinerary = generate_itinerary(_rag_prompt(query, cities))
+        if cache and itinerary:
+            cache.set(key, _rag_cache_scope(), itinerary)
+        return itinerary
+
+def rag_query_stream(query: str, cities=()):
+    """Streaming variant of `rag_query`."""
+    cache = registry.get("rag_answer_cache")
+    key = _rag_cache_key(query)
+    if cache:
+        cached = cache.get(key, _rag_cache_scope())
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    with span("flan_t5.stream"):
+        for text in stream_itinerary(_rag_prompt(query, cities)):
+            parts.append(text)
+            yield text
+    if cache and parts:
+        cache.set(key, _rag_cache_scope(), "".join(parts))
+
+def _metric_samples():
+    if registry.is_loaded("rag_answer_cache") and registry.get("rag_answer_cache"):
+        stats = registry.get("rag_answer_cache").stats()
+        yield from cache_samples("rag_answers", stats, hits=("exact_hits", "semantic_hits"))
+    for key, value in context_stats().items():
+        yield (f"travel_rag_context_{key}_total", "counter", "RAG context assembly totals", {}, value)
+    if registry.is_loaded("retriever"):
+        for key, value in registry.get("retriever").stats().items():
+            yield ("travel_rag_retrieval_queries_total", "counter", "Vector queries by kind", {"kind": key}, value)
 
-    full_prompt = prompt.format(query=query, context=context)
-    itinerary = generate_itinerary(full_prompt)
-    return itinerary
+metrics.add_collector("rag", _metric_samples)
@@ -0,0 +1,185 @@
+"""Vector retrieval over the travel blog collection.
+
+`RetrievalService` holds the one open Chroma collection for the process
+and answers batched vector queries, optionally restricted to chunks that
+mention the trip's cities. Chunks are tagged at ingest time with one
+boolean metadata flag per city code (`city_PAR`, ...), since Chroma
+metadata values must be scalars, so the restriction is a plain `where`
+pre-filter.
+
+Small corpora are searched exactly: the embeddings are pulled into one
+numpy matrix and scored with a single matrix product, which beats HNSW
+below a few tens of thousands of chunks and has perfect recall. Larger
+ones go through Chroma's HNSW index, whose `ef_search` and `M` come from
+the `RAG_HNSW_*` settings.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+CITY_FLAG = "city_{}"
+
+Candidate = Tuple[str, Any]
+
+
+def city_flags(codes: Iterable[str]) -> Dict[str, bool]:
+    """Chunk metadata marking the cities a chunk mentions."""
+    return {CITY_FLAG.format(code): True for code in codes}
+
+
+def city_filter(codes: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """Chroma `where` clause matching chunks that mention any of `codes`."""
+    clauses = [{CITY_FLAG.format(code): True} for code in dict.fromkeys(codes)]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+class RetrievalService:
+    """Nearest-chunk search over one long-lived collection.
+
+    `mode` is "exact", "hnsw" or "auto" (exact while the collection holds at
+    most `exact_max` chunks). In exact mode the matrix is reloaded when the
+    collection's size or `version()` changes, checked at most every
+    `refresh_seconds`. `version` should change on every write to the
+    collection, since a write that replaces chunks keeps the size.
+    """
+
+    def __init__(self, collection, mode: str = "auto", exact_max: int = 20000,
+                 ef_search: Optional[int] = None, refresh_seconds: float = 60.0,
+                 version: Optional[Callable[[], Any]] = None):
+        if mode not in {"auto", "exact", "hnsw"}:
+            raise ValueError(f"unknown retrieval mode {mode!r}")
+        self.collection = collection
+        self.mode = mode
+        self.exact_max = exact_max
+        self.refresh_seconds = refresh_seconds
+        self.version = version
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._checked = 0.0
+        self._count = None
+        self._version = None
+        self._stats = {"queries": 0, "exact": 0, "hnsw": 0, "filtered": 0, "unfiltered_fallbacks": 0}
+        if ef_search:
+            self._set_ef_search(ef_search)
+
+    def _set_ef_search(self, ef_search: int):
+        # ef_search is a query-time setting, so it can change on an existing collection
+        try:
+            meta = dict(getattr(self.collection, "metadata", None) or {})
+            meta.pop("hnsw:space", None)  # the distance function cannot be modified
+            meta["hnsw:search_ef"] = int(ef_search)
+            self.collection.modify(metadata=meta)
+        except Exception as e:
+            logger.warning("Could not set HNSW ef_search=%s, keeping the collection's: %s", ef_search, e)
+
+    def _space(self) -> str:
+        return (getattr(self.collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+    def _size(self) -> int:
+        now = time.monotonic()
+        if self._count is None or now - self._checked >= self.refresh_seconds:
+            self._count = self.collection.count()
+            self._version = self.version() if self.version else None
+            self._checked = now
+        return self._count
+
+    def use_exact(self) -> bool:
+        if self.mode != "auto":
+            return self.mode == "exact"
+        return self._size() <= self.exact_max
+
+    def _load_matrix(self):
+        stamp = (self._size(), self._version)
+        with self._lock:
+            if self._matrix is None or self._matrix[0] != stamp:
+                res = self.collection.get(include=["documents", "embeddings", "metadatas"])
+                emb = np.asarray(res["embeddings"], dtype=np.float32)
+                norms = (emb * emb).sum(axis=1)
+                # Row numbers per city flag, so pre-filtering is an index lookup
+                by_city: Dict[str, List[int]] = {}
+                for i, meta in enumerate(res["metadatas"] or []):
+                    for key, value in (meta or {}).items():
+                        if value is True and key.startswith(CITY_FLAG.format("")):
+                            by_city.setdefault(key, []).append(i)
+                by_city = {key: np.asarray(rows, dtype=int) for key, rows in by_city.items()}
+                self._matrix = (stamp, emb, norms, list(res["documents"]), by_city)
+            return self._matrix
+
+    def _exact(self, query_vecs, k: int, codes: Sequence[str]) -> List[List[Candidate]]:
+        _, emb, norms, docs, by_city = self._load_matrix()
+        if not len(docs):
+            return [[] for _ in query_vecs]
+        rows, sub, sub_norms = np.arange(len(docs)), emb, norms
+        if codes:
+            picked = [by_city[CITY_FLAG.format(c)] for c in codes if CITY_FLAG.format(c) in by_city]
+            if not picked:
+                return [[] for _ in query_vecs]
+            rows = np.unique(np.concatenate(picked))
+            sub, sub_norms = emb[rows], norms[rows]
+        q = np.asarray(query_vecs, dtype=np.float32)
+        dots = q @ sub.T
+        space = self._space()
+        if space == "cosine":
+            scores = dots / (np.sqrt(sub_norms)[None, :] * np.linalg.norm(q, axis=1)[:, None] + 1e-12)
+        elif space == "ip":
+            scores = dots
+        else:
+            # Smallest squared L2 distance first; |q|^2 is the same for every row
+            scores = 2 * dots - sub_norms[None, :]
+        k = min(k, len(rows))
+        out = []
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            out.append([(docs[rows[i]], emb[rows[i]]) for i in top])
+        return out
+
+    def _hnsw(self, query_vecs, k: int, codes: Sequence[str]) -> List[List[Candidate]]:
+        res = self.collection.query(
+            query_embeddings=[list(map(float, v)) for v in query_vecs],
+            n_results=k,
+            where=city_filter(codes),
+            include=["documents", "embeddings"],
+        )
+        docs = res.get("documents") or [[] for _ in query_vecs]
+        embs = res.get("embeddings")
+        if embs is None:
+            embs = [[] for _ in query_vecs]
+        return [list(zip(d, e)) for d, e in zip(docs, embs)]
+
+    def search(self, query_vecs, k: int, cities: Sequence[str] = ()) -> List[List[Candidate]]:
+        """(text, embedding) of the `k` nearest chunks for each query vector.
+
+        With `cities` (IATA city codes) only chunks mentioning one of them are
+        searched; a query that finds nothing that way falls back to the
+        whole collection.
+        """
+        exact = self.use_exact()
+        codes = list(dict.fromkeys(cities))
+        with span("chroma.query", n_results=k, queries=len(query_vecs),
+                  mode="exact" if exact else "hnsw", cities=len(codes)):
+            run = self._exact if exact else self._hnsw
+            results = run(query_vecs, k, codes)
+            missing = [i for i, r in enumerate(results) if codes and not r]
+            if missing:
+                for i, r in zip(missing, run([query_vecs[i] for i in missing], k, ())):
+                    results[i] = r
+        with self._lock:
+            self._stats["queries"] += len(query_vecs)
+            self._stats["exact" if exact else "hnsw"] += len(query_vecs)
+            self._stats["filtered"] += len(query_vecs) if codes else 0
+            self._stats["unfiltered_fallbacks"] += len(missing)
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
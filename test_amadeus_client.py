@@ -0,0 +1,256 @@
+# test_amadeus_client.py
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from integrations import amadeus_api
+
+class _Resp:
+    def __init__(self, body):
+        self.status = 200
+        self._body = json.dumps(body).encode()
+    def info(self):
+        return {"Content-Type": "application/json"}
+    def read(self):
+        return self._body
+
+class _FakeTransport:
+    def __init__(self):
+        self.token_calls = 0
+        self.search_calls = 0
+        self.lock = threading.Lock()
+    def __call__(self, req):
+        with self.lock:
+            if "oauth2/token" in req.full_url:
+                self.token_calls += 1
+                time.sleep(0.05)
+                return _Resp({"access_token": "tok", "expires_in": 1799})
+            self.search_calls += 1
+        return _Resp({"data": [{"id": "1", "price": {"total": "99", "currency": "EUR"}, "itineraries": []}]})
+
+def test_shared_client_refreshes_token_once_under_concurrency(monkeypatch):
+    monkeypatch.setenv("AMAD_CLIENT_ID", "id")
+    monkeypatch.setenv("AMAD_CLIENT_SECRET", "secret")
+    transport = _FakeTransport()
+    amadeus_api.reset_client()
+    try:
+        with patch.object(amadeus_api, "_PooledHTTP", lambda: transport):
+            results = []
+            # Distinct dates so the offer cache does not absorb the calls
+            threads = [
+                threading.Thread(target=lambda d=d: results.append(amadeus_api.search_flights("PAR", "ROM", f"2025-09-{d:02d}")))
+                for d in range(1, 11)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            assert amadeus_api._client() is amadeus_api._client()
+        assert transport.token_calls == 1
+        assert transport.search_calls == 10
+        assert all(r[0]["price"] == "99" for r in results)
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
+
+def test_flight_results_are_cached_by_normalized_query(monkeypatch):
+    calls = []
+    def fetch(*args):
+        calls.append(args)
+        return [{"id": "1"}]
+    amadeus_api.clear_caches()
+    monkeypatch.setattr(amadeus_api, "_fetch_flights", fetch)
+    assert amadeus_api.search_flights("par", "ROM ", "2025-09-10") == [{"id": "1"}]
+    assert amadeus_api.search_flights("PAR", "rom", "2025-09-10") == [{"id": "1"}]
+    assert len(calls) == 1
+    assert amadeus_api.cache_stats()["flights"]["hits"] >= 1
+    amadeus_api.clear_caches()
+
+def test_hotel_searches_share_a_cache_entry_for_reordered_ratings(monkeypatch):
+    calls = []
+    def fetch(*args):
+        calls.append(args)
+        return [{"hotelId": "H1"}]
+    amadeus_api.clear_caches()
+    monkeypatch.setattr(amadeus_api, "_fetch_hotels", fetch)
+    amadeus_api.search_hotels("ROM", "2025-09-10", "2025-09-12", ratings="5,4")
+    amadeus_api.search_hotels("rom", "2025-09-10", "2025-09-12", ratings="4, 5")
+    assert len(calls) == 1 and calls[0][-1] == "4,5"
+    amadeus_api.clear_caches()
+
+def test_errors_use_short_ttl(monkeypatch):
+    amadeus_api.clear_caches()
+    monkeypatch.setattr(amadeus_api, "_fetch_flights", lambda *a: [{"error": "boom"}])
+    monkeypatch.setattr(amadeus_api, "ERROR_CACHE_TTL", 0)
+    amadeus_api.search_flights("PAR", "ROM", "2025-09-10")
+    value, state = amadeus_api._flight_cache.get("PAR|ROM|2025-09-10|1|3")
+    assert state is None
+    amadeus_api.clear_caches()
+
+def test_hotel_offers_are_chunked_and_stop_once_enough_found(monkeypatch):
+    from benchmarks.fake_amadeus import FakeAmadeus
+    fake = FakeAmadeus(hotels_per_city=100)
+    amadeus_api.clear_caches()
+    monkeypatch.setattr(amadeus_api, "_client", lambda: fake)
+    monkeypatch.setattr(amadeus_api, "HOTEL_OFFER_WORKERS", 1)
+    hotels = amadeus_api.search_hotels("PAR", "2025-09-10", "2025-09-12", size=30, ratings="5,4")
+    assert len(hotels) == 30
+    offer_calls = [p for name, p in fake.calls if name == "hotel_offers"]
+    # 30 hotels need two chunks of 20; the other three chunks are never requested
+    assert [len(p["hotelIds"].split(",")) for p in offer_calls] == [20, 20]
+    assert [p for name, p in fake.calls if name == "hotel_list"] == [
+        {"cityCode": "PAR", "radius": 5, "radiusUnit": "KM", "ratings": "4,5"}
+    ]
+    # The hotel list is reused for other dates
+    amadeus_api.search_hotels("PAR", "2025-10-01", "2025-10-03", ratings="4,5")
+    assert sum(1 for name, _ in fake.calls if name == "hotel_list") == 1
+    amadeus_api.clear_caches()
+
+class _FlakyTransport:
+    """Answers `failures` (status, headers) responses to searches before succeeding."""
+    def __init__(self, failures, delay=0.0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.search_calls = 0
+        self.lock = threading.Lock()
+    def __call__(self, req):
+        if "oauth2/token" in req.full_url:
+            return _Resp({"access_token": "tok", "expires_in": 1799})
+        with self.lock:
+            self.search_calls += 1
+            failure = self.failures.pop(0) if self.failures else None
+        time.sleep(self.delay)
+        if failure:
+            status, headers = failure
+            resp = _Resp({"errors": [{"status": status, "title": "TOO MANY REQUESTS"}]})
+            resp.status = status
+            resp.info = lambda: {"Content-Type": "application/json", **headers}
+            return resp
+        return _Resp({"data": [{"id": "1", "price": {"total": "99", "currency": "EUR"}, "itineraries": []}]})
+
+def _with_transport(monkeypatch, transport):
+    monkeypatch.setenv("AMAD_CLIENT_ID", "id")
+    monkeypatch.setenv("AMAD_CLIENT_SECRET", "secret")
+    monkeypatch.setattr(amadeus_api, "_PooledHTTP", lambda: transport)
+    amadeus_api.reset_client()
+    amadeus_api.clear_caches()
+    amadeus_api.breaker.reset()
+
+def test_rate_limited_calls_are_retried_after_retry_after(monkeypatch):
+    transport = _FlakyTransport([(429, {"Retry-After": "0.2"}), (503, {})])
+    _with_transport(monkeypatch, transport)
+    monkeypatch.setattr(amadeus_api, "BACKOFF_BASE", 0.01)
+    try:
+        t0 = time.perf_counter()
+        result = amadeus_api.search_flights("PAR", "ROM", "2025-09-10")
+        assert time.perf_counter() - t0 >= 0.2
+        assert result[0]["price"] == "99"
+        assert transport.search_calls == 3
+        assert amadeus_api._stats["retries"] >= 2
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
+
+def test_circuit_opens_and_live_data_falls_back(monkeypatch):
+    import app_core
+    transport = _FlakyTransport([(500, {})] * 10)
+    _with_transport(monkeypatch, transport)
+    monkeypatch.setattr(amadeus_api, "MAX_RETRIES", 0)
+    monkeypatch.setattr(amadeus_api, "breaker", amadeus_api.CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    try:
+        for day in (10, 11):
+            assert "error" in amadeus_api.search_flights("PAR", "ROM", f"2025-09-{day}")[0]
+        assert not amadeus_api.live_search_available()
+        # Fails fast without another upstream call
+        assert "unavailable" in amadeus_api.search_flights("PAR", "ROM", "2025-09-12")[0]["error"]
+        assert transport.search_calls == 2
+        state = {"summary": {"cities": ["Paris", "Rome"], "hops": [{"from": "Paris", "to": "Rome", "date": "2025-09-13"}]}}
+        out = app_core._live_data_node(True)(state)
+        assert out["flights"][0]["note"] == "live search disabled"
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
+
+def test_half_open_probe_is_retried_and_closes_the_circuit(monkeypatch):
+    transport = _FlakyTransport([(503, {})])
+    _with_transport(monkeypatch, transport)
+    monkeypatch.setattr(amadeus_api, "BACKOFF_BASE", 0.01)
+    breaker = amadeus_api.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    monkeypatch.setattr(amadeus_api, "breaker", breaker)
+    try:
+        breaker.record_failure()
+        time.sleep(0.1)
+        # The probe gets a 503, is retried under the same permit and succeeds
+        assert amadeus_api.search_flights("PAR", "ROM", "2025-09-10")[0]["price"] == "99"
+        assert transport.search_calls == 2
+        assert breaker.state == breaker.CLOSED
+        assert amadeus_api.search_flights("PAR", "ROM", "2025-09-11")[0]["price"] == "99"
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
+
+def test_network_errors_are_retried_then_reported(monkeypatch):
+    import requests
+    class Session:
+        calls = 0
+        def request(self, *a, **kw):
+            Session.calls += 1
+            raise requests.ConnectionError("connection refused")
+    http = amadeus_api._PooledHTTP()
+    http.session = Session()
+    _with_transport(monkeypatch, http)
+    monkeypatch.setattr(amadeus_api, "BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(amadeus_api, "MAX_RETRIES", 2)
+    retries = amadeus_api._stats["retries"]
+    try:
+        # The token request fails first; it is retried like any other network error
+        assert "error" in amadeus_api.search_flights("PAR", "ROM", "2025-09-10")[0]
+        assert Session.calls == 3
+        assert amadeus_api._stats["retries"] == retries + 2
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
+        amadeus_api.breaker.reset()
+
+def test_identical_concurrent_searches_share_one_call(monkeypatch):
+    transport = _FlakyTransport([], delay=0.2)
+    _with_transport(monkeypatch, transport)
+    try:
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(amadeus_api.search_flights("PAR", "ROM", "2025-09-10")))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(results) == 8 and all(r == results[0] for r in results)
+        assert transport.search_calls == 1
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
+
+def test_local_errors_do_not_trip_the_breaker(monkeypatch):
+    breaker = amadeus_api.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    monkeypatch.setattr(amadeus_api, "breaker", breaker)
+    monkeypatch.delenv("AMAD_CLIENT_ID", raising=False)
+    amadeus_api.reset_client()
+    amadeus_api.clear_caches()
+    try:
+        # Missing credentials come back as an error result, not an exception
+        assert "AMAD_CLIENT_ID" in amadeus_api.search_flights("PAR", "ROM", "2025-09-10")[0]["error"]
+        _with_transport(monkeypatch, _FlakyTransport([]))
+        monkeypatch.setattr(amadeus_api, "breaker", breaker)
+        def bad_call(client):
+            raise ValueError("bad search parameters")
+        with pytest.raises(ValueError):
+            amadeus_api._request("flight_offers", bad_call)
+        assert breaker.state == breaker.CLOSED
+        assert amadeus_api.search_flights("PAR", "ROM", "2025-09-10")[0]["price"] == "99"
+    finally:
+        amadeus_api.reset_client()
+        amadeus_api.clear_caches()
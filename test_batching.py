@@ -0,0 +1,40 @@
+# test_batching.py
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.batching import BatchGenerationEngine
+
+def test_concurrent_prompts_are_batched_and_routed_back():
+    seen = []
+    def generate_batch(prompts, caps):
+        seen.append((list(prompts), list(caps)))
+        return [p.upper()[:cap] for p, cap in zip(prompts, caps)]
+    engine = BatchGenerationEngine(generate_batch, max_batch_size=8, max_wait_ms=50)
+    prompts = [f"prompt {i}" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outs = list(pool.map(lambda p: engine.generate(p, max_new_tokens=3), prompts))
+    engine.close()
+    assert outs == ["PRO"] * 8
+    assert max(len(batch) for batch, _ in seen) > 1
+    assert engine.stats()["requests"] == 8
+
+def test_batch_errors_reach_every_caller():
+    def boom(prompts, caps):
+        raise RuntimeError("oom")
+    engine = BatchGenerationEngine(boom, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        engine.generate("x")
+    engine.close()
+
+def test_engine_keeps_working_in_a_forked_child():
+    import multiprocessing
+    engine = BatchGenerationEngine(lambda prompts, caps: [p.upper() for p in prompts], max_wait_ms=1)
+    assert engine.generate("parent") == "PARENT"  # worker thread now waits on the queue
+    ctx = multiprocessing.get_context("fork")
+    parent_conn, child_conn = ctx.Pipe()
+    child = ctx.Process(target=lambda: child_conn.send(engine.generate("child", timeout=5)))
+    child.start()
+    assert parent_conn.poll(10) and parent_conn.recv() == "CHILD"
+    child.join()
+    engine.close()
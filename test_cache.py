@@ -0,0 +1,67 @@
+# test_cache.py
+import os
+import sqlite3
+import time
+
+from utils.cache import TTLCache, FRESH, STALE
+
+def test_fresh_then_stale_then_expired():
+    c = TTLCache("t", ttl=0.05, stale_ttl=0.05)
+    c.set("k", [1])
+    assert c.get("k") == ([1], FRESH)
+    time.sleep(0.06)
+    assert c.get("k") == ([1], STALE)
+    time.sleep(0.05)
+    assert c.get("k") == (None, None)
+
+def test_lru_eviction_by_count_and_bytes():
+    c = TTLCache("t", ttl=60, max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") == (None, None)
+    assert c.get("a")[1] == FRESH
+    assert c.stats()["evictions"] == 1
+
+    small = TTLCache("t", ttl=60, max_bytes=30)
+    small.set("a", "x" * 20)
+    small.set("b", "y" * 20)
+    assert small.get("a") == (None, None)
+    assert small.stats()["bytes"] <= 30
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    TTLCache("t", ttl=60, sqlite_path=path).set("k", {"v": 1})
+    other = TTLCache("t", ttl=60, sqlite_path=path)
+    assert other.get("k") == ({"v": 1}, FRESH)
+    assert other.stats()["disk_hits"] == 1
+
+def test_sqlite_backend_keeps_only_the_newest_max_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    c = TTLCache("t", ttl=60, max_entries=5, sqlite_path=path)
+    for i in range(20):
+        c.set(f"k{i}", i)
+        time.sleep(0.001)
+    TTLCache("other", ttl=60, max_entries=5, sqlite_path=path).set("x", 1)
+    rows = sqlite3.connect(path).execute("SELECT key FROM cache WHERE ns='t'").fetchall()
+    assert sorted(k for k, in rows) == [f"k{i}" for i in range(15, 20)]
+    assert TTLCache("other", ttl=60, sqlite_path=path).get("x") == (1, FRESH)
+
+def test_sqlite_backend_reconnects_in_a_forked_child(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    c = TTLCache("t", ttl=60, sqlite_path=path)
+    c.set("parent", 1)
+    parent_conn = c._db()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            c.set("child", 2)
+            code = 0 if c._db() is not parent_conn else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert c._db() is parent_conn
+    assert TTLCache("t", ttl=60, sqlite_path=path).get("child") == (2, FRESH)
@@ -0,0 +1,106 @@
+# test_checkpoints.py
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import app_core
+from utils.checkpoints import CheckpointStore
+from utils.model_registry import registry
+
+INPUTS = {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 1000, "interests": "art",
+          "map_format": "none"}
+
+def test_store_round_trip_expiry_and_gc(tmp_path):
+    store = CheckpointStore(str(tmp_path / "cp.sqlite3"), ttl=0.2)
+    run = store.run_key(INPUTS, True, False)
+    assert run == store.run_key(dict(INPUTS), True, False) != store.run_key(INPUTS, False, False)
+    store.save("req-1", run, "rag", {"rag_tips": "tips"})
+    assert store.load("req-1", run, "rag") == {"rag_tips": "tips"}
+    assert store.load("req-2", run, "rag") is None
+    time.sleep(0.3)
+    assert store.load("req-1", run, "rag") is None
+    assert store.gc() == 1
+    assert store.stats() == {"saves": 1, "resumed": 1, "expired_deleted": 1}
+
+def test_retry_with_same_request_id_resumes_after_finished_nodes(tmp_path):
+    calls = {"flights": 0, "rag": 0, "compose": 0}
+    def fake_flights(*a):
+        calls["flights"] += 1
+        return [{"id": "PAR-ROM"}]
+    def fake_rag(q, cities=()):
+        calls["rag"] += 1
+        return "tips"
+    def compose(**kw):
+        calls["compose"] += 1
+        if calls["compose"] == 1:
+            raise TimeoutError("bedrock timed out")
+        return f"plan:{kw['rag_tips']}:{len(kw['flights'])}"
+    store = CheckpointStore(str(tmp_path / "cp.sqlite3"))
+    with patch.dict(registry._instances, {"checkpoints": store}), \
+         patch.object(app_core, "search_flights", fake_flights), \
+         patch.object(app_core, "search_hotels", lambda *a: []), \
+         patch.object(app_core, "live_search_available", lambda: True), \
+         patch.object(app_core, "build_retriever_if_needed", lambda: None), \
+         patch.object(app_core, "rag_query", fake_rag), \
+         patch.object(app_core, "compose_itinerary_llm", compose):
+        with pytest.raises(TimeoutError):
+            app_core.plan(INPUTS, True, True, request_id="req-1")
+        out = app_core.plan(INPUTS, True, True, request_id="req-1")
+        assert out["itinerary_text"] == "plan:tips:1"
+        assert calls == {"flights": 1, "rag": 1, "compose": 2}
+        # Another request ID (or none) plans from scratch
+        app_core.plan(INPUTS, True, True, request_id="req-2")
+        app_core.plan(INPUTS, True, True)
+    assert calls == {"flights": 3, "rag": 3, "compose": 4}
+
+def test_failed_lookups_are_not_checkpointed(tmp_path):
+    flights = {"calls": 0}
+    def fake_flights(*a):
+        flights["calls"] += 1
+        if flights["calls"] == 1:
+            raise ConnectionError("amadeus down")
+        return [{"id": "PAR-ROM"}]
+    store = CheckpointStore(str(tmp_path / "cp.sqlite3"))
+    with patch.dict(registry._instances, {"checkpoints": store}), \
+         patch.object(app_core, "search_flights", fake_flights), \
+         patch.object(app_core, "search_hotels", lambda *a: []), \
+         patch.object(app_core, "live_search_available", lambda: True), \
+         patch.object(app_core, "compose_itinerary_llm", lambda **kw: f"plan:{kw['flights']}"):
+        first = app_core.plan(INPUTS, True, False, request_id="req-1")
+        assert "amadeus down" in first["itinerary_text"]
+        retry = app_core.plan(INPUTS, True, False, request_id="req-1")
+    # The retry searched again instead of replaying the error
+    assert flights["calls"] == 2
+    assert "PAR-ROM" in retry["itinerary_text"]
+
+def test_planning_goes_on_when_checkpoints_cannot_be_stored(tmp_path, caplog):
+    from utils import checkpoints
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    # The store's directory cannot be created: no store, one warning
+    with patch.object(checkpoints, "CHECKPOINT_DB", str(blocker / "cp.sqlite3")):
+        assert checkpoints.make_checkpoint_store() is None
+    # The file goes bad after opening: loads and saves fail quietly, warning once
+    store = CheckpointStore(str(tmp_path / "cp.sqlite3"))
+    store.path, store._local = str(tmp_path), threading.local()
+    with patch.dict(registry._instances, {"checkpoints": store}), \
+         patch.object(app_core, "search_flights", lambda *a: [{"id": "PAR-ROM"}]), \
+         patch.object(app_core, "search_hotels", lambda *a: []), \
+         patch.object(app_core, "live_search_available", lambda: True), \
+         patch.object(app_core, "compose_itinerary_llm", lambda **kw: "plan"):
+        assert app_core.plan(INPUTS, True, False, request_id="req-1")["itinerary_text"] == "plan"
+    warnings = [r.getMessage() for r in caplog.records if r.name == "utils.checkpoints"]
+    assert len(warnings) == 2 and "disabled" in warnings[0]
+
+def test_map_html_is_not_checkpointed(tmp_path):
+    store = CheckpointStore(str(tmp_path / "cp.sqlite3"))
+    inputs = {**INPUTS, "map_format": "html"}
+    with patch.dict(registry._instances, {"checkpoints": store}), \
+         patch.object(app_core, "compose_itinerary_llm", lambda **kw: "plan"), \
+         patch.object(app_core, "generate_map_html", lambda cities: "<html>map</html>"):
+        app_core.plan(inputs, False, False, request_id="req-1")
+    run = store.run_key(inputs, False, False)
+    assert store.load("req-1", run, "compose") == {"itinerary_text": "plan"}
+    assert store.load("req-1", run, "map") is None
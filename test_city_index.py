@@ -0,0 +1,60 @@
+# test_city_index.py
+import os
+from unittest.mock import patch
+
+import app_core
+from integrations.city_index import CityIndex, build_index, registry, resolve_city
+
+def test_exact_alias_and_airport_lookup():
+    idx = registry.get("city_index")
+    assert idx.lookup("Paris").code == "PAR"
+    assert idx.lookup("london").code == "LON"
+    assert idx.lookup("München").code == "MUC"
+    assert idx.lookup("CDG").name == "Paris"
+    assert idx.lookup("Bombay").name == "Mumbai"
+    assert idx.lookup("Atlantis") is None
+
+def test_fuzzy_and_qualified_names():
+    assert resolve_city("Barcelonna").code == "BCN"
+    assert resolve_city("New York, USA").code == "NYC"
+    assert resolve_city("Xyzzy") is None
+
+def test_cities_mentioned_in_text():
+    idx = registry.get("city_index")
+    found = idx.find_in_text("We flew from New York to Paris, then on to ROME.")
+    assert [c.code for c in found] == ["NYC", "PAR", "ROM"]
+
+def test_built_index_round_trips(tmp_path):
+    rows = [{"code": "AAA", "name": "Alpha", "country": "XX", "lat": 1.5, "lon": -2.25,
+             "airports": ["AAB"], "aliases": ["alfa"]}]
+    path = str(tmp_path / "t.idx")
+    assert build_index(rows, path) == 1
+    idx = CityIndex(path)
+    city = idx.lookup("ALFA")
+    assert (city.code, city.lat, city.lon, city.airports) == ("AAA", 1.5, -2.25, ("AAB",))
+    assert idx.lookup("aab").name == "Alpha"
+
+def test_unknown_cities_do_not_reach_amadeus():
+    calls = []
+    state = {"inputs": {"destinations": "London -> Atlantis", "dates": "2025-09-10", "budget": 1, "interests": ""}}
+    state.update(app_core._parse_inputs(state))
+    with patch.object(app_core, "search_flights", lambda *a: calls.append(a) or []), \
+         patch.object(app_core, "search_hotels", lambda *a: calls.append(a) or []):
+        out = app_core._live_data_node(True)(state)
+    assert calls == []
+    assert "Atlantis" in out["flights"][0][0]["note"]
+    assert "Atlantis" in out["hotels"][0]["note"]
+
+def test_stale_index_falls_back_to_memory_when_it_cannot_be_written(tmp_path):
+    from integrations import city_index
+    path = str(tmp_path / "cities.idx")
+    def read_only(rows, out_path):
+        raise PermissionError(13, "Read-only file system", out_path)
+    with patch.object(city_index, "INDEX_PATH", path), patch.object(city_index, "build_index", read_only):
+        idx = city_index._load_index()
+    assert idx.lookup("Paris").code == "PAR"
+    assert [c.code for c in idx.find_in_text("From Paris to Rome")] == ["PAR", "ROM"]
+    # Built for real, the file is renamed into place with no temporary left behind
+    with patch.object(city_index, "INDEX_PATH", path):
+        assert city_index._load_index().lookup("Paris").code == "PAR"
+    assert os.listdir(tmp_path) == ["cities.idx"]
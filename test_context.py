@@ -0,0 +1,31 @@
+# test_context.py
+from rag.context import build_context, dedup, mmr, pack
+
+def count_words(text):
+    return len(text.split())
+
+def first_words(text, n):
+    return " ".join(text.split()[:n])
+
+def test_dedup_drops_exact_and_near_duplicates():
+    cands = [("louvre tips", [1.0, 0.0]), ("louvre tips ", [1.0, 0.0]), ("louvre hints", [0.99, 0.01]), ("food", [0.0, 1.0])]
+    assert [c[0] for c in dedup(cands, 0.95)] == ["louvre tips", "food"]
+
+def test_mmr_prefers_diverse_chunks():
+    cands = [("a", [1.0, 0.0]), ("a2", [0.98, 0.2]), ("b", [0.6, 0.8])]
+    assert [c[0] for c in mmr([1.0, 0.1], cands, k=2, lambda_mult=0.5)] == ["a", "b"]
+    assert [c[0] for c in mmr([1.0, 0.1], cands, k=2, lambda_mult=1.0)] == ["a", "a2"]
+
+def test_pack_respects_budget_and_truncates_tail():
+    texts = [" ".join(["w"] * 40), " ".join(["x"] * 40), " ".join(["y"] * 40)]
+    context, report = pack(texts, count_words, first_words, budget=100, min_tail_tokens=10)
+    assert count_words(context) == report["tokens_used"] == 100
+    assert report["chunks_packed"] == 3
+    assert report["tokens_dropped"] == 20
+
+def test_build_context_reports_counts():
+    cands = [("one two three", [1.0, 0.0]), ("one two three", [1.0, 0.0]), ("four five", [0.0, 1.0])]
+    context, report = build_context([1.0, 0.0], cands, count_words, first_words, budget=4, k=8)
+    assert report["duplicates_removed"] == 1
+    assert report["tokens_used"] <= 4
+    assert context.startswith("one two three")
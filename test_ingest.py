@@ -0,0 +1,67 @@
+# test_ingest.py
+import os
+
+from integrations.city_index import registry
+from rag.ingest import Manifest, ingest, store_version
+
+class _Store:
+    def __init__(self):
+        self.docs = {}
+        self.batches = 0
+    def add_texts(self, texts, metadatas=None, ids=None):
+        self.batches += 1
+        self.docs.update(zip(ids, texts))
+    def delete(self, ids=None):
+        for i in ids:
+            self.docs.pop(i, None)
+
+def _write(path, paras, mtime):
+    with open(path, "w") as f:
+        f.write("<html><body>" + "".join(f"<p>{p}</p>" for p in paras) + "</body></html>")
+    os.utime(path, (mtime, mtime))
+
+def test_reingest_only_embeds_changes(tmp_path):
+    a, b = str(tmp_path / "a.html"), str(tmp_path / "b.html")
+    _write(a, ["Rome " * 150, "Pasta " * 150], 1000)
+    _write(b, ["Paris " * 150], 1000)
+    path = str(tmp_path / "m.sqlite3")
+    store, manifest = _Store(), Manifest(path)
+    assert store_version(path) == 0
+
+    first = ingest([a, b], store=store, manifest=manifest, batch_size=2)
+    assert first["chunks_added"] == len(store.docs) > 0
+    assert first["embed_batches"] >= 2
+    version = store_version(path)
+    assert version > 0
+
+    again = ingest([a, b], store=store, manifest=manifest)
+    assert again["not_modified"] == 2 and again["chunks_added"] == 0
+    assert store_version(path) == version
+
+    _write(a, ["Rome " * 150, "Gelato " * 150], 2000)
+    changed = ingest([a, b], store=store, manifest=manifest)
+    assert changed["chunks_added"] >= 1 and changed["chunks_removed"] >= 1
+    assert not any("Pasta" in t for t in store.docs.values())
+    assert store_version(path) > version
+
+    pruned = ingest([a], store=store, manifest=manifest, prune=True)
+    assert pruned["sources_pruned"] == 1
+    assert not any("Paris" in t for t in store.docs.values())
+
+def test_chunks_are_tagged_with_the_cities_they_mention(tmp_path):
+    page = str(tmp_path / "p.html")
+    _write(page, ["museum " * 120 + "New York", "Paris " * 100, "gelato " * 150 + "München then Rome"], 1000)
+    metas = {}
+    class _Tagged(_Store):
+        def add_texts(self, texts, metadatas=None, ids=None):
+            super().add_texts(texts, metadatas, ids)
+            metas.update(zip(ids, metadatas))
+    store = _Tagged()
+    ingest([page], store=store, manifest=Manifest(str(tmp_path / "m.sqlite3")))
+    index = registry.get("city_index")
+    assert len(store.docs) > 2
+    for cid, text in store.docs.items():
+        # Tagging the whole page once gives each chunk what scanning the chunk would
+        expected = {f"city_{c.code}" for c in index.find_in_text(text)}
+        assert {k for k, v in metas[cid].items() if k.startswith("city_") and v} == expected
+    assert any(metas[cid].get("city_MUC") for cid in store.docs)
@@ -0,0 +1,77 @@
+# test_limiter.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.concurrency import Memo, SingleFlight
+from utils.limiter import CircuitBreaker, ConcurrencyLimiter, Saturated, TokenBucket, backoff_delay
+
+def test_token_bucket_paces_after_burst():
+    bucket = TokenBucket(rate=20, burst=2)
+    t0 = time.perf_counter()
+    for _ in range(4):
+        assert bucket.acquire()
+    # Two tokens up front, then one every 50 ms
+    assert 0.08 <= time.perf_counter() - t0 < 0.3
+    slow = TokenBucket(rate=1, burst=1)
+    slow.acquire()
+    assert slow.acquire(timeout=0.1) is False
+    assert slow.stats()["throttled"] == 1
+
+def test_multi_slot_requests_count_every_slot():
+    limiter = ConcurrencyLimiter(max_concurrency=4, max_waiting=4, queue_timeout=0.1)
+    async def run():
+        async with limiter.slot(3):
+            assert limiter.stats()["in_flight"] == 3
+            async with limiter.slot():
+                assert limiter.stats()["in_flight"] == 4
+                # Waits for three slots that never free up, then gives back what it took
+                with pytest.raises(Saturated):
+                    async with limiter.slot(3):
+                        pass
+            assert limiter.stats()["in_flight"] == 3
+        return limiter.stats()
+    assert asyncio.run(run()) == {"in_flight": 0, "waiting": 0, "rejected": 1}
+
+def test_circuit_breaker_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    time.sleep(0.12)
+    assert breaker.allow()       # the single probe
+    assert not breaker.allow()   # everyone else still fails fast
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+def test_backoff_honors_retry_after():
+    assert all(0 <= backoff_delay(3, 0.1, 0.5) <= 0.5 for _ in range(50))
+    assert backoff_delay(0, 0.1, 0.5, retry_after=2) == 2
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight, calls, results = SingleFlight(), [], []
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["value"] * 5 and len(calls) == 1
+    assert flight.coalesced == 4
+
+def test_memo_shares_results_but_retries_errors():
+    memo, calls = Memo(), []
+    def work(value):
+        calls.append(value)
+        return value
+    assert [memo.do("k", lambda: work("a")) for _ in range(3)] == ["a"] * 3
+    assert memo.do("bad", lambda: work([{"error": "x"}]), keep=lambda r: "error" not in r[0]) == [{"error": "x"}]
+    memo.do("bad", lambda: work([{"id": 1}]), keep=lambda r: "error" not in r[0])
+    assert calls == ["a", [{"error": "x"}], [{"id": 1}]]
+    assert memo.stats() == {"requests": 5, "calls": 3, "shared": 2}
@@ -0,0 +1,101 @@
+# test_live_data.py
+import time
+from unittest.mock import patch
+
+import app_core
+from utils.concurrency import fan_out
+
+def _state(destinations, dates):
+    state = {"inputs": {"destinations": destinations, "dates": dates, "budget": 1000, "interests": "art"}}
+    state.update(app_core._parse_inputs(state))
+    return state
+
+def test_fan_out_keeps_order_and_partial_results():
+    def slow(x):
+        time.sleep(x)
+        return x
+    def boom():
+        raise ValueError("bad")
+    out = fan_out(
+        [(slow, (0.05,)), (slow, (2.0,)), (boom, ()), (slow, (0.01,))],
+        max_workers=4, call_timeout=0.3, total_timeout=1.0,
+        on_timeout=lambda i: "timeout", on_error=lambda i, e: f"error:{e}",
+    )
+    assert out == [0.05, "timeout", "error:bad", 0.01]
+
+def test_live_data_runs_hops_concurrently():
+    def fake_flights(origin, dest, date):
+        time.sleep(0.2)
+        return [{"id": f"{origin}-{dest}"}]
+    def fake_hotels(city, check_in, check_out):
+        time.sleep(0.2)
+        return [{"name": f"Hotel {city}"}]
+    state = _state("Paris -> Rome -> Berlin -> Madrid", "2025-09-10,2025-09-12,2025-09-14")
+    with patch.object(app_core, "search_flights", fake_flights), \
+         patch.object(app_core, "search_hotels", fake_hotels):
+        t0 = time.perf_counter()
+        out = app_core._live_data_node(True)(state)
+        elapsed = time.perf_counter() - t0
+    assert out["flights"] == [[{"id": "PAR-ROM"}], [{"id": "ROM-BER"}], [{"id": "BER-MAD"}]]
+    # A hotel search per overnight stop, tagged with its city
+    assert out["hotels"] == [
+        {"name": "Hotel ROM", "city": "Rome"},
+        {"name": "Hotel BER", "city": "Berlin"},
+        {"name": "Hotel MAD", "city": "Madrid"},
+    ]
+    assert elapsed < 0.6
+
+def test_hotel_queries_skip_same_day_connections():
+    state = _state("Paris -> Rome -> Berlin -> Madrid", "2025-09-10,2025-09-10,2025-09-13")
+    assert app_core._hotel_queries(state) == [
+        ("Berlin", "BER", "2025-09-10", "2025-09-13"),
+        ("Madrid", "MAD", "2025-09-13", "2025-09-15"),
+    ]
+
+def test_live_data_missing_dates():
+    state = _state("Paris -> Rome", "")
+    out = app_core._live_data_node(True)(state)
+    assert out["flights"] == [[]]
+    assert out["hotels"] == [{"note": "Invalid or missing dates for hotel search", "city": "Rome"}]
+
+def test_planner_is_compiled_once_per_flag_combination():
+    assert app_core.get_planner(False, False) is app_core.get_planner(False, False)
+    assert app_core.get_planner(True, False) is not app_core.get_planner(False, False)
+
+def test_planner_dag_merges_parallel_branches():
+    with patch.object(app_core, "compose_itinerary_llm", lambda **kw: f"plan:{kw['rag_tips']}:{len(kw['flights'])}"), \
+         patch.object(app_core, "generate_map_html", lambda cities: "<map/>"), \
+         patch.object(app_core, "build_retriever_if_needed", lambda: None), \
+         patch.object(app_core, "rag_query", lambda q, cities=(): "tips"):
+        out = app_core._build_planner(False, True).invoke(
+            {"inputs": {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 900, "interests": "art"}}
+        )
+    assert out["summary"]["cities"] == ["Paris", "Rome"]
+    assert out["itinerary_text"] == "plan:tips:1"
+    assert out["map_html"] == "<map/>"
+    assert out["flights"] == [{"note": "live search disabled"}]
+
+def test_plan_batch_shares_lookups_and_isolates_failures():
+    searched = []
+    def fake_flights(origin, dest, date):
+        searched.append((origin, dest, date))
+        return [{"id": f"{origin}-{dest}"}]
+    def compose(**kw):
+        if kw["cities"][0] == "Berlin":
+            raise RuntimeError("bedrock down")
+        return "plan"
+    trip = {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 1000, "interests": "art",
+            "use_live": True, "map_format": "none"}
+    items = [trip, dict(trip, budget=2000), dict(trip, destinations="Berlin -> Rome"), trip]
+    with patch.object(app_core, "search_flights", fake_flights), \
+         patch.object(app_core, "search_hotels", lambda *a: [{"name": "Hotel"}]), \
+         patch.object(app_core, "live_search_available", lambda: True), \
+         patch.object(app_core, "compose_itinerary_llm", compose):
+        events = list(app_core.plan_batch(items, concurrency=2))
+    done = events.pop()
+    assert sorted(e["index"] for e in events) == [0, 1, 2, 3]
+    assert {e["index"] for e in events if e["event"] == "error"} == {2}
+    assert all(e["plan"]["itinerary_text"] == "plan" for e in events if e["event"] == "result")
+    # Entries 0 and 3 are one trip; 0 and 1 share the Paris -> Rome search; all three share the Rome hotels
+    assert sorted(searched) == [("BER", "ROM", "2025-09-10"), ("PAR", "ROM", "2025-09-10")]
+    assert done == {"event": "done", "ok": 3, "errors": 1, "lookups": {"requests": 6, "calls": 3, "shared": 3}}
@@ -0,0 +1,31 @@
+# test_map_gen.py
+import map_gen
+import app_core
+
+def test_html_is_memoized_per_route():
+    map_gen._render_html.cache_clear()
+    first = map_gen.generate_map_html(["Paris", "Rome"])
+    assert first.count("L.marker") == 2
+    assert map_gen.generate_map_html(["Paris", "Rome"]) is first
+    # Order matters: a different route is a different map
+    map_gen.generate_map_html(["Rome", "Paris"])
+    assert map_gen.map_cache_stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+def test_geojson_has_points_and_route():
+    geo = map_gen.generate_map_geojson(["Paris", "Atlantis", "Rome"])
+    points = [f for f in geo["features"] if f["geometry"]["type"] == "Point"]
+    assert [p["properties"]["name"] for p in points] == ["Paris", "Rome"]
+    lon, lat = points[0]["geometry"]["coordinates"]
+    assert round(lat) == 49 and round(lon) == 2
+    [route] = [f for f in geo["features"] if f["geometry"]["type"] == "LineString"]
+    assert len(route["geometry"]["coordinates"]) == 2
+
+def test_planner_map_format_flag(monkeypatch):
+    monkeypatch.setattr(app_core, "compose_itinerary_llm", lambda **kw: "plan")
+    planner = app_core.get_planner(False, False)
+    base = {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 900, "interests": "art"}
+    geo = planner.invoke({"inputs": {**base, "map_format": "geojson"}})
+    assert "map_html" not in geo and geo["map_geojson"]["type"] == "FeatureCollection"
+    bare = planner.invoke({"inputs": {**base, "map_format": "none"}})
+    assert "map_html" not in bare and "map_geojson" not in bare
+    assert bare["itinerary_text"] == "plan"
@@ -0,0 +1,37 @@
+# test_model_registry.py
+import threading
+import pytest
+
+from utils.model_registry import ModelRegistry
+
+def test_loads_once_and_shares_instance():
+    calls = []
+    reg = ModelRegistry()
+    reg.register("m", lambda: calls.append(1) or object())
+    assert not reg.is_loaded("m")
+    first = reg.get("m")
+    assert reg.get("m") is first
+    assert calls == [1]
+    assert "load_seconds" in reg.stats()["loaded"]["m"]
+
+def test_concurrent_first_use_loads_once():
+    calls = []
+    reg = ModelRegistry()
+    reg.register("m", lambda: calls.append(1) or object())
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(reg.get("m"))) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [1]
+    assert len({id(s) for s in seen}) == 1
+
+def test_unknown_name_raises():
+    with pytest.raises(KeyError):
+        ModelRegistry().get("missing")
+
+def test_rag_module_import_is_lazy():
+    import sys
+    import rag.rag_travel_blogs  # noqa: F401
+    assert "transformers" not in sys.modules
@@ -0,0 +1,24 @@
+# test_pipeline.py
+from benchmarks.bench_pipeline import compare, offline_pipeline, run_scenario, trip
+import app_core
+
+def test_offline_pipeline_runs_end_to_end():
+    with offline_pipeline(amadeus_latency=0.0, tokens_per_sec=1e6, prefill_tokens_per_sec=1e7) as transport:
+        out = app_core.get_planner(use_live=True, use_rag=True).invoke(trip(5))
+        result = run_scenario(2, requests=2, concurrency=2)
+    assert transport.calls["/v1/security/oauth2/token"] == 1
+    assert transport.calls["/v2/shopping/flight-offers"] >= 4
+    assert len(out["flights"]) == 4 and out["flights"][0][0]["price"] == "134.65"
+    assert out["hotels"][0]["name"] == "HOTEL LUTETIA"
+    assert out["rag_tips"] and out["itinerary_text"]
+    assert out["timings"]["calls"]["chroma.query"]["count"] == 1
+    assert result["p50_ms"] > 0 and result["throughput_rps"] > 0 and result["peak_rss_mb"] > 0
+
+def test_compare_flags_only_regressions_past_threshold():
+    base = {"scenarios": {"2": {"p50_ms": 100, "p95_ms": 200, "throughput_rps": 10, "peak_rss_mb": 100}}}
+    ok = {"scenarios": {"2": {"p50_ms": 115, "p95_ms": 150, "throughput_rps": 9, "peak_rss_mb": 100}}}
+    bad = {"scenarios": {"2": {"p50_ms": 130, "p95_ms": 200, "throughput_rps": 7, "peak_rss_mb": 100}}}
+    assert compare(ok, base, 0.2) == []
+    problems = compare(bad, base, 0.2)
+    assert len(problems) == 2
+    assert any("p50_ms" in p for p in problems) and any("throughput_rps" in p for p in problems)
@@ -0,0 +1,51 @@
+# test_prompt.py
+from utils import prompt
+from utils.llm import _build_prompt
+
+def _offer(price, dep="2025-09-10T08:05:00", carrier="AF", number="1"):
+    return {"id": number, "price": price, "currency": "EUR", "itineraries": [{
+        "duration": "PT2H15M",
+        "segments": [{"departure": {"iataCode": "CDG", "at": dep}, "arrival": {"iataCode": "FCO", "at": "2025-09-10T10:20:00"},
+                      "carrierCode": carrier, "number": number}],
+    }]}
+
+HOPS = [{"from": "Paris", "to": "Rome", "date": "2025-09-10"}, {"from": "Rome", "to": "Oslo", "date": None}]
+
+def test_flights_are_projected_deduped_and_ranked():
+    flights = [[_offer("300.00", number="3"), _offer("120.00"), _offer("120.00"), _offer("200.00", number="2"),
+                _offer("250.00", number="4")], []]
+    groups, notes = prompt.project_flights(flights, HOPS, per_hop=3)
+    assert [row for _, row in groups[0]] == [
+        "1|CDG-FCO|2025-09-10|08:05|10:20|0|2h15m|AF1|120.00 EUR",
+        "1|CDG-FCO|2025-09-10|08:05|10:20|0|2h15m|AF2|200.00 EUR",
+        "1|CDG-FCO|2025-09-10|08:05|10:20|0|2h15m|AF4|250.00 EUR",
+    ]
+    assert groups[1] == [] and notes == []
+
+def test_hotels_keep_best_offer_per_hotel_and_cheapest_per_city():
+    hotels = [
+        {"name": "A", "rating": "4", "city": "Rome", "offers": [
+            {"checkInDate": "2025-09-10", "checkOutDate": "2025-09-12", "price": {"total": "300", "currency": "EUR"},
+             "room": {"description": {"text": "long room description " * 20}}},
+            {"checkInDate": "2025-09-10", "checkOutDate": "2025-09-12", "price": {"total": "250", "currency": "EUR"}},
+        ]},
+        {"name": "B", "rating": "3", "city": "Rome", "offers": [{"price": {"total": "90", "currency": "EUR"}}]},
+        {"note": "No hotels found for Oslo", "city": "Oslo"},
+    ]
+    groups, notes = prompt.project_hotels(hotels, per_city=5)
+    assert [row for _, row in groups[0]] == ["Rome|B|3|||90 EUR", "Rome|A|4|2025-09-10|2025-09-12|250 EUR"]
+    assert notes == ["No hotels found for Oslo"]
+
+def test_budget_drops_lowest_ranked_rows_round_robin():
+    groups = [[(1, "a" * 40), (2, "b" * 40)], [(1, "c" * 40), (2, "d" * 40)]]
+    # The header (1 token) and two 11-token rows fit in 25; each group keeps its cheapest
+    text = prompt.fit_rows("h|h", groups, [], budget=25)
+    assert text.splitlines() == ["h|h", "a" * 40, "c" * 40, "(2 more offers omitted)"]
+
+def test_prompt_is_compact_and_versioned():
+    flights = [[_offer(str(100 + i), number=str(i)) for i in range(10)], [{"note": "Unknown city 'Oslo'"}]]
+    text = _build_prompt(["Paris", "Rome", "Oslo"], HOPS, "art", 900, flights, [], "tip " * 2000)
+    assert "itineraries" not in text and "segments" not in text
+    assert "Route: Paris -> Rome (2025-09-10) -> Oslo" in text
+    assert "hop 2: Unknown city 'Oslo'" in text
+    assert prompt.estimate_tokens(text) < prompt.PROMPT_FLIGHT_TOKENS + prompt.PROMPT_TIPS_TOKENS + 200
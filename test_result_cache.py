@@ -0,0 +1,50 @@
+# test_result_cache.py
+import sqlite3
+import time
+
+from utils.result_cache import ResultCache
+
+def _toy_embed(text):
+    # Bag of letters: close enough for near-duplicate strings
+    vec = [0.0] * 26
+    for ch in text.lower():
+        if ch.isalpha():
+            vec[ord(ch) - 97] += 1
+    return vec
+
+def test_exact_tier_scoped_by_model_and_prompt(tmp_path):
+    cache = ResultCache("t", ttl=60, sqlite_path=str(tmp_path / "r.sqlite3"))
+    cache.set("paris->rome", "m1|v1", "plan A")
+    assert cache.get("paris->rome", "m1|v1") == "plan A"
+    assert cache.get("paris->rome", "m1|v2") is None
+    # Persisted for other processes
+    other = ResultCache("t", ttl=60, sqlite_path=str(tmp_path / "r.sqlite3"))
+    assert other.get("paris->rome", "m1|v1") == "plan A"
+    assert cache.stats()["exact_hits"] == 1
+
+def test_semantic_tier_matches_near_duplicates(tmp_path):
+    cache = ResultCache("t", ttl=60, sqlite_path=str(tmp_path / "r.sqlite3"), embed=_toy_embed, similarity=0.95)
+    cache.set("k1", "s", "plan", semantic_text="Trip paris -> rome; interests: art, food")
+    assert cache.get("k2", "s", semantic_text="Trip paris -> rome; interests: food, art") == "plan"
+    assert cache.get("k3", "s", semantic_text="Trip tokyo -> kyoto; interests: temples") is None
+    stats = cache.stats()
+    assert stats["semantic_hits"] == 1 and stats["misses"] == 1
+
+def test_semantic_tier_disables_itself_when_embedding_fails():
+    def broken(text):
+        raise RuntimeError("no model")
+    cache = ResultCache("t", ttl=60, embed=broken)
+    cache.set("k", "s", "plan")
+    assert cache.get("other", "s") is None
+    assert cache.stats()["semantic_disabled"] is True
+
+def test_disk_tiers_are_bounded_by_max_entries(tmp_path):
+    path = str(tmp_path / "r.sqlite3")
+    cache = ResultCache("t", ttl=60, max_entries=4, sqlite_path=path, embed=_toy_embed)
+    for i in range(12):
+        cache.set(f"trip {i}", "s", f"plan {i}")
+        time.sleep(0.001)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 4
+    assert conn.execute("SELECT COUNT(*) FROM semantic_cache").fetchone()[0] == 4
+    assert cache.get("trip 11", "s") == "plan 11"
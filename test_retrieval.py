@@ -0,0 +1,91 @@
+# test_retrieval.py
+import threading
+
+import numpy as np
+
+from benchmarks.stubs import HashEmbeddings, _NumpyCollection
+from rag.retrieval import RetrievalService, city_filter, city_flags
+from utils.batching import BatchGenerationEngine
+
+TEXTS = [
+    ("Paris cafes open early near the Louvre", ["PAR"]),
+    ("Rome trattorias serve cacio e pepe", ["ROM"]),
+    ("Cafes in Rome and Paris both close late", ["PAR", "ROM"]),
+    ("Night trains across Europe are cheap", []),
+]
+
+def _collection():
+    emb = HashEmbeddings()
+    return _NumpyCollection(
+        [str(i) for i in range(len(TEXTS))],
+        [t for t, _ in TEXTS],
+        emb.embed_documents([t for t, _ in TEXTS]),
+        [city_flags(codes) for _, codes in TEXTS],
+    ), emb
+
+def test_city_filter_clause():
+    assert city_filter([]) is None
+    assert city_filter(["PAR"]) == {"city_PAR": True}
+    assert city_filter(["PAR", "ROM", "PAR"]) == {"$or": [{"city_PAR": True}, {"city_ROM": True}]}
+
+def test_exact_and_hnsw_agree_and_prefilter_by_city():
+    collection, emb = _collection()
+    q = emb.embed_query("cafes in Paris")
+    exact = RetrievalService(collection, mode="exact")
+    hnsw = RetrievalService(collection, mode="hnsw")
+    assert [t for t, _ in exact.search([q], 2)[0]] == [t for t, _ in hnsw.search([q], 2)[0]]
+    for service in (exact, hnsw):
+        found = [t for t, _ in service.search([q], 4, cities=["ROM"])[0]]
+        assert set(found) == {TEXTS[1][0], TEXTS[2][0]}
+    # No chunk about Tokyo: fall back to the whole collection
+    assert len(exact.search([q], 3, cities=["TYO"])[0]) == 3
+    assert exact.stats()["unfiltered_fallbacks"] == 1
+
+def test_exact_matrix_reloads_when_collection_grows():
+    collection, emb = _collection()
+    service = RetrievalService(collection, mode="auto", exact_max=10, refresh_seconds=0)
+    assert service.use_exact()
+    service.search([emb.embed_query("trains")], 1)
+    collection.ids.append("4")
+    collection.documents.append("Ferries to the islands leave at dawn")
+    collection.metadatas.append({})
+    collection.embeddings = np.vstack([collection.embeddings, emb.embed_query("Ferries to the islands leave at dawn")])
+    [[(text, _)]] = service.search([emb.embed_query("ferries islands dawn")], 1)
+    assert text.startswith("Ferries")
+
+def test_exact_matrix_reloads_when_chunks_are_replaced_at_the_same_size():
+    collection, emb = _collection()
+    version = [1]
+    service = RetrievalService(collection, mode="exact", refresh_seconds=0, version=lambda: version[0])
+    service.search([emb.embed_query("trains")], 1)
+    text = "Ferries to the islands leave at dawn"
+    collection.documents[3] = text
+    collection.embeddings[3] = emb.embed_query(text)
+    version[0] += 1
+    [[(found, _)]] = service.search([emb.embed_query("ferries islands dawn")], 1)
+    assert found == text
+
+def test_bad_ef_search_is_logged(caplog):
+    collection, _ = _collection()
+    def modify(metadata=None):
+        raise ValueError("bad hnsw:search_ef")
+    collection.modify = modify
+    RetrievalService(collection, mode="hnsw", ef_search=64)
+    assert "ef_search=64" in caplog.text
+
+def test_concurrent_query_embeddings_share_a_batch():
+    batches = []
+    emb = HashEmbeddings()
+    def embed_batch(texts, _caps):
+        batches.append(len(texts))
+        return emb.embed_documents(texts)
+    engine = BatchGenerationEngine(embed_batch, max_batch_size=16, max_wait_ms=50)
+    out = {}
+    threads = [threading.Thread(target=lambda i=i: out.__setitem__(i, engine.generate(f"query {i}"))) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.close()
+    assert out[3] == emb.embed_query("query 3")
+    assert len(batches) < 6
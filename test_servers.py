@@ -0,0 +1,173 @@
+# test_servers.py
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+import httpx
+
+import app_core
+import mcp_server
+from utils.limiter import ConcurrencyLimiter
+
+PAYLOAD = {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 1500, "interests": "art"}
+
+def _post_many(n, limiter):
+    async def run():
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http:
+            return await asyncio.gather(*(http.post("/tools/plan_trip", json=PAYLOAD) for _ in range(n)))
+    def slow_compose(**kw):
+        time.sleep(0.2)
+        return "plan"
+    with patch.object(mcp_server, "limiter", limiter), \
+         patch.object(app_core, "compose_itinerary_llm", slow_compose), \
+         patch.object(app_core, "generate_map_html", lambda cities: ""):
+        return asyncio.run(run())
+
+def test_plan_trip_async_path():
+    [r] = _post_many(1, ConcurrencyLimiter(4))
+    assert r.status_code == 200
+    assert r.json()["itinerary_text"] == "plan"
+
+def test_saturated_server_sheds_load_with_retry_after():
+    responses = _post_many(5, ConcurrencyLimiter(max_concurrency=1, max_waiting=1, retry_after=3))
+    codes = sorted(r.status_code for r in responses)
+    assert codes == [200, 200, 503, 503, 503]
+    shed = [r for r in responses if r.status_code == 503]
+    assert all(r.headers["Retry-After"] == "3" for r in shed)
+
+def test_plan_trip_stream_emits_updates_then_tokens():
+    import json
+    async def run():
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http:
+            return await http.post("/tools/plan_trip/stream", json=PAYLOAD)
+    with patch.object(app_core, "stream_itinerary_llm", lambda **kw: iter(["Day 1", ": Louvre"])), \
+         patch.object(app_core, "generate_map_html", lambda cities: "<map/>"):
+        r = asyncio.run(run())
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in r.text.splitlines()]
+    assert events[0] == {"event": "update", "node": "parse_inputs", "data": events[0]["data"]}
+    tokens = [e["text"] for e in events if e["event"] == "token"]
+    assert tokens == ["Day 1", ": Louvre"]
+    composed = [e for e in events if e["event"] == "update" and e["node"] == "compose"]
+    assert composed[0]["data"]["itinerary_text"] == "Day 1: Louvre"
+    assert events[-1] == {"event": "done"}
+
+def test_stream_slot_is_released_when_client_leaves_before_the_body():
+    import json
+    limiter = ConcurrencyLimiter(max_concurrency=1)
+    async def run():
+        body = json.dumps(PAYLOAD).encode()
+        scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+                 "method": "POST", "scheme": "http", "path": "/tools/plan_trip/stream", "raw_path": b"",
+                 "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+                 "client": ("test", 1), "server": ("mcp", 80)}
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        async def send(message):
+            if message["type"] == "http.response.start":
+                raise OSError("client went away")
+        try:
+            await mcp_server.app(scope, receive, send)
+        except Exception:
+            pass
+        return limiter.stats()["in_flight"]
+    with patch.object(mcp_server, "limiter", limiter):
+        assert asyncio.run(run()) == 0
+
+def test_metrics_endpoint_and_timings_in_response():
+    async def run():
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http:
+            plan = await http.post("/tools/plan_trip", json=PAYLOAD)
+            return plan, await http.get("/metrics")
+    with patch.object(app_core, "compose_itinerary_llm", lambda **kw: "plan"), \
+         patch.object(app_core, "generate_map_html", lambda cities: ""):
+        plan, scrape = asyncio.run(run())
+    assert "compose" in plan.json()["timings"]["nodes"]
+    assert scrape.headers["content-type"].startswith("text/plain")
+    assert 'travel_node_seconds_count{node="compose"}' in scrape.text
+    assert 'travel_plans_total{endpoint="plan_trip",status="ok"}' in scrape.text
+    assert 'travel_cache_hit_ratio{cache="flights"}' in scrape.text
+
+def test_plan_batch_streams_ndjson_per_trip():
+    import json
+    lines = "\n".join([json.dumps(PAYLOAD), "{not json", json.dumps({"destinations": "Paris -> Rome"}),
+                        json.dumps(dict(PAYLOAD, map_format="none"))])
+    async def run():
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http:
+            return await http.post("/tools/plan_batch", content=lines,
+                                   headers={"Content-Type": "application/x-ndjson"})
+    with patch.object(app_core, "compose_itinerary_llm", lambda **kw: "plan"), \
+         patch.object(app_core, "generate_map_html", lambda cities: ""):
+        r = asyncio.run(run())
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in r.text.splitlines()]
+    by_index = {e["index"]: e for e in events if "index" in e}
+    assert by_index[0]["event"] == by_index[3]["event"] == "result"
+    assert by_index[0]["plan"]["itinerary_text"] == "plan" and "map_html" not in by_index[3]["plan"]
+    assert by_index[1]["event"] == by_index[2]["event"] == "error"
+    assert events[-1]["event"] == "done" and (events[-1]["ok"], events[-1]["errors"]) == (2, 2)
+
+def test_plan_trip_runs_in_worker_pool():
+    from utils.worker_pool import WorkerPool
+    async def run():
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http:
+            return await http.post("/tools/plan_trip", json=PAYLOAD)
+    with patch.object(app_core, "compose_itinerary_llm", lambda **kw: f"plan from {os.getpid()}"), \
+         patch.object(app_core, "generate_map_html", lambda cities: ""):
+        # Forked after patching, so the workers plan with the stubs too
+        pool = WorkerPool(app_core.JOBS, processes=1).start()
+        try:
+            with patch.object(mcp_server, "pool", pool):
+                r = asyncio.run(run())
+        finally:
+            pool.close()
+    assert r.status_code == 200
+    assert r.json()["itinerary_text"] != f"plan from {os.getpid()}"
+    assert pool.stats()["completed"] == 1
+
+def test_a2a_retries_failed_plan_with_the_same_request_id():
+    import a2a_server
+    seen = []
+    def handler(request):
+        seen.append(request.headers["x-request-id"])
+        if len(seen) == 1:
+            return httpx.Response(500, json={"detail": "bedrock timed out"})
+        return httpx.Response(200, json={"itinerary_text": "plan"})
+    async def run():
+        transport = httpx.ASGITransport(app=a2a_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://a2a") as http:
+            return await http.post("/a2a", json={"action": "plan_trip", "payload": PAYLOAD},
+                                   headers={"X-Request-ID": "trip-7"})
+    with patch.object(a2a_server, "_http", httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        r = asyncio.run(run())
+    assert r.json() == {"status": "ok", "data": {"itinerary_text": "plan"}}
+    assert seen == ["trip-7", "trip-7"]
+
+def test_full_pool_queue_is_a_503_for_streams_and_batches():
+    from utils.worker_pool import WorkerPool
+    limiter = ConcurrencyLimiter(max_concurrency=4)
+    async def run():
+        transport = httpx.ASGITransport(app=mcp_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as http:
+            return [await http.post("/tools/plan_trip/stream", json=PAYLOAD),
+                    await http.post("/tools/plan_batch", json=[PAYLOAD])]
+    pool = WorkerPool({**app_core.JOBS, "sleep": time.sleep}, processes=1, max_queue=1, retry_after=7).start()
+    try:
+        running = pool.submit("sleep", 1)
+        time.sleep(0.2)  # picked up by the worker
+        queued = pool.submit("sleep", 0)
+        with patch.object(mcp_server, "pool", pool), patch.object(mcp_server, "limiter", limiter):
+            responses = asyncio.run(run())
+        running.result(5)
+        queued.result(5)
+    finally:
+        pool.close()
+    assert [r.status_code for r in responses] == [503, 503]
+    assert all(r.headers["Retry-After"] == "7" for r in responses)
+    assert limiter.stats()["in_flight"] == 0
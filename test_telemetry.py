@@ -0,0 +1,83 @@
+# test_telemetry.py
+import json
+
+import pytest
+
+import app_core
+from utils import telemetry
+from utils.concurrency import fan_out
+from utils.telemetry import Metrics, collect, merge_timings, record_tokens, span
+
+STATE = {"inputs": {"destinations": "Paris -> Rome", "dates": "2025-09-10", "budget": 1500, "interests": "art"}}
+
+def test_render_prometheus_text():
+    m = Metrics(buckets=(0.1, 1.0))
+    m.inc("calls_total", 2, "Calls", call="amadeus")
+    m.observe("latency_seconds", 0.5, "Latency", call="amadeus")
+    m.add_collector("x", lambda: [("hit_ratio", "gauge", "Hits", {"cache": "flights"}, 0.25)])
+    text = m.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{call="amadeus"} 2' in text
+    assert 'latency_seconds_bucket{call="amadeus",le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{call="amadeus",le="1.0"} 1' in text
+    assert 'latency_seconds_count{call="amadeus"} 1' in text
+    assert 'hit_ratio{cache="flights"} 0.25' in text
+
+def test_spans_fill_request_timings_across_fan_out_threads():
+    def call(i):
+        with span("fake.call"):
+            record_tokens("m", 3, 5)
+        return i
+    with collect() as timings:
+        with span("node_a", kind="node"):
+            assert fan_out([(call, (i,)) for i in range(4)], 4, 5, 5, lambda i: None, lambda i, e: None) == [0, 1, 2, 3]
+    assert timings["calls"]["fake.call"]["count"] == 4
+    assert timings["tokens"] == {"prompt": 12, "completion": 20}
+    assert "node_a" in timings["nodes"]
+
+def test_batched_flan_t5_tokens_land_in_each_callers_timings():
+    from unittest.mock import patch
+    from rag import rag_travel_blogs
+    from utils.batching import BatchGenerationEngine
+    from utils.model_registry import registry
+    engine = BatchGenerationEngine(lambda prompts, caps: [(p, len(p), 2) for p in prompts], max_wait_ms=50)
+    def one(prompt):
+        with collect() as timings:
+            assert rag_travel_blogs.generate_itinerary(prompt) == prompt
+        return timings["tokens"]
+    try:
+        with patch.dict(registry._instances, {"generation_engine": engine}):
+            tokens = fan_out([(one, ("ab",)), (one, ("abcd",))], 2, 5, 5, lambda p: None, lambda p, e: None)
+    finally:
+        engine.close()
+    assert tokens == [{"prompt": 2, "completion": 2}, {"prompt": 4, "completion": 2}]
+
+def test_merge_timings_sums_parallel_branches():
+    a = {"nodes": {"live_data": 0.5}, "calls": {"x": {"count": 1, "seconds": 0.2, "errors": 0}}, "tokens": {}}
+    b = {"nodes": {"rag": 0.3}, "calls": {"x": {"count": 2, "seconds": 0.1, "errors": 1}}, "tokens": {"prompt": 4}}
+    out = merge_timings(a, b)
+    assert out["nodes"] == {"live_data": 0.5, "rag": 0.3}
+    assert out["calls"]["x"] == {"count": 3, "seconds": 0.3, "errors": 1}
+    assert out["tokens"] == {"prompt": 4}
+
+def test_trace_file_links_child_spans(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(telemetry, "TRACE_FILE", str(path))
+    monkeypatch.setattr(telemetry, "_trace_fh", None)
+    with span("outer", kind="node"):
+        with pytest.raises(ValueError):
+            with span("inner"):
+                raise ValueError("boom")
+    telemetry._trace_fh.close()
+    monkeypatch.setattr(telemetry, "_trace_fh", None)
+    inner, outer = [json.loads(line) for line in path.read_text().splitlines()]
+    assert inner["parent_span_id"] == outer["span_id"]
+    assert inner["trace_id"] == outer["trace_id"]
+    assert inner["status"]["code"] == "ERROR" and outer["status"]["code"] == "OK"
+    assert outer["end_time_unix_nano"] >= inner["end_time_unix_nano"]
+
+def test_planner_returns_timing_breakdown(monkeypatch):
+    monkeypatch.setattr(app_core, "compose_itinerary_llm", lambda **kw: "plan")
+    monkeypatch.setattr(app_core, "generate_map_html", lambda cities: "")
+    out = app_core.get_planner(False, False).invoke(STATE)
+    assert set(out["timings"]["nodes"]) == {"parse_inputs", "live_data", "rag", "compose", "map"}
@@ -0,0 +1,84 @@
+# test_worker_pool.py
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from utils.limiter import Saturated
+from utils.worker_pool import JobFailed, JobTimeout, WorkerPool
+
+def _fail():
+    raise ValueError("bad trip")
+
+_held = threading.Lock()
+
+JOBS = {
+    "pid": os.getpid,
+    "ppid": os.getppid,
+    "lock_free": lambda: _held.acquire(timeout=1),
+    "sleep": time.sleep,
+    "count": lambda n: iter(range(n)),
+    "fail": _fail,
+}
+
+def test_jobs_run_in_forked_workers_that_see_preloaded_state():
+    loaded = {}
+    pool = WorkerPool({**JOBS, "loaded": lambda: loaded["model"]}, processes=2,
+                      preload=lambda: loaded.update(model="weights")).start()
+    try:
+        assert pool.run("loaded") == "weights"
+        assert pool.run("pid") != os.getpid()
+        with pytest.raises(JobFailed, match="ValueError: bad trip"):
+            pool.run("fail")
+        async def stream():
+            return [e async for e in pool.astream("count", 3)]
+        assert asyncio.run(stream()) == [0, 1, 2]
+    finally:
+        pool.close()
+
+def test_timed_out_job_kills_and_replaces_its_worker():
+    pool = WorkerPool(JOBS, processes=1, job_timeout=0.3).start()
+    try:
+        before = pool.run("pid")
+        with pytest.raises(JobTimeout):
+            pool.run("sleep", 5)
+        assert pool.run("pid") != before
+        assert pool.stats()["timeouts"] == 1
+    finally:
+        pool.close()
+
+def test_workers_are_recycled_after_max_jobs():
+    pool = WorkerPool(JOBS, processes=1, max_jobs=2).start()
+    try:
+        pids = [pool.run("pid") for _ in range(4)]
+        assert pids[0] == pids[1] != pids[2] == pids[3]
+        assert pool.stats()["recycled"] == 2
+    finally:
+        pool.close()
+
+def test_full_queue_is_rejected():
+    pool = WorkerPool(JOBS, processes=1, max_queue=1).start()
+    try:
+        running = pool.submit("sleep", 0.3)
+        time.sleep(0.1)  # picked up by the worker
+        queued = pool.submit("sleep", 0)
+        with pytest.raises(Saturated):
+            pool.submit("sleep", 0)
+        running.result(5)
+        queued.result(5)
+    finally:
+        pool.close()
+
+def test_replacements_fork_from_the_zygote_not_the_busy_parent():
+    pool = WorkerPool(JOBS, processes=1, max_jobs=1).start()
+    try:
+        zygote = pool.run("ppid")
+        assert zygote != os.getpid()
+        # The parent holds a lock while the recycled worker is replaced
+        with _held:
+            assert pool.run("ppid") == zygote
+            assert pool.run("lock_free")
+    finally:
+        pool.close()
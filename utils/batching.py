@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+# (prompts, per-prompt max_new_tokens) -> generated texts, in order
+BatchFn = Callable[[List[str], List[int]], List[str]]
+
+_engines: "weakref.WeakSet[BatchGenerationEngine]" = weakref.WeakSet()
+
+
+class BatchGenerationEngine:
+    """In-process dynamic batcher for text generation.
+
+    Callers `submit()` prompts from any thread. A single worker thread takes
+    the first queued prompt, waits up to `max_wait_ms` for more (up to
+    `max_batch_size`), runs them through `generate_batch` together and
+    resolves each caller's future with its own output.
+    """
+
+    def __init__(
+        self,
+        generate_batch: BatchFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 15,
+        default_max_new_tokens: int = 512,
+        max_queue: int = 256,
+    ):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.default_max_new_tokens = default_max_new_tokens
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "largest_batch": 0, "errors": 0}
+        _engines.add(self)
+
+    def _after_fork(self):
+        # The parent's worker thread does not exist in a forked child, but it may
+        # still be registered as a waiter on the queue and would swallow wake-ups
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name="generation-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, prompt: str, max_new_tokens: Optional[int] = None) -> Future:
+        fut: Future = Future()
+        self._ensure_worker()
+        # Blocks when the queue is full, which back-pressures callers
+        self._queue.put((prompt, max_new_tokens or self.default_max_new_tokens, fut))
+        return fut
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int] = None, timeout: Optional[float] = None) -> str:
+        return self.submit(prompt, max_new_tokens).result(timeout=timeout)
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [item for item in self._collect(first) if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with self._lock:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            try:
+                outputs = self.generate_batch([b[0] for b in batch], [b[1] for b in batch])
+                for (_, _, fut), text in zip(batch, outputs):
+                    fut.set_result(text)
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out["avg_batch"] = round(out["requests"] / out["batches"], 2) if out["batches"] else 0.0
+        out["queued"] = self._queue.qsize()
+        return out
+
+
+def _reset_after_fork():
+    for engine in list(_engines):
+        engine._after_fork()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
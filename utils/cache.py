@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+FRESH = "fresh"
+STALE = "stale"
+
+
+def trim_table(conn: sqlite3.Connection, table: str, ns: str, keep: int):
+    """Delete all but the `keep` rows of namespace `ns` that expire last.
+
+    For a fixed TTL those are the newest writes. `table` needs `ns` and
+    `expires_at` columns and an index on them, which the lookup walks.
+    """
+    conn.execute(
+        f"DELETE FROM {table} WHERE ns=? AND expires_at <"
+        f" (SELECT expires_at FROM {table} WHERE ns=? ORDER BY expires_at DESC LIMIT 1 OFFSET ?)",
+        (ns, ns, max(keep, 1) - 1),
+    )
+
+
+class TTLCache:
+    """Thread-safe TTL + LRU cache for JSON-serializable values.
+
+    Entries are fresh for `ttl` seconds and may then be served as stale for a
+    further `stale_ttl` seconds (for stale-while-revalidate callers). The
+    in-memory tier is bounded both by entry count and by the approximate
+    serialized size of the values. If `sqlite_path` is given, entries are also
+    written through to a SQLite file so several worker processes share them;
+    the file keeps at most `max_entries` per cache too, newest first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        stale_ttl: float = 0,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sqlite_path = sqlite_path
+        self._data: "OrderedDict[str, Tuple[Any, float, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "disk_hits": 0, "sets": 0, "evictions": 0}
+        if sqlite_path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " ns TEXT, key TEXT, value TEXT, expires_at REAL, stale_until REAL,"
+                " PRIMARY KEY (ns, key))"
+            )
+            self._db().execute("CREATE INDEX IF NOT EXISTS cache_by_expiry ON cache (ns, expires_at)")
+            self._db().commit()
+
+    # ---- persistence ----
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process; a forked worker must not reuse the parent's
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.sqlite_path)), exist_ok=True)
+            conn = sqlite3.connect(self.sqlite_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _disk_get(self, key: str):
+        try:
+            row = self._db().execute(
+                "SELECT value, expires_at, stale_until FROM cache WHERE ns=? AND key=?", (self.name, key)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2], len(row[0])
+
+    def _disk_set(self, key: str, raw: str, expires_at: float, stale_until: float):
+        try:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (self.name, key, raw, expires_at, stale_until),
+            )
+            if self._stats["sets"] % 256 == 0:
+                conn.execute("DELETE FROM cache WHERE ns=? AND stale_until < ?", (self.name, time.time()))
+            trim_table(conn, "cache", self.name, self.max_entries)
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    # ---- memory tier ----
+    def _drop(self, key: str):
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old[3]
+
+    def _put(self, key: str, entry):
+        self._drop(key)
+        self._data[key] = entry
+        self._bytes += entry[3]
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._data.popitem(last=False)
+            self._bytes -= evicted[3]
+            self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Tuple[Any, Optional[str]]:
+        """Return `(value, FRESH|STALE)` or `(None, None)` on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.sqlite_path:
+            entry = self._disk_get(key)
+            if entry is not None and now < entry[2]:
+                with self._lock:
+                    self._put(key, entry)
+                    self._stats["disk_hits"] += 1
+        with self._lock:
+            if entry is None or now >= entry[2]:
+                if entry is not None:
+                    self._drop(key)
+                self._stats["misses"] += 1
+                return None, None
+            if key in self._data:
+                self._data.move_to_end(key)
+            if now < entry[1]:
+                self._stats["hits"] += 1
+                return entry[0], FRESH
+            self._stats["stale_hits"] += 1
+            return entry[0], STALE
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        raw = json.dumps(value, default=str)
+        now = time.time()
+        entry = (value, now + ttl, now + ttl + stale_ttl, len(raw))
+        with self._lock:
+            self._stats["sets"] += 1
+            if entry[3] <= self.max_bytes:
+                self._put(key, entry)
+        if self.sqlite_path:
+            self._disk_set(key, raw, entry[1], entry[2])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        if self.sqlite_path:
+            try:
+                self._db().execute("DELETE FROM cache WHERE ns=?", (self.name,))
+                self._db().commit()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out.update(entries=len(self._data), bytes=self._bytes)
+        lookups = out["hits"] + out["stale_hits"] + out["misses"]
+        out["hit_rate"] = round((out["hits"] + out["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return out
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """Per-request planner checkpoints in a SQLite file.
+
+    Each finished graph node's update to `TripState` is saved under the
+    request ID and a digest of the run's inputs, so a retry of the same
+    request can skip the nodes that already finished. Rows expire `ttl`
+    seconds after they are written; expired rows are ignored on load and
+    deleted by `gc()`, which also runs every `gc_every` saves. The file is
+    shared by every process that opens it (e.g. forked planning workers).
+    """
+
+    def __init__(self, path: str, ttl: float = 3600, gc_every: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.gc_every = gc_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"saves": 0, "resumed": 0, "expired_deleted": 0}
+        self._warned = False
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " request_id TEXT, run TEXT, node TEXT, state TEXT, expires_at REAL,"
+            " PRIMARY KEY (request_id, run, node))"
+        )
+        self._db().commit()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread and process; a forked child opens its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def run_key(*parts: Any) -> str:
+        """Digest of what a run was asked to do; a retry with other inputs starts over."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+    def load(self, request_id: str, run: str, node: str) -> Optional[Dict[str, Any]]:
+        try:
+            row = self._db().execute(
+                "SELECT state FROM checkpoints WHERE request_id=? AND run=? AND node=? AND expires_at > ?",
+                (request_id, run, node, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._warn("load", e)
+            return None
+        if row is None:
+            return None
+        with self._lock:
+            self._stats["resumed"] += 1
+        return json.loads(row[0])
+
+    def save(self, request_id: str, run: str, node: str, update: Dict[str, Any]):
+        with self._lock:
+            self._stats["saves"] += 1
+            collect = self.gc_every and self._stats["saves"] % self.gc_every == 0
+        try:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+                (request_id, run, node, json.dumps(update, default=str), time.time() + self.ttl),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            # A lost checkpoint only costs the retry some work
+            self._warn("save", e)
+            return
+        if collect:
+            self.gc()
+
+    def _warn(self, op: str, e: Exception):
+        # Once per store, not once per node of every request
+        with self._lock:
+            warned, self._warned = self._warned, True
+        if not warned:
+            logger.warning("Checkpoint %s failed, planning goes on without checkpoints: %s", op, e)
+
+    def delete(self, request_id: str):
+        try:
+            conn = self._db()
+            conn.execute("DELETE FROM checkpoints WHERE request_id=?", (request_id,))
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def gc(self) -> int:
+        """Delete expired checkpoints; returns how many rows went."""
+        try:
+            conn = self._db()
+            deleted = conn.execute("DELETE FROM checkpoints WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.commit()
+        except sqlite3.Error:
+            return 0
+        with self._lock:
+            self._stats["expired_deleted"] += deleted
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+
+# Checkpoints are only written for requests that carry a request ID
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS", "true").lower() in {"1", "true", "yes"}
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", "3600"))
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "./.cache/checkpoints.sqlite3") or None
+
+
+def make_checkpoint_store() -> Optional[CheckpointStore]:
+    """Build the store from the CHECKPOINT_* settings, or None when checkpointing is off or cannot start."""
+    if not CHECKPOINTS_ENABLED or not CHECKPOINT_DB:
+        return None
+    try:
+        return CheckpointStore(CHECKPOINT_DB, ttl=CHECKPOINT_TTL)
+    except (OSError, sqlite3.Error) as e:
+        # E.g. a read-only working directory: plan without checkpoints rather than fail every request
+        logger.warning("Checkpoints disabled, cannot open %s: %s", CHECKPOINT_DB, e)
+        return None
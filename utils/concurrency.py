@@ -0,0 +1,145 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, List, Sequence, Tuple
+
+Call = Tuple[Callable[..., Any], tuple]
+
+
+def fan_out(
+    calls: Sequence[Call],
+    max_workers: int,
+    call_timeout: float,
+    total_timeout: float,
+    on_timeout: Callable[[int], Any],
+    on_error: Callable[[int, Exception], Any],
+) -> List[Any]:
+    """Run blocking calls concurrently on a bounded pool and collect results in order.
+
+    A call that runs longer than `call_timeout` seconds (measured from when it
+    starts), or is still pending when `total_timeout` elapses, is replaced by
+    `on_timeout(index)`; a call that raises is replaced by `on_error(index, exc)`.
+    Results of calls that finished in time are always kept, so callers get
+    partial results instead of an all-or-nothing failure.
+    """
+    if not calls:
+        return []
+    results: List[Any] = [None] * len(calls)
+    started = {}
+
+    def run(idx, fn, args):
+        started[idx] = time.monotonic()
+        return fn(*args)
+
+    deadline = time.monotonic() + total_timeout
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls))))
+    try:
+        # Each call runs in a copy of the caller's context (request tracing, timings)
+        futures = {
+            pool.submit(contextvars.copy_context().run, run, i, fn, args): i
+            for i, (fn, args) in enumerate(calls)
+        }
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            expiries = [started[futures[f]] + call_timeout for f in pending if futures[f] in started]
+            # Cap the wait so calls that start meanwhile get their own deadline checked
+            timeout = min(min(expiries, default=deadline), deadline, now + call_timeout) - now
+            done, pending = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+            for f in done:
+                idx = futures[f]
+                try:
+                    results[idx] = f.result()
+                except Exception as e:
+                    results[idx] = on_error(idx, e)
+            now = time.monotonic()
+            expired = {f for f in pending if futures[f] in started and now >= started[futures[f]] + call_timeout}
+            for f in expired:
+                results[futures[f]] = on_timeout(futures[f])
+            pending -= expired
+        for f in pending:
+            f.cancel()
+            results[futures[f]] = on_timeout(futures[f])
+    finally:
+        # Do not block on stragglers; their results are already replaced
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller for a key runs `fn`; callers arriving while it is in
+    flight wait and get the same result (or exception). Nothing is kept once
+    the call finishes, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class Memo:
+    """Shares results of identical calls for the lifetime of one scope (e.g. a batch).
+
+    Like `SingleFlight`, concurrent callers for a key wait on one execution;
+    unlike it, the result is kept so later callers get it too. Results for
+    which `keep(result)` is false (error payloads) and exceptions are not
+    kept, so the next caller tries again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._flight = SingleFlight()
+        self._stats = {"requests": 0, "calls": 0}
+
+    def do(self, key, fn: Callable[[], Any], keep: Callable[[Any], bool] = lambda result: True) -> Any:
+        with self._lock:
+            self._stats["requests"] += 1
+            if key in self._results:
+                return self._results[key]
+
+        def run():
+            with self._lock:
+                if key in self._results:
+                    return self._results[key]
+                self._stats["calls"] += 1
+            result = fn()
+            if keep(result):
+                with self._lock:
+                    self._results[key] = result
+            return result
+
+        return self._flight.do(key, run)
+
+    def stats(self) -> dict:
+        """Lookups requested, calls actually made and lookups answered by another's call."""
+        with self._lock:
+            return {**self._stats, "shared": self._stats["requests"] - self._stats["calls"]}
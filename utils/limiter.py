@@ -0,0 +1,212 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+
+
+class Saturated(Exception):
+    """Raised when a limiter has no free slot; carries the Retry-After hint."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("server is at capacity")
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """Bounded in-flight limit for async handlers.
+
+    At most `max_concurrency` requests run at once and at most `max_waiting`
+    wait for a slot (for no longer than `queue_timeout` seconds). Anything
+    beyond that is rejected immediately with `Saturated` instead of queueing
+    without limit. A request that runs several plans at once (a batch) holds
+    one slot per plan.
+    """
+
+    def __init__(self, max_concurrency: int, max_waiting: int = 0, queue_timeout: float = 5.0, retry_after: int = 1):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._multi = asyncio.Lock()
+        self._loop = None
+        self._admitted = 0
+        self._rejected = 0
+
+    def _bind(self):
+        # asyncio primitives belong to one event loop; start fresh if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._multi = asyncio.Lock()
+            self._loop = loop
+            self._admitted = 0
+
+    async def _acquire(self, n: int, held: list):
+        if n == 1:
+            await self._sem.acquire()
+            held.append(1)
+            return
+        # One multi-slot request gathers slots at a time, so two never hold part each and wait on the other
+        async with self._multi:
+            for _ in range(n):
+                await self._sem.acquire()
+                held.append(1)
+
+    @asynccontextmanager
+    async def slot(self, n: int = 1):
+        """Hold `n` slots (at most `max_concurrency`) for the duration of the block."""
+        self._bind()
+        n = max(1, min(n, self.max_concurrency))
+        if self._admitted + n > self.max_concurrency + self.max_waiting:
+            self._rejected += 1
+            raise Saturated(self.retry_after)
+        self._admitted += n
+        held = []
+        try:
+            try:
+                await asyncio.wait_for(self._acquire(n, held), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._rejected += 1
+                raise Saturated(self.retry_after)
+            yield
+        finally:
+            for _ in held:
+                self._sem.release()
+            self._admitted -= n
+
+    def stats(self) -> dict:
+        in_flight = self.max_concurrency - self._sem._value
+        return {"in_flight": in_flight, "waiting": self._admitted - in_flight, "rejected": self._rejected}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `burst`.
+
+    `acquire` blocks until a token is available and returns False if that
+    would take longer than `timeout` seconds.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._waited = 0.0
+        self._throttled = 0
+
+    def _reserve(self) -> float:
+        # Take a token now, or reserve the next one; returns the seconds to wait for it
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, timeout: float = None) -> bool:
+        if self.rate <= 0:
+            return True
+        wait = self._reserve()
+        if wait and timeout is not None and wait > timeout:
+            with self._lock:
+                self._tokens += 1  # give the reservation back
+                self._throttled += 1
+            return False
+        if wait:
+            with self._lock:
+                self._waited += wait
+            time.sleep(wait)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"wait_seconds": round(self._waited, 3), "throttled": self._throttled}
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive failures.
+
+    The circuit stays open for `reset_timeout` seconds, then lets a single
+    probe call through (half-open): success closes it, failure reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probing = False
+        self._lock = threading.Lock()
+        self._opens = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """True if a call may go upstream now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self):
+        """Give back a permit from `allow()` whose call says nothing about upstream health."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._opens += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probing = False
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._failures,
+                    "opens": self._opens, "rejected": self._rejected}
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: float = None) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (0-based).
+
+    A server-supplied Retry-After is a lower bound on the delay.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
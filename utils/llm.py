@@ -1,7 +1,48 @@
+import json
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from utils.model_registry import registry
+from utils.prompt import estimate_tokens, trip_sections
+from utils.result_cache import make_result_cache
+from utils.telemetry import cache_samples, metrics, record_prompt_sections, record_tokens, span
 
 USE_BEDROCK = os.getenv("USE_BEDROCK", "true").lower() in {"1", "true", "yes"}
+BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "mistral.mistral-large-2407")
+# Bump when the itinerary prompt changes so cached answers are not reused
+PROMPT_VERSION = "2"
+# Budgets within the same band share cached itineraries
+BUDGET_BAND_USD = int(os.getenv("BUDGET_BAND_USD", "250"))
+
+def _embed(text: str):
+    from rag.rag_travel_blogs import embed_text
+    return embed_text(text)
+
+registry.register("itinerary_cache", lambda: make_result_cache("itineraries", embed=_embed))
+
+def _cache_keys(cities, hops, interests, budget, flights, hotels, rag_tips) -> Tuple[str, str]:
+    """(exact key, semantic text) for a compose request, normalized for reuse."""
+    interest_set = sorted({i.strip().lower() for i in str(interests or "").split(",") if i.strip()})
+    band = int(budget) // BUDGET_BAND_USD if isinstance(budget, (int, float)) else budget
+    route = " -> ".join(c.strip().lower() for c in cities)
+    dates = ",".join(str(h.get("date")) for h in hops)
+    inputs = json.dumps([flights, hotels, rag_tips], sort_keys=True, default=str)
+    exact = json.dumps([route, dates, interest_set, band, inputs], default=str)
+    semantic = f"Trip {route} on {dates}; interests: {', '.join(interest_set)}; budget band {band}"
+    return exact, semantic
+
+def _cache_scope() -> str:
+    return f"{BEDROCK_MODEL_ID}|v{PROMPT_VERSION}"
+
+def itinerary_cache_stats() -> Optional[dict]:
+    cache = registry.get("itinerary_cache")
+    return cache.stats() if cache else None
+
+def _metric_samples():
+    # Scrapes must not build the cache just to report on it
+    if registry.is_loaded("itinerary_cache") and registry.get("itinerary_cache"):
+        yield from cache_samples("itineraries", itinerary_cache_stats(), hits=("exact_hits", "semantic_hits"))
+
+metrics.add_collector("itineraries", _metric_samples)
 
 def _fallback_compose(**kwargs) -> str:
     cities = kwargs.get("cities", [])
@@ -14,7 +55,7 @@ def _fallback_compose(**kwargs) -> str:
         lines.append("\n# Tips from Blogs\n" + rag[:1000])
     return "\n".join(lines)
 
-def compose_itinerary_llm(
+def _build_prompt(
     cities: List[str],
     hops: List[Dict[str, Any]],
     interests: str,
@@ -23,28 +64,119 @@ def compose_itinerary_llm(
     hotels: Any,
     rag_tips: str,
 ) -> str:
+    # Offers go in as compact, budgeted tables rather than raw Amadeus payloads
+    sections = trip_sections(hops, flights, hotels, rag_tips)
+    route = " -> ".join(
+        [cities[0]] + [f"{h['to']} ({h['date']})" if h.get("date") else h["to"] for h in hops]
+    ) if hops else ", ".join(cities)
     prompt = f"""
 You are a travel planner. Build a concise day-by-day itinerary.
 
-Cities: {cities}
-Hops: {hops}
+Route: {route}
 Budget (USD): {budget}
 Interests: {interests}
 
-Flight offers (may be empty): {flights}
-Hotel offers (may be empty): {hotels}
+Flight offers, cheapest first per hop (may be empty):
+{sections["flights"]}
+
+Hotel offers, cheapest first per city (may be empty):
+{sections["hotels"]}
 
 Incorporate these crowd tips (if any):
-{rag_tips}
+{sections["tips"]}
 
 Return a readable plan with days, activities, brief reasons, and where useful, tie to flights/hotels.
 """
+    record_prompt_sections(BEDROCK_MODEL_ID, {
+        **{name: estimate_tokens(text) for name, text in sections.items()},
+        "total": estimate_tokens(prompt),
+    })
+    return prompt
+
+def _bedrock():
+    from langchain_aws.chat_models import ChatBedrock
+    return ChatBedrock(model_id=BEDROCK_MODEL_ID)
+
+def _record_usage(usage: Any):
+    # Bedrock reports token usage on the message (or the last stream chunk)
+    if usage:
+        record_tokens(BEDROCK_MODEL_ID, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+def _chunk_text(content: Any) -> str:
+    # Some Bedrock models stream content as a list of typed blocks
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content)
+    return str(content or "")
+
+def compose_itinerary_llm(
+    cities: List[str],
+    hops: List[Dict[str, Any]],
+    interests: str,
+    budget: int,
+    flights: Any,
+    hotels: Any,
+    rag_tips: str,
+) -> str:
     if USE_BEDROCK:
+        cache = registry.get("itinerary_cache")
+        key, semantic = _cache_keys(cities, hops, interests, budget, flights, hotels, rag_tips)
+        if cache:
+            cached = cache.get(key, _cache_scope(), semantic)
+            if cached is not None:
+                return cached
         try:
-            from langchain_aws.chat_models import ChatBedrock
-            llm = ChatBedrock(model_id=os.getenv("BEDROCK_MODEL_ID", "mistral.mistral-large-2407"))
-            return llm.invoke(prompt).content
+            prompt = _build_prompt(cities, hops, interests, budget, flights, hotels, rag_tips)
+            llm = _bedrock()
+            with span("bedrock.invoke", model=BEDROCK_MODEL_ID):
+                msg = llm.invoke(prompt)
+            _record_usage(getattr(msg, "usage_metadata", None))
+            txt = msg.content
+            # Only successful Bedrock answers are cached, never the fallback
+            if cache and txt:
+                cache.set(key, _cache_scope(), txt, semantic)
+            return txt
         except Exception as e:
             return _fallback_compose(cities=cities, hops=hops, rag_tips=rag_tips)
     else:
         return _fallback_compose(cities=cities, hops=hops, rag_tips=rag_tips)
+
+def stream_itinerary_llm(
+    cities: List[str],
+    hops: List[Dict[str, Any]],
+    interests: str,
+    budget: int,
+    flights: Any,
+    hotels: Any,
+    rag_tips: str,
+) -> Iterator[str]:
+    """Like `compose_itinerary_llm`, but yields the itinerary as it is generated."""
+    if USE_BEDROCK:
+        cache = registry.get("itinerary_cache")
+        key, semantic = _cache_keys(cities, hops, interests, budget, flights, hotels, rag_tips)
+        if cache:
+            cached = cache.get(key, _cache_scope(), semantic)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        try:
+            prompt = _build_prompt(cities, hops, interests, budget, flights, hotels, rag_tips)
+            with span("bedrock.stream", model=BEDROCK_MODEL_ID):
+                for chunk in _bedrock().stream(prompt):
+                    _record_usage(getattr(chunk, "usage_metadata", None))
+                    text = _chunk_text(chunk.content)
+                    if text:
+                        parts.append(text)
+                        yield text
+            if cache and parts:
+                cache.set(key, _cache_scope(), "".join(parts), semantic)
+            return
+        except Exception:
+            # Only fall back if nothing reached the caller yet
+            if parts:
+                return
+    fallback = _fallback_compose(cities=cities, hops=hops, rag_tips=rag_tips)
+    for line in fallback.splitlines(keepends=True):
+        yield line
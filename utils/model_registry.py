@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process in bytes (0 if unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss is the peak, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+
+def current_private_bytes() -> int:
+    """Memory only this process uses (private pages); RSS where that is unavailable.
+
+    In a forked worker, pages still shared copy-on-write with the parent
+    count in RSS but not here.
+    """
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            return sum(int(line.split()[1]) * 1024 for line in f if line.startswith(("Private_Clean", "Private_Dirty")))
+    except (OSError, ValueError, IndexError):
+        return current_rss_bytes()
+
+class ModelRegistry:
+    """Process-wide registry of lazily loaded, shared heavy objects.
+
+    Each entry is registered with a zero-argument loader. The loader runs on
+    the first `get()` (or `preload()`), exactly once even under concurrent
+    callers, and the resulting instance is shared by every later caller.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._loaders:
+            raise KeyError(f"No loader registered for '{name}'")
+        with self._locks[name]:
+            if name in self._instances:
+                return self._instances[name]
+            rss_before = current_rss_bytes()
+            t0 = time.perf_counter()
+            inst = self._loaders[name]()
+            self._stats[name] = {
+                "load_seconds": round(time.perf_counter() - t0, 4),
+                "rss_delta_bytes": max(current_rss_bytes() - rss_before, 0),
+                "loaded_at": time.time(),
+            }
+            self._instances[name] = inst
+            return inst
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def preload(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, float]]:
+        """Warm up the given entries (all registered ones by default)."""
+        for name in list(names or self._loaders):
+            self.get(name)
+        return self.stats()
+
+    def clear(self, name: Optional[str] = None) -> None:
+        """Drop a loaded instance (or all of them) so the next get() reloads."""
+        with self._lock:
+            names = [name] if name else list(self._instances)
+            for n in names:
+                self._instances.pop(n, None)
+                self._stats.pop(n, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rss_bytes": current_rss_bytes(),
+            "registered": sorted(self._loaders),
+            "loaded": {n: dict(s) for n, s in self._stats.items()},
+        }
+
+
+# Shared by every module in this process
+registry = ModelRegistry()
@@ -0,0 +1,174 @@
+"""Compact, budgeted serialization of trip data for the itinerary prompt.
+
+Amadeus results carry far more than the itinerary needs (every segment,
+full offer policies, room descriptions). The helpers here project flight
+and hotel offers down to a few fields, drop duplicates, keep the cheapest
+few per hop / city, and write them as pipe-separated rows under a single
+header line. Each section is then held to a token budget by dropping the
+lowest-ranked rows first, round-robin across hops or cities so every one
+keeps its cheapest option as long as possible.
+"""
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PROMPT_FLIGHTS_PER_HOP = int(os.getenv("PROMPT_FLIGHTS_PER_HOP", "3"))
+PROMPT_HOTELS_PER_CITY = int(os.getenv("PROMPT_HOTELS_PER_CITY", "3"))
+# Token budgets per prompt section (estimated, see `estimate_tokens`)
+PROMPT_FLIGHT_TOKENS = int(os.getenv("PROMPT_FLIGHT_TOKENS", "350"))
+PROMPT_HOTEL_TOKENS = int(os.getenv("PROMPT_HOTEL_TOKENS", "350"))
+PROMPT_TIPS_TOKENS = int(os.getenv("PROMPT_TIPS_TOKENS", "600"))
+# Bedrock models have no local tokenizer; ~4 characters per token for English and digits
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+
+FLIGHT_HEADER = "hop|route|date|depart|arrive|stops|duration|flights|price"
+HOTEL_HEADER = "city|hotel|rating|check-in|check-out|price"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / PROMPT_CHARS_PER_TOKEN) if text else 0
+
+
+def _price(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.inf
+
+
+def _hhmm(timestamp: Optional[str]) -> str:
+    # "2025-09-10T08:05:00" -> "08:05"
+    try:
+        hours, minutes = timestamp.split("T", 1)[1].split(":")[:2]
+        return f"{int(hours):02d}:{minutes}"
+    except (AttributeError, IndexError, ValueError):
+        return ""
+
+
+def _duration(iso: Optional[str]) -> str:
+    # "PT2H15M" -> "2h15m"
+    return (iso or "").replace("PT", "").lower()
+
+
+def _notes(items: Sequence[Any]) -> List[str]:
+    return [str(i.get("note") or i.get("error")) for i in items if isinstance(i, dict) and ("note" in i or "error" in i)]
+
+
+def project_flights(flights: Sequence[Any], hops: Sequence[Dict[str, Any]],
+                    per_hop: int = PROMPT_FLIGHTS_PER_HOP) -> Tuple[List[List[Tuple[float, str]]], List[str]]:
+    """Per hop, the cheapest distinct offers as (price, row); plus notes."""
+    groups, notes = [], []
+    if flights and all(isinstance(f, dict) for f in flights):
+        # Not per hop at all, e.g. [{"note": "live search disabled"}]
+        return [], _notes(flights)
+    for idx, offers in enumerate(flights or []):
+        hop = hops[idx] if idx < len(hops) else {}
+        offers = offers if isinstance(offers, list) else [offers]
+        notes += [f"hop {idx + 1}: {n}" for n in _notes(offers)]
+        seen, rows = set(), []
+        for o in offers:
+            if not isinstance(o, dict) or "note" in o or "error" in o:
+                continue
+            segments = [s for it in (o.get("itineraries") or [])[:1] for s in it.get("segments", [])]
+            first, last = (segments[0], segments[-1]) if segments else ({}, {})
+            route = "-".join([first.get("departure", {}).get("iataCode", "")] +
+                             [s.get("arrival", {}).get("iataCode", "") for s in segments]) if segments else \
+                f"{hop.get('from', '')}-{hop.get('to', '')}"
+            key = (route, _hhmm(first.get("departure", {}).get("at")), o.get("price"))
+            if key in seen:
+                continue
+            seen.add(key)
+            row = "|".join([
+                str(idx + 1),
+                route,
+                str(hop.get("date") or ""),
+                _hhmm(first.get("departure", {}).get("at")),
+                _hhmm(last.get("arrival", {}).get("at")),
+                str(max(len(segments) - 1, 0)),
+                _duration((o.get("itineraries") or [{}])[0].get("duration")),
+                " ".join(f"{s.get('carrierCode', '')}{s.get('number', '')}" for s in segments),
+                f"{o.get('price')} {o.get('currency') or ''}".strip(),
+            ])
+            rows.append((_price(o.get("price")), row))
+        rows.sort(key=lambda r: r[0])
+        groups.append(rows[:per_hop])
+    return groups, notes
+
+
+def project_hotels(hotels: Sequence[Any], per_city: int = PROMPT_HOTELS_PER_CITY
+                   ) -> Tuple[List[List[Tuple[float, str]]], List[str]]:
+    """Per city, the cheapest distinct hotels (best offer each) as (price, row); plus notes."""
+    by_city: Dict[str, Dict[str, Tuple[float, str]]] = {}
+    notes = []
+    for h in hotels or []:
+        if not isinstance(h, dict):
+            continue
+        if "note" in h or "error" in h:
+            notes.append(str(h.get("note") or h.get("error")))
+            continue
+        offers = [o for o in h.get("offers") or [] if isinstance(o, dict)]
+        if not offers:
+            continue
+        best = min(offers, key=lambda o: _price((o.get("price") or {}).get("total")))
+        price = best.get("price") or {}
+        city = str(h.get("city") or "")
+        name = str(h.get("name") or "").strip()
+        row = "|".join([
+            city,
+            name,
+            str(h.get("rating") or ""),
+            str(best.get("checkInDate") or ""),
+            str(best.get("checkOutDate") or ""),
+            f"{price.get('total')} {price.get('currency') or ''}".strip(),
+        ])
+        current = by_city.setdefault(city, {}).get(name.lower())
+        candidate = (_price(price.get("total")), row)
+        if current is None or candidate[0] < current[0]:
+            by_city[city][name.lower()] = candidate
+    groups = [sorted(rows.values(), key=lambda r: r[0])[:per_city] for rows in by_city.values()]
+    return groups, notes
+
+
+def fit_rows(header: str, groups: List[List[Tuple[float, str]]], notes: List[str], budget: int) -> str:
+    """Header, rows and notes within `budget` tokens.
+
+    Rows are admitted by rank across groups (every group's cheapest first,
+    then every second cheapest, ...), then written back in group order.
+    """
+    lines = [header] if any(groups) else []
+    used = sum(estimate_tokens(line + "\n") for line in lines + notes)
+    kept, total = set(), sum(len(g) for g in groups)
+    for rank in range(max((len(g) for g in groups), default=0)):
+        for gi, group in enumerate(groups):
+            if rank < len(group):
+                cost = estimate_tokens(group[rank][1] + "\n")
+                if used + cost > budget:
+                    continue
+                used += cost
+                kept.add((gi, rank))
+    for gi, group in enumerate(groups):
+        lines += [row for rank, (_, row) in enumerate(group) if (gi, rank) in kept]
+    if len(kept) < total:
+        lines.append(f"({total - len(kept)} more offers omitted)")
+    return "\n".join(lines + notes)
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """`text` cut at a word boundary to about `budget` tokens."""
+    text = (text or "").strip()
+    limit = int(budget * PROMPT_CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(None, 1)[0] if " " in text[:limit] else text[:limit]
+    return cut + " ..."
+
+
+def trip_sections(hops: Sequence[Dict[str, Any]], flights: Any, hotels: Any, rag_tips: str) -> Dict[str, str]:
+    """The budgeted flights, hotels and tips sections of the itinerary prompt."""
+    flight_groups, flight_notes = project_flights(flights, hops)
+    hotel_groups, hotel_notes = project_hotels(hotels)
+    return {
+        "flights": fit_rows(FLIGHT_HEADER, flight_groups, flight_notes, PROMPT_FLIGHT_TOKENS),
+        "hotels": fit_rows(HOTEL_HEADER, hotel_groups, hotel_notes, PROMPT_HOTEL_TOKENS),
+        "tips": truncate_tokens(rag_tips, PROMPT_TIPS_TOKENS),
+    }
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.cache import TTLCache, FRESH, trim_table
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    """Nearest-neighbour answer cache over sentence embeddings.
+
+    `embed` maps text to a vector (e.g. the MiniLM model used for Chroma).
+    A lookup returns the cached value of the most similar entry in the same
+    `scope` if its cosine similarity is at least `threshold`. If embedding
+    fails (model unavailable), the tier disables itself instead of raising.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        embed: Callable[[str], List[float]],
+        threshold: float,
+        ttl: float,
+        max_entries: int = 2048,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self.disabled = False
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _db(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.sqlite_path, timeout=5)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_cache ("
+            " ns TEXT, key TEXT, scope TEXT, vec BLOB, value TEXT, expires_at REAL,"
+            " PRIMARY KEY (ns, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS semantic_cache_by_expiry ON semantic_cache (ns, expires_at)")
+        return conn
+
+    def _load(self):
+        # Warm the in-memory index from disk once, newest entries first
+        self._loaded = True
+        if not self.sqlite_path:
+            return
+        import numpy as np
+        try:
+            conn = self._db()
+            rows = conn.execute(
+                "SELECT key, scope, vec, value, expires_at FROM semantic_cache"
+                " WHERE ns=? AND expires_at > ? ORDER BY expires_at DESC LIMIT ?",
+                (self.name, time.time(), self.max_entries),
+            ).fetchall()
+            conn.close()
+        except sqlite3.Error:
+            return
+        for key, scope, vec, value, expires_at in reversed(rows):
+            self._entries[key] = (scope, np.frombuffer(vec, dtype=np.float32), json.loads(value), expires_at)
+
+    def _vector(self, text: str):
+        import numpy as np
+        vec = np.asarray(self.embed(text), dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def get(self, text: str, scope: str) -> Any:
+        if self.disabled:
+            return None
+        try:
+            import numpy as np
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                now = time.time()
+                candidates = [(k, e) for k, e in self._entries.items() if e[0] == scope and e[3] > now]
+            if not candidates:
+                return None
+            query = self._vector(text)
+            sims = np.stack([e[1] for _, e in candidates]) @ query
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                return None
+            key, entry = candidates[best]
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            return entry[2]
+        except Exception:
+            self.disabled = True
+            return None
+
+    def set(self, text: str, scope: str, value: Any):
+        if self.disabled:
+            return
+        try:
+            vec = self._vector(text)
+        except Exception:
+            self.disabled = True
+            return
+        key = _digest(scope, text)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._entries[key] = (scope, vec, value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.sqlite_path:
+            try:
+                conn = self._db()
+                conn.execute(
+                    "INSERT OR REPLACE INTO semantic_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.name, key, scope, vec.tobytes(), json.dumps(value), expires_at),
+                )
+                conn.execute("DELETE FROM semantic_cache WHERE ns=? AND expires_at < ?", (self.name, time.time()))
+                trim_table(conn, "semantic_cache", self.name, self.max_entries)
+                conn.commit()
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResultCache:
+    """Two-level cache for generated answers (itineraries, RAG tips).
+
+    The exact tier is keyed on a normalized request string plus a `scope`
+    (model id and prompt version), so a new model or prompt never serves
+    old answers. The optional semantic tier matches near-duplicate requests
+    in the same scope by embedding similarity.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int = 2048,
+        sqlite_path: Optional[str] = None,
+        embed: Optional[Callable[[str], List[float]]] = None,
+        similarity: float = 0.92,
+    ):
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+        self.exact = TTLCache(name, ttl, max_entries=max_entries, sqlite_path=sqlite_path)
+        self.semantic = (
+            SemanticCache(name, embed, similarity, ttl, max_entries=max_entries, sqlite_path=sqlite_path)
+            if embed else None
+        )
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get(self, key_text: str, scope: str, semantic_text: Optional[str] = None) -> Any:
+        value, state = self.exact.get(_digest(scope, key_text))
+        if state == FRESH:
+            self._count("exact_hits")
+            return value
+        if self.semantic is not None:
+            value = self.semantic.get(semantic_text or key_text, scope)
+            if value is not None:
+                self._count("semantic_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key_text: str, scope: str, value: Any, semantic_text: Optional[str] = None):
+        self.exact.set(_digest(scope, key_text), value)
+        if self.semantic is not None:
+            self.semantic.set(semantic_text or key_text, scope, value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        lookups = sum(out.values())
+        out["hit_rate"] = round((out["exact_hits"] + out["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        out["exact"] = self.exact.stats()
+        if self.semantic is not None:
+            out["semantic_entries"] = len(self.semantic)
+            out["semantic_disabled"] = self.semantic.disabled
+        return out
+
+
+# Shared configuration for the itinerary and RAG answer caches
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "true").lower() in {"1", "true", "yes"}
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", str(24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "2048"))
+RESULT_CACHE_DB = os.getenv("RESULT_CACHE_DB", "./.cache/results.sqlite3") or None
+RESULT_CACHE_SEMANTIC = os.getenv("RESULT_CACHE_SEMANTIC", "false").lower() in {"1", "true", "yes"}
+RESULT_CACHE_SIMILARITY = float(os.getenv("RESULT_CACHE_SIMILARITY", "0.92"))
+
+
+def make_result_cache(name: str, embed: Optional[Callable[[str], List[float]]] = None) -> Optional[ResultCache]:
+    """Build a cache from the RESULT_CACHE_* settings, or None when caching is off."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    return ResultCache(
+        name,
+        ttl=RESULT_CACHE_TTL,
+        max_entries=RESULT_CACHE_MAX_ENTRIES,
+        sqlite_path=RESULT_CACHE_DB,
+        embed=embed if RESULT_CACHE_SEMANTIC else None,
+        similarity=RESULT_CACHE_SIMILARITY,
+    )
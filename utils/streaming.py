@@ -0,0 +1,23 @@
+from typing import Any, Awaitable, Callable
+
+from starlette.responses import StreamingResponse
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """StreamingResponse that awaits `release` however the response ends.
+
+    The body generator's own `finally` only runs once iteration has started.
+    If the client goes away before the first chunk (or sending the headers
+    fails), a slot taken before responding would otherwise never be given
+    back. `release` must be safe to call twice, e.g. `AsyncExitStack.aclose`.
+    """
+
+    def __init__(self, content: Any, release: Callable[[], Awaitable[Any]], **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY", "true").lower() in {"1", "true", "yes"}
+# JSON-lines file for OpenTelemetry-style span records; unset means no span export
+TRACE_FILE = os.getenv("TRACE_FILE") or None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# A collector returns (name, type, help, labels, value) samples read at scrape time
+Sample = Tuple[str, str, str, Dict[str, Any], float]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """Minimal in-process metric store rendered in the Prometheus text format.
+
+    Counters and histograms are updated on the hot path; gauges and
+    counters owned by other components (cache stats, limiter) come from
+    collectors that are only called when `/metrics` is scraped.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], list] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Sample]]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            h = self._histograms.get(key)
+            if h is None:
+                # per-bucket counts, then sum and count
+                h = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    def add_collector(self, name: str, fn: Callable[[], Iterable[Sample]]):
+        """Register (or replace) a scrape-time sample source."""
+        with self._lock:
+            self._collectors[name] = fn
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and histogram sums/counts keyed by `name{labels}`."""
+        with self._lock:
+            out = {name + _fmt_labels(labels): v for (name, labels), v in self._counters.items()}
+            for (name, labels), h in self._histograms.items():
+                out[name + "_count" + _fmt_labels(labels)] = h[-1]
+                out[name + "_sum" + _fmt_labels(labels)] = h[-2]
+        return out
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            helps = dict(self._help)
+            collectors = list(self._collectors.values())
+
+        samples: Dict[str, list] = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append((name + _fmt_labels(labels), value))
+        for (name, labels), h in histograms.items():
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, n in zip(self.buckets, h):
+                cumulative += n
+                lines.append((name + "_bucket" + _fmt_labels(labels, (("le", repr(bound)),)), cumulative))
+            lines.append((name + "_bucket" + _fmt_labels(labels, (("le", "+Inf"),)), h[-1]))
+            lines.append((name + "_sum" + _fmt_labels(labels), h[-2]))
+            lines.append((name + "_count" + _fmt_labels(labels), h[-1]))
+        for collect in collectors:
+            try:
+                for name, kind, help, labels, value in collect():
+                    helps.setdefault(name, (kind, help))
+                    samples.setdefault(name, []).append((name + _fmt_labels(_labels(labels)), value))
+            except Exception:
+                # A broken collector must not take the whole endpoint down
+                continue
+
+        out = []
+        for name in sorted(samples):
+            kind, help = helps.get(name, ("untyped", ""))
+            if help:
+                out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(f"{series} {float(value):g}" for series, value in samples[name])
+        return "\n".join(out) + "\n"
+
+
+# Shared by every module in this process
+metrics = Metrics()
+
+# Per-request breakdown (see `collect`) and the active span for parent links
+_timings: ContextVar[Optional[Dict[str, Any]]] = ContextVar("timings", default=None)
+_current: ContextVar[Optional[Tuple[str, str]]] = ContextVar("span", default=None)
+
+_timings_lock = threading.Lock()  # fan-out threads share one request's breakdown
+_trace_lock = threading.Lock()
+_trace_fh = None
+
+
+def _export(record: Dict[str, Any]):
+    global _trace_fh
+    line = json.dumps(record, default=str)
+    with _trace_lock:
+        if _trace_fh is None:
+            os.makedirs(os.path.dirname(os.path.abspath(TRACE_FILE)), exist_ok=True)
+            _trace_fh = open(TRACE_FILE, "a", encoding="utf-8")
+        _trace_fh.write(line + "\n")
+        _trace_fh.flush()
+
+
+def empty_timings() -> Dict[str, Any]:
+    return {"nodes": {}, "calls": {}, "tokens": {}}
+
+
+def merge_timings(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine two timing breakdowns (used as the LangGraph reducer for `timings`)."""
+    out = empty_timings()
+    for part in (left, right):
+        if not part:
+            continue
+        for node, seconds in part.get("nodes", {}).items():
+            out["nodes"][node] = round(out["nodes"].get(node, 0.0) + seconds, 6)
+        for call, c in part.get("calls", {}).items():
+            acc = out["calls"].setdefault(call, {"count": 0, "seconds": 0.0, "errors": 0})
+            acc["count"] += c.get("count", 0)
+            acc["seconds"] = round(acc["seconds"] + c.get("seconds", 0.0), 6)
+            acc["errors"] += c.get("errors", 0)
+        for kind, n in part.get("tokens", {}).items():
+            out["tokens"][kind] = out["tokens"].get(kind, 0) + n
+    return out
+
+
+@contextmanager
+def collect() -> Iterator[Dict[str, Any]]:
+    """Gather the timings of every span opened in this context (and its copies)."""
+    timings = empty_timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str = "call", **attrs) -> Iterator[Dict[str, Any]]:
+    """Time a block as a graph node (`kind="node"`) or an external call.
+
+    Yields a dict the block may add attributes to; setting `error` marks
+    the span as failed without raising. Durations go to the metric store,
+    to the current request's breakdown and, with TRACE_FILE set, to the
+    span log. With TELEMETRY off this is a bare yield.
+    """
+    if not TELEMETRY_ENABLED:
+        yield attrs
+        return
+    parent = _current.get()
+    ids = None
+    if TRACE_FILE:
+        ids = (parent[0] if parent else os.urandom(16).hex(), os.urandom(8).hex())
+        reset = _current.set(ids)
+    start_ns = time.time_ns()
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("error", repr(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        failed = "error" in attrs
+        if kind == "node":
+            metrics.observe("travel_node_seconds", elapsed, "Planner graph node wall time", node=name)
+        else:
+            metrics.observe("travel_call_seconds", elapsed, "External call latency", call=name)
+            metrics.inc("travel_calls_total", 1, "External calls", call=name, status="error" if failed else "ok")
+        timings = _timings.get()
+        if timings is not None:
+            with _timings_lock:
+                if kind == "node":
+                    timings["nodes"][name] = round(timings["nodes"].get(name, 0.0) + elapsed, 6)
+                else:
+                    acc = timings["calls"].setdefault(name, {"count": 0, "seconds": 0.0, "errors": 0})
+                    acc["count"] += 1
+                    acc["seconds"] = round(acc["seconds"] + elapsed, 6)
+                    acc["errors"] += int(failed)
+        if ids is not None:
+            _current.reset(reset)
+            _export({
+                "trace_id": ids[0],
+                "span_id": ids[1],
+                "parent_span_id": parent[1] if parent else None,
+                "name": name,
+                "kind": "INTERNAL" if kind == "node" else "CLIENT",
+                "start_time_unix_nano": start_ns,
+                "end_time_unix_nano": start_ns + int(elapsed * 1e9),
+                "attributes": attrs,
+                "status": {"code": "ERROR" if failed else "OK"},
+            })
+
+
+def record_tokens(model: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    """Count LLM tokens globally and in the current request's breakdown."""
+    if not TELEMETRY_ENABLED:
+        return
+    if prompt_tokens:
+        metrics.inc("travel_llm_tokens_total", prompt_tokens, "LLM tokens", model=model, type="prompt")
+    if completion_tokens:
+        metrics.inc("travel_llm_tokens_total", completion_tokens, "LLM tokens", model=model, type="completion")
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            tokens = timings["tokens"]
+            tokens["prompt"] = tokens.get("prompt", 0) + prompt_tokens
+            tokens["completion"] = tokens.get("completion", 0) + completion_tokens
+
+
+def cache_samples(cache: str, stats: Dict[str, Any], hits=("hits",), misses=("misses",)) -> Iterator[Sample]:
+    """Collector samples (lookups by result and hit ratio) for one cache's stats dict."""
+    for key in hits + misses:
+        yield ("travel_cache_lookups_total", "counter", "Cache lookups by result",
+               {"cache": cache, "result": key}, stats.get(key, 0))
+    lookups = sum(stats.get(k, 0) for k in hits + misses)
+    ratio = sum(stats.get(k, 0) for k in hits) / lookups if lookups else 0.0
+    yield ("travel_cache_hit_ratio", "gauge", "Cache hit ratio since start", {"cache": cache}, ratio)
+
+
+def record_prompt_sections(model: str, sections: Dict[str, int]):
+    """Estimated prompt tokens per section, as histograms and in the request's breakdown."""
+    if not TELEMETRY_ENABLED:
+        return
+    for section, n in sections.items():
+        metrics.observe("travel_prompt_tokens", n, "Estimated prompt tokens per section",
+                        model=model, section=section)
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            tokens = timings["tokens"]
+            for section, n in sections.items():
+                tokens[f"prompt_{section}"] = tokens.get(f"prompt_{section}", 0) + n
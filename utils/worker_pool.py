@@ -0,0 +1,451 @@
+"""Pre-forked worker processes for CPU-bound planning jobs.
+
+Flan-T5 generation and MiniLM embedding hold the GIL, so threads in the
+server process cannot run them in parallel. `WorkerPool` runs jobs in
+forked processes instead. The parent loads the models first and then
+forks a single-threaded "zygote" process once; every worker, including
+later replacements, is forked from the zygote rather than from the busy,
+multi-threaded server, so no worker starts with a lock another thread
+held at fork time. All of them share the weights copy-on-write rather
+than loading their own copy. The objects alive at start are frozen
+(`gc.freeze()`) in the zygote, so collections in the workers do not
+write to (and so un-share) those pages.
+
+A supervisor thread in the parent hands queued jobs to idle workers over
+per-worker pipes. It kills and replaces a worker whose job runs past its
+deadline, replaces workers that die, and recycles workers after
+`max_jobs` jobs or once their private memory passes `max_private_bytes`.
+"""
+import asyncio
+import gc
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import reduction
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils.limiter import Saturated
+from utils.model_registry import current_private_bytes, current_rss_bytes
+
+Sink = Callable[[str, Any], None]
+
+
+class JobTimeout(TimeoutError):
+    """The job ran past its deadline; its worker was killed and replaced."""
+
+
+class WorkerDied(RuntimeError):
+    """The worker running the job exited before answering."""
+
+
+class JobFailed(RuntimeError):
+    """The job raised in the worker; the message names the original exception."""
+
+
+def _worker_main(conn, jobs: Dict[str, Callable[..., Any]]):
+    # Ctrl-C goes to the parent, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        job_id, kind, args = msg
+        try:
+            out = jobs[kind](*args)
+            if isinstance(out, Iterator):
+                for event in out:
+                    conn.send((job_id, "event", event, None))
+                reply = ("end", None)
+            else:
+                reply = ("result", out)
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        conn.send((job_id, *reply, (current_rss_bytes(), current_private_bytes())))
+    conn.close()
+
+
+def _zygote_main(conn, jobs: Dict[str, Callable[..., Any]]):
+    # Forks a worker for each pipe end the parent sends and answers with its pid.
+    # This process never starts a thread, so its children inherit no held locks.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The parent tracks workers through their pipes; let the kernel reap them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        fd = reduction.recv_handle(conn)
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            code = 0
+            try:
+                _worker_main(Connection(fd), jobs)
+            except BaseException:
+                code = 1
+            finally:
+                for stream in (sys.stdout, sys.stderr):
+                    try:
+                        stream.flush()
+                    except Exception:
+                        pass
+                os._exit(code)
+        os.close(fd)
+        conn.send(pid)
+    conn.close()
+
+
+class _Job:
+    __slots__ = ("id", "kind", "args", "sink", "done", "cancelled")
+
+    def __init__(self, job_id: int, kind: str, args: tuple, sink: Sink):
+        self.id, self.kind, self.args, self.sink = job_id, kind, args, sink
+        self.done = False
+        self.cancelled = False
+
+
+class _JobStream:
+    """Events of a job queued by `WorkerPool.astream`."""
+
+    def __init__(self, pool: "WorkerPool", job: _Job, events: "asyncio.Queue"):
+        self._pool, self._job, self._events = pool, job, events
+
+    def __aiter__(self) -> "_JobStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            status, payload = await self._events.get()
+        except BaseException:
+            await self.aclose()
+            raise
+        if status == "event":
+            return payload
+        if status == "end":
+            raise StopAsyncIteration
+        raise payload
+
+    async def aclose(self):
+        if not self._job.done:
+            # The consumer went away; free the worker instead of finishing unread work
+            self._job.cancelled = True
+            self._pool._wake()
+
+
+class _Worker:
+    __slots__ = ("pid", "conn", "jobs", "job", "deadline", "rss", "private")
+
+    def __init__(self, pid: int, conn):
+        self.pid, self.conn = pid, conn
+        self.jobs = 0
+        self.job: Optional[_Job] = None
+        self.deadline = 0.0
+        self.rss = self.private = 0
+
+
+class WorkerPool:
+    """Runs `jobs[kind](*args)` in `processes` forked workers.
+
+    `submit` returns a Future for jobs that return a value; `astream`
+    yields the events of jobs that return an iterator. At most `max_queue`
+    jobs wait for a worker; beyond that `submit` raises `Saturated`. A job
+    (or, for streams, the gap between two events) may take `job_timeout`
+    seconds. `preload` runs in the parent before the zygote is forked.
+    """
+
+    def __init__(
+        self,
+        jobs: Dict[str, Callable[..., Any]],
+        processes: int = 2,
+        max_queue: int = 64,
+        job_timeout: float = 120.0,
+        max_jobs: int = 0,
+        max_private_bytes: int = 0,
+        preload: Optional[Callable[[], Any]] = None,
+        retry_after: int = 1,
+    ):
+        self.jobs = jobs
+        self.processes = processes
+        self.job_timeout = job_timeout
+        self.max_jobs = max_jobs
+        self.max_private_bytes = max_private_bytes
+        self.preload = preload
+        self.retry_after = retry_after
+        self._ctx = multiprocessing.get_context("fork")
+        self._queue: "queue.Queue[_Job]" = queue.Queue(maxsize=max_queue)
+        self._ids = itertools.count(1)
+        self._workers: List[_Worker] = []
+        self._zygote = None
+        self._zygote_conn = None
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"completed": 0, "failed": 0, "timeouts": 0, "died": 0, "recycled": 0, "cancelled": 0}
+
+    def start(self) -> "WorkerPool":
+        if self.preload:
+            self.preload()
+        # Freeze once, for the zygote and its workers to inherit, then unfreeze here
+        # so the long-running parent still collects what it allocated before start
+        gc.collect()
+        gc.freeze()
+        self._zygote_conn, child_conn = self._ctx.Pipe()
+        self._zygote = self._ctx.Process(target=_zygote_main, args=(child_conn, self.jobs),
+                                         name="worker-pool-zygote", daemon=True)
+        self._zygote.start()
+        child_conn.close()
+        gc.unfreeze()
+        for _ in range(self.processes):
+            self._workers.append(self._spawn())
+        self._thread = threading.Thread(target=self._supervise, name="worker-pool", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, kind: str, *args) -> Future:
+        fut: Future = Future()
+
+        def sink(status, payload):
+            if status == "result":
+                fut.set_result(payload)
+            elif status != "event":
+                fut.set_exception(payload)
+
+        self._enqueue(kind, args, sink)
+        return fut
+
+    def run(self, kind: str, *args) -> Any:
+        return self.submit(kind, *args).result()
+
+    async def arun(self, kind: str, *args) -> Any:
+        return await asyncio.wrap_future(self.submit(kind, *args))
+
+    def astream(self, kind: str, *args) -> "_JobStream":
+        """Queue a job that returns an iterator; its events arrive on the returned async iterator.
+
+        The job is queued by this call, not on the first iteration, so
+        `Saturated` is raised before a server starts its response. Call
+        `aclose()` on the stream if it may not be read to the end.
+        """
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue" = asyncio.Queue()
+        job = self._enqueue(kind, args, lambda status, payload: loop.call_soon_threadsafe(
+            events.put_nowait, (status, payload)))
+        return _JobStream(self, job, events)
+
+    def close(self, timeout: float = 5.0):
+        self._closing = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        for w in self._workers:
+            if w.job is not None:
+                self._finish(w.job, "error", RuntimeError("worker pool closed"))
+            self._stop(w, timeout)
+        self._workers = []
+        while True:
+            try:
+                self._finish(self._queue.get_nowait(), "error", RuntimeError("worker pool closed"))
+            except queue.Empty:
+                break
+        if self._zygote is not None:
+            try:
+                self._zygote_conn.send(None)
+            except OSError:
+                pass
+            self._zygote.join(timeout)
+            if self._zygote.is_alive():
+                self._zygote.kill()
+                self._zygote.join()
+            self._zygote_conn.close()
+            self._zygote = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def stats(self) -> dict:
+        workers = list(self._workers)
+        return {
+            **self._stats,
+            "workers": len(workers),
+            "busy": sum(w.job is not None for w in workers),
+            "queued": self._queue.qsize(),
+            "worker_rss_bytes": sum(w.rss for w in workers),
+            "worker_private_bytes": sum(w.private for w in workers),
+        }
+
+    def _enqueue(self, kind: str, args: tuple, sink: Sink) -> _Job:
+        if kind not in self.jobs:
+            raise KeyError(f"Unknown job kind '{kind}'")
+        job = _Job(next(self._ids), kind, args, sink)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise Saturated(self.retry_after)
+        self._wake()
+        return job
+
+    def _wake(self):
+        os.write(self._wake_w, b"\0")
+
+    def _spawn(self) -> _Worker:
+        # Only the supervisor thread (or `start`, before it runs) talks to the zygote
+        parent_conn, child_conn = self._ctx.Pipe()
+        try:
+            self._zygote_conn.send("spawn")
+            reduction.send_handle(self._zygote_conn, child_conn.fileno(), self._zygote.pid)
+            pid = self._zygote_conn.recv()
+        except (EOFError, OSError):
+            parent_conn.close()
+            raise WorkerDied(f"the zygote process exited with code {self._zygote.exitcode}")
+        finally:
+            child_conn.close()
+        return _Worker(pid, parent_conn)
+
+    def _kill(self, w: _Worker):
+        try:
+            os.kill(w.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _stop(self, w: _Worker, timeout: float):
+        try:
+            w.conn.send(None)
+        except OSError:
+            pass
+        # The worker closes its end of the pipe on the way out
+        deadline = time.monotonic() + timeout
+        try:
+            while w.conn.poll(max(deadline - time.monotonic(), 0)):
+                w.conn.recv()
+        except (EOFError, OSError):
+            pass
+        else:
+            self._kill(w)
+        w.conn.close()
+
+    def _replace(self, w: _Worker, how: str):
+        """Replace `w` after stopping it: "stop" lets it exit, "kill" kills it, "gone" means it already exited."""
+        if how == "stop":
+            self._stop(w, 5.0)
+        else:
+            if how == "kill":
+                self._kill(w)
+            w.conn.close()
+        try:
+            self._workers[self._workers.index(w)] = self._spawn()
+        except WorkerDied:
+            # No zygote to fork from; the pool carries on with the workers it has
+            self._workers.remove(w)
+
+    def _deliver(self, job: _Job, status: str, payload: Any):
+        try:
+            job.sink(status, payload)
+        except Exception:
+            # e.g. the consumer's event loop is gone; nothing left to deliver to
+            pass
+
+    def _finish(self, job: _Job, status: str, payload: Any):
+        job.done = True
+        self._deliver(job, status, payload)
+
+    def _dispatch(self):
+        if not self._workers:
+            # Every worker died and none could be forked; fail jobs instead of queueing them forever
+            while True:
+                try:
+                    self._finish(self._queue.get_nowait(), "error", WorkerDied("no workers left in the pool"))
+                except queue.Empty:
+                    return
+        for w in self._workers:
+            if w.job is not None:
+                continue
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                if job.cancelled:
+                    self._stats["cancelled"] += 1
+                    job.done = True
+                    continue
+                try:
+                    w.conn.send((job.id, job.kind, job.args))
+                except OSError:
+                    # Worker already gone; give the job to its replacement on the next pass
+                    with self._queue.mutex:
+                        self._queue.queue.appendleft(job)
+                    self._stats["died"] += 1
+                    self._replace(w, "gone")
+                    return
+                w.job, w.deadline = job, time.monotonic() + self.job_timeout
+                break
+
+    def _receive(self, w: _Worker):
+        job = w.job
+        try:
+            job_id, status, payload, memory = w.conn.recv()
+        except (EOFError, OSError):
+            self._stats["died"] += 1
+            self._finish(job, "error", WorkerDied("worker exited before answering"))
+            self._replace(w, "gone")
+            return
+        if status == "event":
+            w.deadline = time.monotonic() + self.job_timeout
+            self._deliver(job, status, payload)
+            return
+        w.job = None
+        w.jobs += 1
+        w.rss, w.private = memory
+        if status == "error":
+            self._stats["failed"] += 1
+            self._finish(job, status, JobFailed(payload))
+        else:
+            self._stats["completed"] += 1
+            self._finish(job, status, payload)
+        if (self.max_jobs and w.jobs >= self.max_jobs) or \
+                (self.max_private_bytes and w.private >= self.max_private_bytes):
+            self._stats["recycled"] += 1
+            self._replace(w, "stop")
+
+    def _supervise(self):
+        while not self._closing:
+            self._dispatch()
+            # A worker that dies mid-job shows up as end-of-file on its pipe
+            busy = {w.conn: w for w in self._workers if w.job is not None}
+            deadline = min((w.deadline for w in busy.values()), default=None)
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            ready = wait([self._wake_r, *busy], timeout)
+            if self._wake_r in ready:
+                try:
+                    while os.read(self._wake_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            for conn in (r for r in ready if r in busy):
+                self._receive(busy[conn])
+            now = time.monotonic()
+            for w in list(self._workers):
+                if w.job is None:
+                    continue
+                if w.job.cancelled:
+                    self._stats["cancelled"] += 1
+                    w.job.done = True
+                    self._replace(w, "kill")
+                elif now >= w.deadline:
+                    self._stats["timeouts"] += 1
+                    self._finish(w.job, "error", JobTimeout(f"job '{w.job.kind}' took over {self.job_timeout}s"))
+                    self._replace(w, "kill")